@@ -1,7 +1,17 @@
-from flask import Flask, request, render_template
-from parse import parse_with_gemini
-from scraper import get_google_maps_results, split_scraped_data
+from flask import Flask, Response, abort, jsonify, request, render_template, stream_with_context
+from parse import parse_with_gemini, query_parser
+from scraper import format_businesses
+from archive import Archive
+from cache import ScrapeCache
+from checkpoint import JOB_ID
+from jobs import JobManager
+from pool import BrowserPool
+from blocking import traffic_stats
+from metrics import register_collector, render_prometheus
+from qa import QuestionAnswerer
+from tiling import parse_bounds
 import google.generativeai as genai
+import logging
 import os
 
 # Flask setup
@@ -10,28 +20,105 @@ app = Flask(__name__)
 # Configure Gemini API
 genai.configure(api_key=os.getenv("GEMINI_KEY"))
 
+# Detail-scraping pool: number of browser contexts and max place pages opened per second
+SCRAPER_WORKERS = int(os.getenv("SCRAPER_WORKERS", "1"))
+SCRAPER_MAX_RATE = float(os.getenv("SCRAPER_MAX_RATE", "0")) or None
+
+# Persistent scrape cache; set SCRAPE_CACHE_PATH to an empty string to disable it
+SCRAPE_CACHE_PATH = os.getenv("SCRAPE_CACHE_PATH", "scrape_cache.sqlite3")
+scrape_cache = ScrapeCache(
+    SCRAPE_CACHE_PATH,
+    query_ttl=int(os.getenv("SCRAPE_CACHE_QUERY_TTL", str(6 * 3600))),
+    place_ttl=int(os.getenv("SCRAPE_CACHE_PLACE_TTL", str(7 * 24 * 3600))),
+    site_ttl=int(os.getenv("SCRAPE_CACHE_SITE_TTL", str(30 * 24 * 3600))),
+    site_failure_ttl=int(os.getenv("SCRAPE_CACHE_SITE_FAILURE_TTL", str(24 * 3600))),
+) if SCRAPE_CACHE_PATH else None
+
+# Optional archive of the raw pages scrapes read, for re-extraction without
+# crawling again; set SCRAPER_ARCHIVE_DIR to enable it
+SCRAPER_ARCHIVE_DIR = os.getenv("SCRAPER_ARCHIVE_DIR", "")
+scrape_archive = Archive(SCRAPER_ARCHIVE_DIR, writer="app") if SCRAPER_ARCHIVE_DIR else None
+
+# Headless Chromium shared by all requests, started on the first scrape;
+# one context per detail worker plus one for the search page
+browser_pool = BrowserPool(
+    size=SCRAPER_WORKERS + 1,
+    max_uses=int(os.getenv("BROWSER_POOL_MAX_USES", "50")),
+    storage_state_path=os.getenv("BROWSER_STORAGE_STATE", "maps_storage_state.json"),
+    block_resources=os.getenv("BLOCK_RESOURCES", "1") != "0",
+)
+
+# Q&A over scraped results: at most QA_CONCURRENCY model calls at a time
+question_answerer = QuestionAnswerer(
+    concurrency=int(os.getenv("QA_CONCURRENCY", "4")),
+    max_prompt_tokens=int(os.getenv("QA_MAX_PROMPT_TOKENS", "6000")),
+)
+
+# Scrapes run as background jobs on the browser pool's event loop. Jobs log
+# their progress to SCRAPER_CHECKPOINT_DIR (empty to disable) so a job that
+# died can be resumed, and reuse cached places scraped within SCRAPER_FRESHNESS seconds.
+job_manager = JobManager(
+    browser_pool,
+    scrape_cache,
+    SCRAPER_WORKERS,
+    SCRAPER_MAX_RATE,
+    max_concurrent_jobs=int(os.getenv("SCRAPER_MAX_JOBS", "2")),
+    checkpoint_dir=os.getenv("SCRAPER_CHECKPOINT_DIR", "checkpoints") or None,
+    freshness=int(os.getenv("SCRAPER_FRESHNESS", "0")) or None,
+    archive=scrape_archive,
+)
+
+
+def collect_state():
+    """
+    Samples for /metrics from counters kept outside the metrics registry.
+    """
+    samples = [
+        ("scraper_query_parser_total", "counter", "Parsed queries by the layer that resolved them",
+         {(("resolved_by", layer),): count for layer, count in query_parser.resolved_by.items()}),
+    ]
+    if scrape_cache is not None:
+        samples.append(("scraper_cache_events_total", "counter", "Scrape cache lookups and evictions",
+                        {(("event", event), ("table", table)): count
+                         for table, stats in scrape_cache.stats.items() for event, count in stats.items()}))
+    samples.append(("scraper_qa_events_total", "counter", "Q&A questions, index builds and prompt tokens",
+                    {(("event", event),): count for event, count in question_answerer.stats.items()}))
+    budgets = (job_manager.throttle.maps, job_manager.throttle.websites)
+    samples.append(("scraper_throttle_concurrency", "gauge", "Concurrency the throttle allows, by budget",
+                    {(("budget", budget.name),): budget.limit for budget in budgets}))
+    samples.append(("scraper_throttle_interval_seconds", "gauge", "Spacing of request starts, by budget",
+                    {(("budget", budget.name),): budget.interval for budget in budgets}))
+    traffic = traffic_stats.summary()
+    for key, description in (("pages", "Pages opened"), ("requests", "Requests finished"),
+                             ("bytes", "Bytes transferred"), ("blocked", "Requests blocked"),
+                             ("estimated_bytes_saved", "Estimated bytes saved by blocking")):
+        samples.append((f"scraper_traffic_{key}_total", "counter", f"{description}, by block profile",
+                        {(("profile", profile),): summary[key] for profile, summary in traffic.items()}))
+    return samples
+
+
+register_collector(collect_state)
+
+
 @app.route("/", methods=["GET", "POST"])
 def index():
     extracted_data = ""
     search_results = ""
     ai_response = ""
+    job_id = request.values.get("job_id", "")
     
     if request.method == "POST":
         # Check if the user is asking a question
         if "ask_question" in request.form:
             question = request.form.get("question").strip()
+            job = job_manager.get(job_id)
+            if job and job.results:
+                search_results = format_businesses(job.results)
             if question and search_results:
                 try:
-                    # Process the scraped data and generate an AI response
-                    data_chunks = split_scraped_data(search_results)
-                    ai_response = []
-                    
-                    for chunk in data_chunks:
-                        prompt = f"The following is some business data:\n{chunk}\n\nAnswer the following question: {question}"
-                        response = genai.generate_content(prompt=prompt)
-                        ai_response.append(response.candidates[0].content.strip())
-                    
-                    ai_response = "\n\n".join(ai_response)
+                    # Send only the records relevant to the question in one prompt
+                    ai_response = question_answerer.answer(question, job.results, key=(job.id, len(job.results)))
+                    logging.debug(f"Q&A report: {question_answerer.report()}")
                 except Exception as e:
                     ai_response = f"Error generating AI response: {e}"
             else:
@@ -50,13 +137,75 @@ def index():
                         "quantity": quantity
                     }
                     
-                    search_results = get_google_maps_results(search_term, quantity)
+                    job_id = job_manager.submit(search_term, quantity).id
                 except Exception as e:
                     extracted_data = f"Error processing the query: {e}"
             else:
                 extracted_data = "Please enter a valid query."
     
-    return render_template("index.html", extracted_data=extracted_data, search_results=search_results, ai_response=ai_response)
+    return render_template("index.html", extracted_data=extracted_data, search_results=search_results, ai_response=ai_response, job_id=job_id)
+
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    """
+    Starts a scrape job and returns its ID at once. Accepts either a
+    search_term (and optional quantity) or a free-form query to parse, and
+    optional bounds ("south,west,north,east") to tile a large area. Passing
+    the job_id of an unfinished job resumes it.
+    """
+    data = request.get_json(silent=True) or request.form
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object."}), 400
+    for name in ("search_term", "query", "bounds", "job_id"):
+        if data.get(name) is not None and not isinstance(data[name], str):
+            return jsonify({"error": f"Invalid {name}: expected a string"}), 400
+
+    search_term = (data.get("search_term") or "").strip()
+    try:
+        quantity = int(data["quantity"]) if data.get("quantity") not in (None, "") else 999
+    except (TypeError, ValueError):
+        return jsonify({"error": f"Invalid quantity: {data['quantity']}"}), 400
+    if not search_term and data.get("query"):
+        parsed = parse_with_gemini(data["query"].strip(), "Extract the main search term and quantity for finding places.")
+        if isinstance(parsed, str):
+            return jsonify({"error": parsed}), 502
+        search_term, quantity = parsed
+    if not search_term:
+        return jsonify({"error": "Please enter a valid query."}), 400
+    if quantity < 1:
+        return jsonify({"error": f"Invalid quantity: {quantity}"}), 400
+    try:
+        bounds = parse_bounds(data["bounds"]) if data.get("bounds") else None
+    except ValueError:
+        return jsonify({"error": f"Invalid bounds: {data['bounds']}"}), 400
+
+    job_id = data.get("job_id") or None
+    if job_id is not None and not JOB_ID.match(job_id):
+        return jsonify({"error": f"Invalid job ID: {job_id}"}), 400
+
+    job = job_manager.submit(search_term, quantity, bounds, job_id)
+    return jsonify(job.to_dict()), 202
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = job_manager.get(job_id) or abort(404)
+    return jsonify(job.to_dict(include_results=job.finished))
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    job = job_manager.get(job_id) or abort(404)
+    return Response(
+        stream_with_context(job.events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route("/metrics")
+def metrics():
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
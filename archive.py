@@ -0,0 +1,362 @@
+"""
+Content-addressed archive of the raw pages a scrape read, so improved
+extractors can be run over old scrapes without crawling again.
+
+Every snapshot (a Maps place panel, a Maps response body or a business
+website) is hashed with SHA-256; a body the archive already holds is only
+indexed again, not stored. New bodies are compressed as one zstd frame each
+and appended to pack files of up to `pack_size` bytes. Each writer appends to
+its own packs and its own JSON lines index, so processes of a batch can share
+an archive directory as long as their writer names differ. Readers map the
+packs into memory and decompress single frames out of them.
+
+    python archive.py stats archive/
+    python archive.py reextract archive/ -o dataset.jsonl --processes 8
+"""
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+import time
+
+from enrich import apply_contacts, site_key
+from extract import PageContacts, extract_contacts, parse_place_panel
+from maps_json import parse_places
+
+
+WRITER = re.compile(r"^[\w-]+$")
+
+# The archive each re-extraction worker process reads, opened once per process
+_worker = {}
+
+
+class Archive:
+    """
+    Append-only snapshot store in `directory`. Requires zstandard.
+
+    The index of a writer is a JSON lines file of entries:
+
+        blob      a body stored at an offset of one of its packs
+        snapshot  a body read for a key: a place ID (panel), a response
+                  URL (payload) or an enrich.site_key (site)
+        place     a place a scrape went through, in the order it did
+
+    Entries are fsynced, after the packs they point into, every
+    `fsync_every` entries or `fsync_interval` seconds, like the checkpoints.
+    Packs and indexes of a writer are only created on its first snapshot,
+    so opening an archive to read it does not write anything.
+    """
+
+    def __init__(self, directory, writer="main", pack_size=256 * 1024 * 1024, level=10, fsync_every=50,
+                 fsync_interval=2.0):
+        import zstandard
+
+        if not WRITER.match(writer):
+            raise ValueError(f"Invalid archive writer name: {writer}")
+        self.directory = directory
+        self.writer = writer
+        self.pack_size = pack_size
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.stats = Counter()
+        self.blobs = {}
+        self.snapshots = []
+        self.places = {}
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._maps = {}
+        self._lock = threading.Lock()
+        self._pack = None
+        self._index = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _load(self):
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.index.jsonl"))):
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last entry of a crashed writer may be cut off
+                        continue
+                    self._apply(entry)
+
+    def _apply(self, entry):
+        kind = entry["type"]
+        if kind == "blob":
+            self.blobs.setdefault(entry["digest"], entry)
+        elif kind == "snapshot":
+            self.snapshots.append(entry)
+        elif kind == "place":
+            self.places[entry["id"]] = entry["url"]
+
+    def _append(self, entry):
+        self._apply(entry)
+        self._index.write(json.dumps(entry) + "\n")
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.flush()
+
+    def _open_writer(self):
+        if self._index is None:
+            self._index = open(os.path.join(self.directory, f"{self.writer}.index.jsonl"), "a", encoding="utf-8")
+        if self._pack is None or self._pack.tell() >= self.pack_size:
+            if self._pack is not None:
+                self.flush()
+                self._pack.close()
+            packs = sorted(glob.glob(os.path.join(self.directory, f"{self.writer}.?????.pack")))
+            number = len(packs) - 1 if packs and os.path.getsize(packs[-1]) < self.pack_size else len(packs)
+            self._pack = open(os.path.join(self.directory, f"{self.writer}.{number:05d}.pack"), "ab")
+
+    def add(self, kind, key, url, content):
+        """
+        Archives the body `content` (str or bytes) read for `key` from `url`.
+        Returns its digest.
+        """
+        body = content.encode("utf-8") if isinstance(content, str) else content
+        digest = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            self._open_writer()
+            self.stats[f"{kind}_snapshots"] += 1
+            self.stats["bytes"] += len(body)
+            if digest in self.blobs:
+                self.stats["duplicates"] += 1
+            else:
+                frame = self._compressor.compress(body)
+                offset = self._pack.tell()
+                self._pack.write(frame)
+                self.stats["stored_bytes"] += len(frame)
+                self._append({"type": "blob", "digest": digest, "pack": os.path.basename(self._pack.name),
+                              "offset": offset, "length": len(frame), "size": len(body)})
+            self._append({"type": "snapshot", "kind": kind, "key": key, "url": url, "digest": digest,
+                          "time": time.time()})
+        return digest
+
+    def add_place(self, place_id, url):
+        with self._lock:
+            self._open_writer()
+            self._append({"type": "place", "id": place_id, "url": url})
+
+    def latest(self, kind):
+        """
+        Maps each key of `kind` to the digest of its last snapshot.
+        """
+        return {entry["key"]: entry["digest"] for entry in self.snapshots if entry["kind"] == kind}
+
+    def read(self, digest):
+        """
+        Returns the body stored under `digest` as bytes, or None when the
+        archive does not hold it (or its pack was cut short by a crash).
+        """
+        blob = self.blobs.get(digest)
+        if blob is None:
+            return None
+        end = blob["offset"] + blob["length"]
+        data = self._maps.get(blob["pack"])
+        if data is None or end > len(data):
+            # Not mapped yet, or a pack that grew since it was mapped
+            data = self._map(blob["pack"])
+        if data is None or end > len(data):
+            return None
+        return self._decompressor.decompress(data[blob["offset"]:end])
+
+    def read_text(self, digest):
+        body = self.read(digest)
+        return body.decode("utf-8", errors="replace") if body is not None else None
+
+    def _map(self, pack):
+        if self._pack is not None:
+            self._pack.flush()
+        path = os.path.join(self.directory, pack)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        with open(path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        old = self._maps.pop(pack, None)
+        if old is not None:
+            old.close()
+        self._maps[pack] = data
+        return data
+
+    def report(self):
+        sizes = [blob["size"] for blob in self.blobs.values()]
+        lengths = [blob["length"] for blob in self.blobs.values()]
+        return {
+            "places": len(self.places),
+            "snapshots": dict(Counter(entry["kind"] for entry in self.snapshots)),
+            "blobs": len(self.blobs),
+            "bytes": sum(sizes),
+            "stored_bytes": sum(lengths),
+            "ratio": round(sum(sizes) / sum(lengths), 2) if lengths else None,
+            "session": dict(self.stats),
+        }
+
+    def flush(self):
+        if self._index is None or self._index.closed:
+            return
+        # Packs first, so a synced index entry never points past synced data
+        if self._pack is not None:
+            self._pack.flush()
+            os.fsync(self._pack.fileno())
+        self._index.flush()
+        os.fsync(self._index.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            if self._index is not None:
+                self._index.close()
+                self._index = None
+            if self._pack is not None:
+                self._pack.close()
+                self._pack = None
+            for data in self._maps.values():
+                data.close()
+            self._maps.clear()
+        if self.stats:
+            logging.info(f"Archive {self.directory} ({self.writer}): {dict(self.stats)}")
+
+
+def open_worker(directory):
+    archive = Archive(directory)
+    _worker.update(archive=archive, panels=archive.latest("panel"), sites=archive.latest("site"))
+
+
+def decode_payloads(digests):
+    """
+    Worker: the places of the archived Maps response bodies `digests`.
+    """
+    archive = _worker["archive"]
+    return [place for digest in digests for place in parse_places(archive.read_text(digest) or "")]
+
+
+def reextract_places(places, decoded):
+    """
+    Worker: rebuilds the business records of `places` ((place ID, URL) pairs)
+    from their archived panels, the places `decoded` from archived payloads
+    and the archived websites, with the current extractors.
+    """
+    from scraper import Business
+
+    archive, panels, sites = _worker["archive"], _worker["panels"], _worker["sites"]
+    records = []
+    for place_id, url in places:
+        fields = parse_place_panel(archive.read_text(panels[place_id])) if place_id in panels else None
+        place = decoded.get(place_id)
+        if fields is None and place is None:
+            continue
+        if fields is None:
+            fields = {"name": place.name, "address": place.address or "", "website": place.website or "",
+                      "phone_number": place.phone_number or "", "website_url": place.website_url}
+        elif place is not None:
+            # Fields the payload decoded win, as they do when scraping
+            fields["name"] = place.name or fields["name"]
+            for name in ("address", "website", "phone_number", "website_url"):
+                if name not in place.undecoded and getattr(place, name):
+                    fields[name] = getattr(place, name)
+
+        website_url = fields.pop("website_url")
+        business = Business(**fields, place_url=url)
+        if website_url:
+            digest = sites.get(site_key(website_url))
+            html = archive.read_text(digest) if digest is not None else None
+            apply_contacts(business, extract_contacts(html) if html else PageContacts())
+        else:
+            business.website = None
+        records.append(asdict(business))
+    return records
+
+
+def chunked(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def reextract(directory, output, processes=None, chunk_size=200):
+    """
+    Rebuilds the dataset of every place in the archive into `output` (.jsonl,
+    .csv or .parquet) without network access, spreading the places over
+    `processes` worker processes. Returns the number of businesses written.
+    """
+    from scraper import business_from_record
+    from sinks import open_sink
+
+    archive = Archive(directory)
+    places = list(archive.places.items())
+    payloads = list(dict.fromkeys(archive.latest("payload").values()))
+    archive.close()
+    processes = processes or os.cpu_count() or 1
+    started = time.perf_counter()
+
+    # Spawned, like the batch shards, so workers do not inherit open maps
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(processes, mp_context=context, initializer=open_worker,
+                             initargs=(directory,)) as executor:
+        decoded = {}
+        jobs = [executor.submit(decode_payloads, chunk) for chunk in chunked(payloads, 20)]
+        for job in jobs:
+            for place in job.result():
+                decoded[place.data_id] = place
+                if place.place_id:
+                    decoded[place.place_id] = place
+
+        jobs = [
+            executor.submit(reextract_places, chunk,
+                            {place_id: decoded[place_id] for place_id, _ in chunk if place_id in decoded})
+            for chunk in chunked(places, chunk_size)
+        ]
+        with open_sink(output, append=False) as sink:
+            for job in jobs:
+                for record in job.result():
+                    sink.write(business_from_record(record))
+            written = sink.count
+
+    seconds = time.perf_counter() - started
+    logging.info(
+        f"Re-extracted {written} of {len(places)} places from {directory} into {output} "
+        f"in {seconds:.1f}s with {processes} processes"
+    )
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect a snapshot archive or re-extract a dataset from it.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    stats = commands.add_parser("stats", help="print what the archive holds")
+    stats.add_argument("archive")
+    rebuild = commands.add_parser("reextract", help="rebuild the dataset with the current extractors")
+    rebuild.add_argument("archive")
+    rebuild.add_argument("-o", "--output", required=True, help="dataset to write (.jsonl, .csv or .parquet)")
+    rebuild.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    rebuild.add_argument("--chunk-size", type=int, default=200, help="places per worker task")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.command == "stats":
+        with Archive(args.archive) as archive:
+            print(json.dumps(archive.report(), indent=2))
+    else:
+        reextract(args.archive, args.output, args.processes, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Runs a file of queries as one batch, sharded across worker processes.
+
+Each line of the queries file is a search term, optionally followed by a tab
+or comma and a quantity; blank lines and lines starting with # are skipped.
+Every process runs its own event loop and browser pool and takes the next
+query from a shared queue as soon as it finishes one, writing businesses to
+its own part file. The parts are merged into one de-duplicated output at the
+end (.jsonl, .csv or .parquet).
+
+With --checkpoints, each query logs its progress under a job ID derived from
+the query, so running a batch that died again only does the missing work.
+With --archive, the pages the shards read are archived (each shard writes
+its own packs) and `python archive.py reextract` can rebuild the output.
+
+    python batch.py queries.txt -o results.csv --processes 4 --workers 2
+"""
+from dataclasses import asdict, dataclass, field
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import time
+
+from archive import Archive
+from cache import ScrapeCache, normalize_query
+from checkpoint import Checkpoint
+from pool import BrowserPool
+from scraper import business_from_record, main as scrape_query, place_id_from_url
+from sinks import JsonlSink, open_sink
+from throttle import Throttle
+
+
+QUANTITY_SUFFIX = re.compile(r"^(.*?)\s*[\t,]\s*(\d+)\s*$")
+
+
+@dataclass
+class ShardStats:
+    shard: int
+    queries: int = 0
+    failed: int = 0
+    empty: int = 0
+    businesses: int = 0
+    seconds: float = 0.0
+    errors: list = field(default_factory=list)
+
+    @property
+    def rate(self):
+        return self.businesses / self.seconds if self.seconds else 0.0
+
+
+def read_queries(path, default_quantity):
+    """
+    Returns the (search term, quantity) pairs of a queries file, in order and
+    without repeated lines.
+    """
+    queries = []
+    seen = set()
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            match = QUANTITY_SUFFIX.match(line)
+            search_term, quantity = (match.group(1), int(match.group(2))) if match else (line, default_quantity)
+            if (search_term, quantity) not in seen:
+                seen.add((search_term, quantity))
+                queries.append((search_term, quantity))
+    return queries
+
+
+def query_job_id(search_term, quantity):
+    """
+    A stable job ID for a query, the same on every run of the batch.
+    """
+    return hashlib.sha1(f"{normalize_query(search_term)}|{quantity}".encode()).hexdigest()[:16]
+
+
+def business_key(record):
+    """
+    Identifies a business across queries: its place ID when the place URL has
+    one, otherwise its name and address.
+    """
+    if record.get("place_url"):
+        return place_id_from_url(record["place_url"])
+    return (record.get("name", "").strip().lower(), record.get("address", "").strip().lower())
+
+
+def run_shard(shard, queries, events, parts_dir, options):
+    """
+    Process entry point: scrapes queries from `queries` until it yields None
+    and reports each finished query on `events`.
+    """
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s - shard {shard} - %(levelname)s - %(message)s",
+                        force=True)
+    try:
+        asyncio.run(scrape_shard(shard, queries, events, parts_dir, options))
+    except Exception as e:
+        logging.error(f"Shard {shard} stopped: {e}")
+        events.put({"shard": shard, "fatal": str(e)})
+    events.put({"shard": shard, "done": True})
+
+
+async def scrape_shard(shard, queries, events, parts_dir, options):
+    cache = ScrapeCache(options["cache"]) if options["cache"] else None
+    archive = Archive(options["archive"], writer=f"shard-{shard}") if options["archive"] else None
+    # One throttle for every query of the shard, so it keeps what it learned
+    throttle = Throttle(maps_concurrency=options["workers"], max_rate=options["max_rate"])
+    loop = asyncio.get_running_loop()
+    # A search page on top of the detail workers, as main() sizes its own pool
+    pool = BrowserPool(size=options["workers"] + 1, headless=options["headless"],
+                       storage_state_path=options["storage_state"])
+    try:
+        async with pool:
+            with JsonlSink(os.path.join(parts_dir, f"shard-{shard}.jsonl")) as sink:
+                while True:
+                    item = await loop.run_in_executor(None, queries.get)
+                    if item is None:
+                        return
+                    search_term, quantity = item
+                    before = sink.count
+                    started = time.perf_counter()
+                    error = ""
+                    checkpoint = (
+                        Checkpoint(query_job_id(search_term, quantity), options["checkpoints"])
+                        if options["checkpoints"] else None
+                    )
+                    try:
+                        business_list = await scrape_query(
+                            search_term, quantity, options["workers"], options["max_rate"], cache, pool,
+                            on_business=sink.write, keep_results=False, checkpoint=checkpoint,
+                            freshness=options["freshness"], throttle=throttle, archive=archive,
+                        )
+                        error = business_list.error
+                        if error:
+                            logging.error(f"Query {search_term!r} failed: {error}")
+                    except Exception as e:
+                        error = str(e)
+                        logging.error(f"Query {search_term!r} failed: {e}")
+                    finally:
+                        if checkpoint is not None:
+                            checkpoint.close()
+                    sink.flush()
+                    events.put({
+                        "shard": shard,
+                        "search_term": search_term,
+                        "quantity": quantity,
+                        "businesses": sink.count - before,
+                        "seconds": time.perf_counter() - started,
+                        "error": error,
+                    })
+    finally:
+        if cache is not None:
+            cache.close()
+        if archive is not None:
+            archive.close()
+
+
+def merge_parts(parts_dir, output):
+    """
+    Writes the businesses of every part file to `output`, keeping the first
+    record of each business. Returns the number of records read and written.
+    """
+    seen = set()
+    read = 0
+    # Replace the output of an earlier run of the batch rather than add to it
+    with open_sink(output, append=False) as sink:
+        for name in sorted(os.listdir(parts_dir)):
+            with open(os.path.join(parts_dir, name), encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A shard that crashed mid-write leaves a partial last line
+                        continue
+                    read += 1
+                    key = business_key(record)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    sink.write(business_from_record(record))
+        return read, sink.count
+
+
+def run_batch(queries, output, processes=2, workers=1, max_rate=None, cache=None, headless=True,
+              storage_state="maps_storage_state.json", checkpoints=None, freshness=None, archive=None):
+    """
+    Scrapes `queries` across `processes` worker processes and merges their
+    results into `output`. Returns a summary with per-shard rates and failures.
+    """
+    parts_dir = f"{output}.parts"
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    os.makedirs(parts_dir)
+    options = {"workers": workers, "max_rate": max_rate, "cache": cache, "headless": headless,
+               "storage_state": storage_state, "checkpoints": checkpoints, "freshness": freshness, "archive": archive}
+
+    # Playwright runs threads of its own, which do not survive a fork
+    context = multiprocessing.get_context("spawn")
+    work = context.Queue()
+    events = context.Queue()
+    for item in queries:
+        work.put(item)
+    processes = max(1, min(processes, len(queries)))
+    for _ in range(processes):
+        work.put(None)
+
+    stats = {shard: ShardStats(shard) for shard in range(processes)}
+    started = time.perf_counter()
+    shards = [
+        context.Process(target=run_shard, args=(shard, work, events, parts_dir, options), name=f"shard-{shard}")
+        for shard in range(processes)
+    ]
+    for process in shards:
+        process.start()
+
+    running = set(stats)
+    finished = 0
+    while running:
+        try:
+            event = events.get(timeout=5)
+        except queue.Empty:
+            for shard in list(running):
+                if not shards[shard].is_alive():
+                    logging.error(f"Shard {shard} exited with code {shards[shard].exitcode}")
+                    stats[shard].errors.append(f"exited with code {shards[shard].exitcode}")
+                    running.discard(shard)
+            continue
+        shard_stats = stats[event["shard"]]
+        if event.get("done"):
+            running.discard(event["shard"])
+        elif event.get("fatal"):
+            shard_stats.errors.append(event["fatal"])
+        else:
+            finished += 1
+            shard_stats.queries += 1
+            shard_stats.businesses += event["businesses"]
+            shard_stats.seconds += event["seconds"]
+            if event["error"]:
+                shard_stats.failed += 1
+                shard_stats.errors.append(f"{event['search_term']}: {event['error']}")
+            elif not event["businesses"]:
+                shard_stats.empty += 1
+            logging.info(
+                f"[{finished}/{len(queries)}] shard {event['shard']}: {event['search_term']!r} "
+                f"{event['businesses']} businesses in {event['seconds']:.1f}s"
+            )
+    for process in shards:
+        process.join()
+
+    read, written = merge_parts(parts_dir, output)
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    seconds = time.perf_counter() - started
+    return {
+        "queries": len(queries),
+        "finished": finished,
+        "failed": sum(shard.failed for shard in stats.values()),
+        "businesses": read,
+        "unique": written,
+        "duplicates": read - written,
+        "seconds": seconds,
+        "businesses_per_second": read / seconds if seconds else 0.0,
+        "shards": [{**asdict(shard), "rate": shard.rate} for shard in stats.values()],
+    }
+
+
+def log_summary(summary):
+    logging.info(
+        f"Batch: {summary['finished']}/{summary['queries']} queries, {summary['failed']} failed, "
+        f"{summary['businesses']} businesses ({summary['unique']} unique, {summary['duplicates']} duplicates) "
+        f"in {summary['seconds']:.1f}s, {summary['businesses_per_second']:.2f} businesses/s"
+    )
+    for shard in summary["shards"]:
+        logging.info(
+            f"  shard {shard['shard']}: {shard['queries']} queries, {shard['failed']} failed, "
+            f"{shard['empty']} empty, {shard['businesses']} businesses, {shard['rate']:.2f}/s"
+        )
+        for error in shard["errors"]:
+            logging.info(f"    {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape a file of queries across worker processes.")
+    parser.add_argument("queries", help="file with one search term per line, optionally followed by a quantity")
+    parser.add_argument("-o", "--output", required=True, help="merged output (.jsonl, .csv or .parquet)")
+    parser.add_argument("--quantity", type=int, default=100, help="quantity for lines without one")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--workers", type=int, default=1, help="detail workers per process")
+    parser.add_argument("--max-rate", type=float, default=None, help="place pages per second, per process")
+    parser.add_argument("--cache", default=None, help="SQLite scrape cache shared by the processes")
+    parser.add_argument("--checkpoints", default=None, help="directory of per-query progress logs, to resume a batch")
+    parser.add_argument("--freshness", type=int, default=None,
+                        help="seconds within which a cached place counts as scraped")
+    parser.add_argument("--archive", default=None, help="directory to archive the pages read, for re-extraction")
+    parser.add_argument("--headed", action="store_true", help="show the browsers")
+    parser.add_argument("--summary", default=None, help="also write the summary as JSON to this path")
+    args = parser.parse_args()
+
+    queries = read_queries(args.queries, args.quantity)
+    if not queries:
+        parser.error(f"No queries in {args.queries}")
+    summary = run_batch(queries, args.output, args.processes, args.workers, args.max_rate, args.cache,
+                        headless=not args.headed, checkpoints=args.checkpoints, freshness=args.freshness,
+                        archive=args.archive)
+    log_summary(summary)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Snapshot archive benchmark: archive size, write speed and parallel re-extraction.
+
+Crawls --places places of a bench/fakemaps.py server the way a scrape reads
+them (half from Maps payloads, half from opened place panels, plus every
+business website) into an archive.Archive, archives the same crawl a second
+time to show de-duplication, then rebuilds the dataset from the archive
+alone with archive.reextract for each --processes value and checks it
+against what the server serves.
+
+    python bench/bench_archive.py --places 5000 --processes 1 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakemaps import FakeMaps
+from archive import Archive, reextract
+from enrich import site_key
+from scraper import place_id_from_url
+
+
+async def crawl(server, base_url, places, concurrency=32):
+    """
+    Returns the pages a scrape of the server reads: (kind, key, url, body)
+    snapshots and the (place ID, URL) of every place.
+    """
+    snapshots = []
+    place_urls = [f"{base_url}/maps/place/Business+{i}/data=!4m2!3m1!1s0x1:0x{i:x}" for i in range(places)]
+    for start in range(0, places, server.batch):
+        url = f"{base_url}/search?tbm=map&q=bench&start={start}&num={server.batch}"
+        snapshots.append(("payload", url, url, server.search_payload("bench", start, server.batch)))
+    for i in range(1, places, 2):
+        snapshots.append(("panel", place_id_from_url(place_urls[i]), place_urls[i], server.panel(i)))
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def site(i, session):
+        url = server.business(i)["website"]
+        if url is None:
+            return None
+        async with semaphore:
+            async with session.get(url) as response:
+                return "site", site_key(url), url, await response.text()
+
+    async with aiohttp.ClientSession() as session:
+        sites = await asyncio.gather(*(site(i, session) for i in range(places)))
+    snapshots.extend(snapshot for snapshot in sites if snapshot is not None)
+    return snapshots, [(place_id_from_url(url), url) for url in place_urls]
+
+
+def archive_crawl(directory, snapshots, places):
+    started = time.perf_counter()
+    with Archive(directory, writer="bench") as archive:
+        for place_id, url in places:
+            archive.add_place(place_id, url)
+        for kind, key, url, body in snapshots:
+            archive.add(kind, key, url, body)
+        session = dict(archive.stats)
+    return session, time.perf_counter() - started
+
+
+def check(server, output):
+    """
+    Counts the re-extracted records that do not match the server's places.
+    """
+    wrong = 0
+    with open(output, encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            i = int(place_id_from_url(record["place_url"]).split(":0x")[1], 16)
+            business = server.business(i)
+            # JavaScript-rendered sites only have contacts once a browser renders them
+            expected_email = [] if business["website"] is None or i % 10 == 5 else [f"info@business{i}.example"]
+            if (record["name"] != business["name"] or record["address"] != business["address"]
+                    or record["phone_number"] != business["phone"]
+                    or (expected_email and expected_email[0] not in record["email"])):
+                wrong += 1
+    return wrong
+
+
+async def start_and_crawl(args):
+    server = FakeMaps(places=args.places, site_latency=args.site_latency)
+    base_url = await server.start()
+    try:
+        started = time.perf_counter()
+        snapshots, places = await crawl(server, base_url, args.places)
+        return server, snapshots, places, time.perf_counter() - started
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the snapshot archive and parallel re-extraction.")
+    parser.add_argument("--places", type=int, default=5000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--site-latency", type=int, default=50)
+    args = parser.parse_args()
+
+    server, snapshots, places, crawl_seconds = asyncio.run(start_and_crawl(args))
+    print(f"{args.places} places, {len(snapshots)} pages crawled in {crawl_seconds:.1f}s")
+    with tempfile.TemporaryDirectory() as directory:
+        archive_dir = os.path.join(directory, "archive")
+        for run in ("first crawl", "same again"):
+            session, seconds = archive_crawl(archive_dir, snapshots, places)
+            stored = session.get("stored_bytes", 0)
+            ratio = f"{session['bytes'] / stored:4.1f}x smaller" if stored else "nothing new"
+            print(f"  {run:<11} {session['bytes'] / 1e6:7.1f} MB read, {stored / 1e6:6.2f} MB stored "
+                  f"({ratio}), {session.get('duplicates', 0):5d} duplicates, "
+                  f"{session['bytes'] / 1e6 / seconds:6.1f} MB/s")
+
+        for processes in args.processes:
+            output = os.path.join(directory, f"dataset-{processes}.jsonl")
+            started = time.perf_counter()
+            written = reextract(archive_dir, output, processes)
+            seconds = time.perf_counter() - started
+            print(f"  re-extract {processes:2d} processes: {written} businesses in {seconds:5.1f}s "
+                  f"({written / seconds:7.0f}/s), {check(server, output)} wrong")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Website enrichment de-duplication on a synthetic city-wide run.
+
+Builds the website column of a city-wide scrape: chains and franchises whose
+branches link the same site with and without www and with tracking parameters,
+independent businesses with a site of their own, and dead sites that refuse
+connections. The sites are served by bench/fakemaps.py under made-up
+*.example domains resolved to it. The mix is enriched three ways:
+
+    per business   one fetch per business, as before de-duplication
+    cold           enrich.WebsiteEnricher with an empty scrape cache
+    warm           the same again with the cache the cold run filled
+
+and the report shows how many fetches each source avoided.
+
+    python bench/bench_enrich_dedup.py --businesses 2000 --chains 25 --chain-share 0.3
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakemaps import FakeMaps
+from cache import ScrapeCache
+from enrich import WebsiteEnricher
+from extract import PageContacts
+from throttle import Call
+
+
+class LocalResolver(AbstractResolver):
+    """
+    Resolves every host to 127.0.0.1, where the fake sites are served.
+    """
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        return [{"hostname": host, "host": "127.0.0.1", "port": port, "family": socket.AF_INET, "proto": 0,
+                 "flags": socket.AI_NUMERICHOST}]
+
+    async def close(self):
+        pass
+
+
+class LocalEnricher(WebsiteEnricher):
+    async def open(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             resolver=LocalResolver())
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def city_websites(count, chains, chain_share, dead_share, port, dead_port, seed=0):
+    """
+    Website URLs of `count` businesses, in discovery order.
+    """
+    rng = random.Random(seed)
+    # Chain sizes follow a long tail: a few big franchises, many small groups
+    weights = [1 / (rank + 1) for rank in range(chains)]
+    urls = []
+    for i in range(count):
+        draw = rng.random()
+        if draw < chain_share:
+            chain = rng.choices(range(chains), weights)[0]
+            host = rng.choice([f"chain{chain}.example", f"www.chain{chain}.example"])
+            query = rng.choice(["", f"?utm_source=gmb&branch={i}", f"?y_source=1_{i}"])
+            urls.append(f"http://{host}:{port}/site/{chain}/{query}")
+        elif draw < chain_share + dead_share:
+            urls.append(f"http://www.gone{i}.example:{dead_port}/")
+        else:
+            urls.append(f"http://www.business{i}.example:{port}/site/{i}/")
+    return urls
+
+
+async def enrich_all(enricher, urls, workers):
+    """
+    Enriches `urls` with `workers` at a time, like the detail workers of a
+    scrape, and returns the seconds it took.
+    """
+    semaphore = asyncio.Semaphore(workers)
+
+    async def enrich(url):
+        async with semaphore:
+            return await enricher.site_contacts(url)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(enrich(url) for url in urls))
+    return time.perf_counter() - started
+
+
+async def fetch_all(enricher, urls, workers):
+    """
+    One fetch per business, without sharing or caching.
+    """
+    semaphore = asyncio.Semaphore(workers)
+
+    async def fetch(url):
+        async with semaphore:
+            contacts, _ = await enricher._fetch_contacts(url, None, Call())
+            return contacts or PageContacts()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(fetch(url) for url in urls))
+    return time.perf_counter() - started
+
+
+async def run(args, cache_path):
+    server = FakeMaps(places=args.businesses, site_latency=args.site_latency)
+    base_url = await server.start()
+    port = int(base_url.rsplit(":", 1)[1])
+    urls = city_websites(args.businesses, args.chains, args.chain_share, args.dead_share, port, closed_port())
+    print(f"{len(urls)} businesses, {args.chains} chains ({args.chain_share:.0%} of businesses), "
+          f"{args.dead_share:.0%} dead sites, {args.workers} workers")
+    try:
+        async with LocalEnricher(browser_fallback=False) as enricher:
+            seconds = await fetch_all(enricher, urls, args.workers)
+            print(f"  {'per business':<13} {len(urls):5d} fetches in {seconds:5.1f}s")
+        for name in ("cold", "warm"):
+            cache = ScrapeCache(cache_path)
+            async with LocalEnricher(browser_fallback=False, cache=cache) as enricher:
+                seconds = await enrich_all(enricher, urls, args.workers)
+                report = enricher.report()
+            cache.close()
+            print(f"  {name:<13} {report['fetched']:5d} fetches in {seconds:5.1f}s, {report['avoided']:5d} avoided "
+                  f"({report['avoided_share']:.0%}): in flight {report['in_flight']}, reused {report['reused']}, "
+                  f"cache {report['cache']}, negative cache {report['negative_cache']}")
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure fetches avoided by website enrichment de-duplication.")
+    parser.add_argument("--businesses", type=int, default=2000)
+    parser.add_argument("--chains", type=int, default=25)
+    parser.add_argument("--chain-share", type=float, default=0.3, help="share of businesses that are chain branches")
+    parser.add_argument("--dead-share", type=float, default=0.08, help="share of businesses with a dead site")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--site-latency", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(args, os.path.join(directory, "cache.sqlite3")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Micro-benchmark of contact extraction over the saved HTML fixtures.
+
+Compares the previous approach (two BeautifulSoup "html.parser" trees per
+page, one for emails and one for social links) with extract.extract_contacts,
+which parses each page once with lxml.
+
+    python bench/bench_extract.py [--repeat 200]
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extract import extract_contacts
+
+
+FIXTURES = Path(__file__).parent / "fixtures" / "html"
+
+
+def legacy_get_emails(content):
+    soup = BeautifulSoup(content, "html.parser")
+    email_pattern = r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}"
+    return list(set(re.findall(email_pattern, soup.get_text())))
+
+
+def legacy_extract_social_media_links(content):
+    social_media_links = {"Facebook": None, "Instagram": None, "Twitter": None, "LinkedIn": None}
+    soup = BeautifulSoup(content, "html.parser")
+    for link in soup.find_all("a", href=True):
+        href = link["href"]
+        if "facebook.com" in href and social_media_links["Facebook"] is None:
+            social_media_links["Facebook"] = href
+        elif "instagram.com" in href and social_media_links["Instagram"] is None:
+            social_media_links["Instagram"] = href
+        elif "twitter.com" in href and social_media_links["Twitter"] is None:
+            social_media_links["Twitter"] = href
+        elif "linkedin.com" in href and social_media_links["LinkedIn"] is None:
+            social_media_links["LinkedIn"] = href
+    for platform in social_media_links:
+        if social_media_links[platform] is None:
+            social_media_links[platform] = "None"
+    return social_media_links
+
+
+def legacy(content):
+    return legacy_get_emails(content), legacy_extract_social_media_links(content)
+
+
+def timed(function, corpus, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for content in corpus:
+            function(content)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    # Both extractors log every page; keep the output to the results
+    logging.disable(logging.INFO)
+
+    corpus = [path.read_text(encoding="utf-8") for path in sorted(FIXTURES.glob("*.html"))]
+    pages = len(corpus) * args.repeat
+
+    for path, content in zip(sorted(FIXTURES.glob("*.html")), corpus):
+        emails, _ = legacy(content)
+        contacts = extract_contacts(content)
+        found = sum(link != "None" for link in contacts.social_media_links.values())
+        print(f"{path.name:<18} legacy emails={len(emails)}  single-pass emails={len(contacts.emails)} socials={found}")
+
+    legacy_seconds = timed(legacy, corpus, args.repeat)
+    single_pass_seconds = timed(extract_contacts, corpus, args.repeat)
+
+    print()
+    print(f"{'extractor':<14}{'pages/s':>12}{'ms/page':>10}")
+    for name, seconds in (("legacy", legacy_seconds), ("single-pass", single_pass_seconds)):
+        print(f"{name:<14}{pages / seconds:>12.0f}{seconds / pages * 1000:>10.3f}")
+    print(f"speedup: {legacy_seconds / single_pass_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Offline check and benchmark of the Maps payload decoder.
+
+Decodes the saved responses in bench/fixtures/maps and compares them with
+expected.json (exit status 1 on any difference), then times decoding a
+large generated search payload.
+
+    python bench/bench_maps_json.py --places 2000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakemaps import FakeMaps
+from maps_json import parse_places
+
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "maps"
+
+
+def decoded(places):
+    return [{**asdict(place), "undecoded": sorted(place.undecoded)} for place in places]
+
+
+def check_fixtures():
+    expected = json.loads((FIXTURES_DIR / "expected.json").read_text())
+    failures = 0
+    for name, places in expected.items():
+        actual = decoded(parse_places((FIXTURES_DIR / name).read_text(encoding="utf-8")))
+        if actual == places:
+            fallback = sum(1 for place in actual if place["undecoded"])
+            print(f"ok   {name}: {len(actual)} places, {fallback} need the DOM fallback")
+            continue
+        failures += 1
+        print(f"FAIL {name}")
+        for want, got in zip(places + [None] * len(actual), actual + [None] * len(places)):
+            if want != got:
+                print(f"    expected {want}\n    got      {got}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time the Maps payload decoder.")
+    parser.add_argument("--places", type=int, default=2000)
+    args = parser.parse_args()
+
+    failures = check_fixtures()
+
+    server = FakeMaps(places=args.places, shift_every=10)
+    server.base_url = "https://fake.example"
+    payload = server.search_payload("pizza in Springfield", 0, args.places)
+    start = time.perf_counter()
+    places = parse_places(payload)
+    seconds = time.perf_counter() - start
+    fallback = sum(1 for place in places if place.undecoded)
+    print(f"decoded {len(places)} places from {len(payload) / 1e6:.1f} MB in {seconds * 1000:.1f} ms "
+          f"({len(places) / seconds:,.0f} places/s), {fallback} need the DOM fallback")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Throughput of the normalization stage on a synthetic dataset of messy records.
+
+Generates --rows business records the way scrapes leave them: phones in
+national, international and invalid formats with extensions, websites as
+display text, URLs with tracking parameters or "None", emails as lists,
+"; "-joined strings and stringified lists (with asset names and placeholders
+mixed in), socials with share buttons and posts, and --duplicate-share of
+the rows repeated with another spelling of the name, address, phone and
+website. Then runs normalize.normalize over them and reports each stage.
+
+    python bench/bench_normalize.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from normalize import normalize
+
+
+WORDS = np.array("golden happy blue city royal family corner little green river star urban prime".split())
+KINDS = np.array("pizza bakery dental salon cafe tacos fitness pharmacy books florist bistro garage".split())
+STREETS = np.array("Main Oak Pine Maple Cedar Elm Washington Lake Hill Park".split())
+STREET_TYPES = np.array(["Street", "Avenue", "Road", "Boulevard", "Drive"])
+SHORT_TYPES = np.array(["St", "Ave", "Rd", "Blvd", "Dr"])
+LEGAL = np.array(["", "", "", " LLC", " Inc.", ", Ltd"])
+
+
+def pick(rng, values, size):
+    return pd.Series(values[rng.integers(0, len(values), size)])
+
+
+def synthetic_records(rows, duplicate_share=0.1, seed=0):
+    rng = np.random.default_rng(seed)
+    unique = int(rows / (1 + duplicate_share))
+    ids = pd.Series(np.arange(unique)).astype(str)
+    numbers = pd.Series(rng.integers(1, 9999, unique)).astype(str)
+    street = pick(rng, STREETS, unique)
+    street_type = rng.integers(0, len(STREET_TYPES), unique)
+    area = pd.Series(rng.integers(200, 999, unique)).astype(str)
+    line = pd.Series(rng.integers(2_000_000, 9_999_999, unique)).astype(str)
+    slug = pick(rng, WORDS, unique) + pick(rng, KINDS, unique) + ids
+
+    base = pd.DataFrame({
+        "name": pick(rng, WORDS, unique).str.title() + " " + pick(rng, KINDS, unique).str.title() + " " + ids,
+        "street": numbers + " " + street,
+        "area": area,
+        "line": line,
+        "slug": slug,
+        "street_type": street_type,
+    })
+    duplicates = base.sample(rows - unique, replace=True, random_state=seed)
+    frame = pd.concat([base.assign(copy=0), duplicates.assign(copy=1)], ignore_index=True)
+    size = len(frame)
+    copy = frame["copy"].to_numpy() == 1
+    style = rng.integers(0, 6, size)
+
+    types = np.where(copy, SHORT_TYPES[frame["street_type"]], STREET_TYPES[frame["street_type"]])
+    frame["address"] = frame["street"] + " " + types + np.where(style == 2, ", Suite 200", "") + ", Springfield"
+    frame["name"] = frame["name"] + np.where(copy, LEGAL[rng.integers(0, len(LEGAL), size)], "")
+
+    phone_formats = [
+        "(" + frame["area"] + ") " + frame["line"].str[:3] + "-" + frame["line"].str[3:],
+        "+1 " + frame["area"] + "-" + frame["line"].str[:3] + "-" + frame["line"].str[3:],
+        frame["area"] + "." + frame["line"].str[:3] + "." + frame["line"].str[3:],
+        "1" + frame["area"] + frame["line"] + " ext. 12",
+        "+44 20 " + frame["line"].str[:4] + " " + frame["line"].str[3:],
+        pd.Series(np.where(rng.random(size) < 0.5, "", "12"), index=frame.index),
+    ]
+    frame["phone_number"] = pd.Series(np.select([style == k for k in range(6)], phone_formats))
+
+    website_formats = [
+        frame["slug"] + ".com",
+        "https://www." + frame["slug"] + ".com/?utm_source=gmb&utm_medium=organic",
+        "http://" + frame["slug"] + ".com/",
+        pd.Series("None", index=frame.index),
+        pd.Series("Order online", index=frame.index),
+        "https://" + frame["slug"] + ".com/locations/springfield",
+    ]
+    frame["website"] = pd.Series(np.select([style == k for k in range(6)], website_formats))
+
+    email_style = rng.integers(0, 5, size)
+    info = ("info@" + frame["slug"] + ".com").to_numpy()
+    sales = ("Sales@" + frame["slug"] + ".com").to_numpy()
+    emails = np.empty(size, dtype=object)
+    for i in range(size):
+        kind = email_style[i]
+        if kind == 0:
+            emails[i] = [info[i], "logo@2x.png"]
+        elif kind == 1:
+            emails[i] = f"{info[i]}; {sales[i]}"
+        elif kind == 2:
+            emails[i] = f"['{sales[i]}']"
+        elif kind == 3:
+            emails[i] = ["you@example.com"]
+        else:
+            emails[i] = []
+    frame["email"] = emails
+
+    social_style = rng.integers(0, 4, size)
+    handle = frame["slug"]
+    frame["facebook"] = np.select(
+        [social_style == 0, social_style == 1, social_style == 2],
+        ["https://www.facebook.com/" + handle + "/?ref=page", "https://www.facebook.com/sharer/sharer.php?u=x",
+         "fb.com/" + handle.str.upper()],
+        "None",
+    )
+    frame["instagram"] = np.select(
+        [social_style == 0, social_style == 1], ["https://instagram.com/" + handle + "/", "https://www.instagram.com/p/Cx1/"],
+        "None",
+    )
+    frame["twitter"] = np.where(social_style == 2, "https://twitter.com/" + handle.str[:15], "None")
+    frame["linkedin"] = np.where(social_style == 3, "https://www.linkedin.com/company/" + handle + "/", "None")
+    frame["youtube"] = np.where(social_style == 0, "https://www.youtube.com/@" + handle, "None")
+    frame["tiktok"] = np.where(social_style == 1, "https://www.tiktok.com/@" + handle.str[:24] + "?lang=en", "None")
+    frame["place_url"] = ""
+    return frame.drop(columns=["street", "area", "line", "slug", "street_type", "copy"]), unique
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the normalization stage on synthetic records.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--duplicate-share", type=float, default=0.1)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    frame, unique = synthetic_records(args.rows, args.duplicate_share)
+    print(f"{len(frame)} records ({unique} businesses) generated in {time.perf_counter() - started:.1f}s")
+
+    result = normalize(frame)
+    stats = result.stats
+    print(f"  normalized in {stats['seconds']:.1f}s: {stats['rows_per_second']:,} records/s")
+    for stage, seconds in stats["stages"].items():
+        print(f"    {stage:<11} {seconds:6.2f}s  {len(frame) / seconds:12,.0f} records/s")
+    print(f"  {stats['businesses']} businesses ({unique} expected), {stats['phones']} valid phones, "
+          f"{stats['phones_invalid']} invalid, {stats['websites']} websites, {stats['emails']} valid emails, "
+          f"{stats['emails_invalid']} rejected")
+
+
+if __name__ == "__main__":
+    main()
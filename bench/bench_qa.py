@@ -0,0 +1,137 @@
+"""
+Q&A benchmark with a stub model.
+
+Builds a synthetic result set, asks a few questions through qa.QuestionAnswerer
+and reports the prompt tokens sent against the sliced one-prompt-per-6000-
+characters approach, plus index build and search times. Checks that the
+records a question names end up in its prompt. Then times a whole-dataset
+(map-reduce) question at each concurrency limit against a stub model with
+--latency per call that rate limits every --rate-limit-every-th call.
+
+    python bench/bench_qa.py --businesses 2000 --latency 0.5 --concurrency 1 4 8
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.api_core.exceptions import ResourceExhausted
+
+from qa import BusinessIndex, QuestionAnswerer
+from scraper import Business, format_businesses, split_scraped_data
+
+
+KINDS = ["Pizzeria", "Dental Clinic", "Bakery", "Law Firm", "Hotel", "Day Spa", "Hardware Store", "Florist"]
+STREETS = ["Main", "Oak", "Court", "Pine", "Harbor", "Elm", "Cedar", "Maple"]
+
+
+def synthetic_businesses(count, seed=0):
+    rng = random.Random(seed)
+    businesses = []
+    for i in range(count):
+        kind = rng.choice(KINDS)
+        slug = f"{kind.lower().replace(' ', '')}{i}"
+        has_site = rng.random() < 0.8
+        businesses.append(Business(
+            name=f"{rng.choice(STREETS)} {kind} {i}",
+            address=f"{rng.randrange(1, 9999)} {rng.choice(STREETS)} St, Springfield",
+            website=f"{slug}.example" if has_site else None,
+            phone_number=f"(555) {rng.randrange(100, 999)}-{rng.randrange(1000, 9999)}",
+            email=[f"info@{slug}.example"] if has_site and rng.random() < 0.6 else [],
+            facebook=f"https://www.facebook.com/{slug}" if has_site and rng.random() < 0.5 else "None",
+            instagram=f"https://www.instagram.com/{slug}" if has_site and rng.random() < 0.4 else "None",
+            place_url=f"https://www.google.com/maps/place/{slug}",
+        ))
+    return businesses
+
+
+class StubModel:
+    """
+    Records prompts and answers with a fixed text after `latency` seconds,
+    shaped like a Gemini response. Every `rate_limit_every`-th call raises a
+    rate-limit error instead.
+    """
+
+    def __init__(self, latency=0.0, rate_limit_every=0):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.prompts = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        with self._lock:
+            self.calls += 1
+            rate_limited = self.rate_limit_every and self.calls % self.rate_limit_every == 0
+            if not rate_limited:
+                self.prompts.append(prompt)
+        time.sleep(self.latency)
+        if rate_limited:
+            raise ResourceExhausted("429 quota exceeded")
+        part = SimpleNamespace(text="stub answer")
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Q&A prompt-size benchmark with a stub model.")
+    parser.add_argument("--businesses", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per stub model call")
+    parser.add_argument("--rate-limit-every", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    businesses = synthetic_businesses(args.businesses)
+    target = businesses[len(businesses) // 2]
+    questions = [
+        f"What is the phone number of {target.name}?",
+        "Which dental clinics have an instagram page?",
+        "List the bakeries on Harbor St with an email address",
+    ]
+
+    start = time.perf_counter()
+    BusinessIndex(businesses)
+    build_seconds = time.perf_counter() - start
+
+    model = StubModel()
+    answerer = QuestionAnswerer(model=model, top_k=args.top_k)
+    start = time.perf_counter()
+    for question in questions:
+        answerer.answer(question, businesses, key="bench")
+    answer_seconds = (time.perf_counter() - start) / len(questions)
+
+    assert target.name in model.prompts[0], "the named business is missing from its prompt"
+    report = answerer.report()
+    print(f"{args.businesses} businesses: index built in {build_seconds * 1000:.1f} ms, "
+          f"{answer_seconds * 1000:.1f} ms per question (index built {report['index_builds']}x, "
+          f"reused {report['index_hits']}x)")
+    print(f"prompt tokens: {report['prompt_tokens']} sent vs {report['baseline_prompt_tokens']} sliced "
+          f"({report['prompt_tokens_saved']} saved, {report['share_saved']:.0%}), "
+          f"1 model call per question instead of {len(split_scraped_data(format_businesses(businesses)))}")
+
+    question = "How many businesses have an email address?"
+    print(f"\nmap-reduce \"{question}\" with {args.latency}s per call, "
+          f"rate limited every {args.rate_limit_every} calls:")
+    for concurrency in args.concurrency:
+        model = StubModel(args.latency, args.rate_limit_every)
+        answerer = QuestionAnswerer(model=model, top_k=args.top_k, concurrency=concurrency, backoff=args.latency)
+        start = time.perf_counter()
+        answerer.answer(question, businesses, key="bench")
+        seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        answerer.answer(question.upper() + " ", businesses, key="bench")
+        cached_seconds = time.perf_counter() - start
+        report = answerer.report()
+        calls = report["model_calls"]
+        print(f"  concurrency={concurrency}: {seconds:.2f}s ({calls['map']} map + {calls['reduce']} reduce calls, "
+              f"{report['retries']} retries), repeated question {cached_seconds * 1000:.2f} ms "
+              f"({report['answer_cache_hits']} cache hit)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Offline throughput benchmark of the scraper against the fake Maps server.
+
+Runs scraper.main (browser pool, waits, enrichment, blocking: the real code
+paths) against bench/fakemaps.py for each worker count, and reports
+listings/sec, time to first record, per-phase latency percentiles, peak RSS
+of this process and its browsers, the number of browser processes and how
+many place pages had to be opened instead of read from the Maps payloads.
+Results are saved as JSON in --results-dir and compared with the previous
+result file (or --compare) so regressions between versions show up.
+
+    python bench/bench_scraper.py --quantity 60 --workers 1 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blocking import PAGE_LOAD_SECONDS
+from fakemaps import FakeMaps, route_maps_to
+from maps_json import PLACE_EXTRACTIONS
+from pool import BrowserPool
+from waits import WAIT_SECONDS
+import scraper
+
+
+RESULTS_DIR = Path(__file__).parent / "results"
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+BROWSER_NAMES = ("chrome", "chromium", "headless_shell")
+
+
+def process_tree():
+    """
+    Returns {pid: (ppid, rss_bytes, cmdline)} for this process and its
+    descendants, read from /proc (Linux only; empty elsewhere).
+    """
+    processes = {}
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                fields = stat.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{entry}/cmdline", "rb") as cmdline:
+                command = cmdline.read().replace(b"\0", b" ").decode(errors="replace")
+        except OSError:
+            continue
+        processes[int(entry)] = (int(fields[1]), int(fields[21]) * PAGE_SIZE, command)
+
+    tree = {}
+    pending = [os.getpid()]
+    while pending:
+        pid = pending.pop()
+        if pid in processes:
+            tree[pid] = processes[pid]
+            pending.extend(child for child, (ppid, _, _) in processes.items() if ppid == pid)
+    return tree
+
+
+class ResourceSampler:
+    """
+    Samples the RSS of the process tree and the number of browser processes
+    (Chromium processes without a --type= flag) in a background thread.
+    """
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_browsers = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            tree = process_tree()
+            self.peak_rss = max(self.peak_rss, sum(rss for _, rss, _ in tree.values()))
+            browsers = sum(
+                1 for _, _, command in tree.values()
+                if any(name in command for name in BROWSER_NAMES) and "--type=" not in command
+            )
+            self.peak_browsers = max(self.peak_browsers, browsers)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentiles(histogram, **labels):
+    values = {f"p{int(q * 100)}": histogram.quantile(q, **labels) for q in (0.5, 0.9, 0.99)}
+    return values if values["p50"] is not None else None
+
+
+async def run_once(args, workers):
+    WAIT_SECONDS.reset()
+    PAGE_LOAD_SECONDS.reset()
+    server = FakeMaps(args.places, args.batch, args.feed_latency, args.detail_latency, args.site_latency,
+                      shift_every=args.shift_every)
+    await server.start()
+    extractions_before = PLACE_EXTRACTIONS.series()
+    arrivals = []
+    start = time.perf_counter()
+    try:
+        with ResourceSampler() as sampler:
+            async with BrowserPool(size=workers + 1, headless=True, storage_state_path=None,
+                                   context_hook=route_maps_to(server)) as pool:
+                ready = time.perf_counter()
+                result = await scraper.main(
+                    args.search_term, args.quantity, workers, pool=pool,
+                    on_business=lambda business: arrivals.append(time.perf_counter()),
+                    use_payloads=not args.no_payloads,
+                )
+            finished = time.perf_counter()
+    finally:
+        await server.stop()
+
+    scrape_seconds = finished - ready
+    count = len(result.business_list)
+    extractions = {
+        dict(labels)["source"]: value - extractions_before.get(labels, 0)
+        for labels, value in PLACE_EXTRACTIONS.series().items()
+    }
+    return {
+        "workers": workers,
+        "listings": count,
+        "pool_start_seconds": ready - start,
+        "scrape_seconds": scrape_seconds,
+        "listings_per_sec": count / scrape_seconds if scrape_seconds else 0,
+        "first_record_seconds": arrivals[0] - ready if arrivals else None,
+        "phases": {
+            "scroll_wait": percentiles(WAIT_SECONDS, wait="scroll"),
+            "detail_wait": percentiles(WAIT_SECONDS, wait="detail"),
+            "maps_page_load": percentiles(PAGE_LOAD_SECONDS, profile=pool.maps_profile.name),
+            "enrichment_page_load": percentiles(PAGE_LOAD_SECONDS, profile=pool.enrichment_profile.name),
+        },
+        "extractions": {source: count for source, count in extractions.items() if count},
+        "place_pages_opened": extractions.get("dom", 0) + extractions.get("payload_and_dom", 0),
+        "peak_rss_mb": sampler.peak_rss / 1e6,
+        "browsers": sampler.peak_browsers,
+        "server_requests": server.requests,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_result(results_dir, exclude):
+    files = sorted(path for path in results_dir.glob("*.json") if path != exclude)
+    return files[-1] if files else None
+
+
+def compare(current, previous):
+    by_workers = {run["workers"]: run for run in previous["runs"]}
+    print(f"\nCompared with {previous['revision']} ({previous['timestamp']}):")
+    for run in current["runs"]:
+        old = by_workers.get(run["workers"])
+        if not old or not old["listings_per_sec"]:
+            continue
+        change = (run["listings_per_sec"] - old["listings_per_sec"]) / old["listings_per_sec"] * 100
+        print(
+            f"  workers={run['workers']}: {old['listings_per_sec']:.2f} -> {run['listings_per_sec']:.2f} "
+            f"listings/s ({change:+.1f}%), peak RSS {old['peak_rss_mb']:.0f} -> {run['peak_rss_mb']:.0f} MB"
+        )
+
+
+def print_run(run):
+    first = run["first_record_seconds"]
+    first_text = f"first record {first:.2f}s" if first is not None else "no records"
+    print(
+        f"workers={run['workers']}: {run['listings']} listings in {run['scrape_seconds']:.1f}s "
+        f"({run['listings_per_sec']:.2f}/s), {first_text}, "
+        f"peak RSS {run['peak_rss_mb']:.0f} MB, {run['browsers']} browser(s)"
+    )
+    if run.get("extractions"):
+        sources = ", ".join(f"{source}={count}" for source, count in sorted(run["extractions"].items()))
+        print(f"    place pages opened: {run['place_pages_opened']} ({sources})")
+    for phase, values in run["phases"].items():
+        if values:
+            print(f"    {phase:<22}" + "  ".join(f"{name}={value:.3f}s" for name, value in values.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline scraper throughput benchmark.")
+    parser.add_argument("--search-term", default="pizza in Springfield")
+    parser.add_argument("--quantity", type=int, default=60)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--places", type=int, default=300)
+    parser.add_argument("--batch", type=int, default=7)
+    parser.add_argument("--feed-latency", type=int, default=300, help="ms before each feed batch appears")
+    parser.add_argument("--detail-latency", type=int, default=200, help="ms before a place panel renders")
+    parser.add_argument("--site-latency", type=int, default=50, help="ms for each business site response")
+    parser.add_argument("--shift-every", type=int, default=0,
+                        help="every n-th place has a payload layout the decoder does not know")
+    parser.add_argument("--no-payloads", action="store_true", help="read every place from the DOM")
+    parser.add_argument("--results-dir", type=Path, default=RESULTS_DIR)
+    parser.add_argument("--compare", type=Path, help="result file to compare with (default: the previous one)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    runs = []
+    for workers in args.workers:
+        run = asyncio.run(run_once(args, workers))
+        print_run(run)
+        runs.append(run)
+
+    result = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "runs": runs,
+    }
+    args.results_dir.mkdir(parents=True, exist_ok=True)
+    path = args.results_dir / f"{time.strftime('%Y%m%d-%H%M%S')}-{result['revision']}.json"
+    path.write_text(json.dumps(result, indent=2))
+    print(f"\nSaved {path}")
+
+    previous = args.compare or previous_result(args.results_dir, path)
+    if previous:
+        compare(result, json.loads(Path(previous).read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Throttling controller benchmark against the fake Maps server's throttling mode.
+
+Fetches --places place pages and their business sites over HTTP from a
+bench/fakemaps.py server that blocks clients going faster than
+--throttle-rate place pages per second (and --site-rate site requests), and
+compares fixed concurrency levels with the adaptive throttle.Throttle. Every
+blocked request is retried after the budget's pause, so all strategies fetch
+the same pages; the difference is how long it takes and how often they are
+blocked. Maps and the sites run at the same time on separate budgets.
+
+Sites are fetched the way enrich.WebsiteEnricher fetches them, and every
+--walled-every-th site sits behind a bot wall answering 403, as some real
+sites do. Only the 429s of --site-rate should slow the sites budget down;
+a walled site fails on its own.
+
+    python bench/bench_throttle.py --places 500 --throttle-rate 20 --fixed 4 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from enrich import WebsiteEnricher
+from fakemaps import FakeMaps
+from throttle import Blocked, Budget, Throttle, block_reason
+
+
+# Sites answer 429 without a lasting penalty; the adaptive budget waits this long too
+SITE_BLOCK_PAUSE = 2.0
+
+
+def fixed_budget(name, concurrency, pause):
+    """
+    A budget that never changes its concurrency: a scraper with a fixed
+    number of workers that only waits out blocks.
+    """
+    return Budget(name, concurrency=concurrency, min_concurrency=concurrency, max_concurrency=concurrency,
+                  decrease=1.0, latency_factor=None, rate_decrease=None, block_pause=pause, max_block_pause=pause)
+
+
+async def fetch_all(session, budget, urls):
+    async def fetch(url):
+        while True:
+            try:
+                async with budget.slot():
+                    async with session.get(url) as response:
+                        await response.read()
+                        reason = block_reason(str(response.url), response.status)
+                        if reason is not None:
+                            raise Blocked(reason)
+                        return
+            except Blocked:
+                continue
+
+    started = time.perf_counter()
+    await asyncio.gather(*(fetch(url) for url in urls))
+    return time.perf_counter() - started
+
+
+async def fetch_sites(budget, urls):
+    # The fake sites share one host, unlike real ones: no per-host limit
+    enricher = WebsiteEnricher(limit=0, limit_per_host=0)
+
+    async def fetch(url):
+        while True:
+            try:
+                async with budget.slot():
+                    await enricher.fetch(url)
+                    return
+            except Blocked:
+                continue
+            except aiohttp.ClientResponseError:
+                return
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(fetch(url) for url in urls))
+    finally:
+        await enricher.close()
+    return time.perf_counter() - started
+
+
+async def run(args, maps_budget, sites_budget):
+    server = FakeMaps(places=args.places, detail_latency=args.detail_latency, site_latency=args.site_latency,
+                      throttle_rate=args.throttle_rate, throttle_capacity=args.capacity,
+                      throttle_penalty=args.penalty, site_rate=args.site_rate, walled_every=args.walled_every)
+    base_url = await server.start()
+    places = [f"{base_url}/maps/place/Business+{i}/data=!4m2!3m1!1s0x1:0x{i:x}" for i in range(args.places)]
+    sites = [f"{base_url}/site/{i}/" for i in range(args.places)]
+    try:
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            maps_seconds, sites_seconds = await asyncio.gather(
+                fetch_all(session, maps_budget, places),
+                fetch_sites(sites_budget, sites),
+            )
+    finally:
+        await server.stop()
+    return server, maps_seconds, sites_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fixed and adaptive concurrency against a throttling server.")
+    parser.add_argument("--places", type=int, default=500)
+    parser.add_argument("--throttle-rate", type=float, default=20, help="place pages per second before blocking")
+    parser.add_argument("--capacity", type=int, default=8, help="place pages the server serves at once")
+    parser.add_argument("--penalty", type=float, default=10.0, help="seconds a blocked client stays blocked")
+    parser.add_argument("--site-rate", type=float, default=60, help="site requests per second before 429s")
+    parser.add_argument("--walled-every", type=int, default=33, help="every n-th site answers 403")
+    parser.add_argument("--detail-latency", type=int, default=200)
+    parser.add_argument("--site-latency", type=int, default=50)
+    parser.add_argument("--fixed", type=int, nargs="*", default=[2, 4, 16])
+    args = parser.parse_args()
+
+    print(f"{args.places} place pages (server blocks above {args.throttle_rate:g}/s for {args.penalty:g}s) "
+          f"and {args.places} sites (429 above {args.site_rate:g}/s, 1 in {args.walled_every} walled)")
+    strategies = [
+        (f"fixed {n}", fixed_budget("maps", n, args.penalty), fixed_budget("websites", 4 * n, SITE_BLOCK_PAUSE))
+        for n in args.fixed
+    ]
+    throttle = Throttle(maps_concurrency=16, website_concurrency=64, block_pause=args.penalty)
+    strategies.append(("adaptive", throttle.maps, throttle.websites))
+
+    for name, maps_budget, sites_budget in strategies:
+        server, maps_seconds, sites_seconds = asyncio.run(run(args, maps_budget, sites_budget))
+        print(f"  {name:<9} maps {args.places / maps_seconds:5.1f}/s ({maps_seconds:5.1f}s, "
+              f"{server.blocked['maps']:4d} blocked, concurrency {maps_budget.limit:4.1f})   "
+              f"sites {args.places / sites_seconds:6.1f}/s ({sites_seconds:5.1f}s, "
+              f"{server.blocked['sites']:4d} blocked, {server.blocked['walled']:3d} walled, "
+              f"concurrency {sites_budget.limit:4.1f}, rate cap {sites_budget.rate_cap or 0:5.1f}/s)")
+
+
+if __name__ == "__main__":
+    main()
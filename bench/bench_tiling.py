@@ -0,0 +1,91 @@
+"""
+Tiling planner benchmark against a synthetic density map.
+
+Scatters places over a city with bench/fakemaps.py's clustered density map,
+answers each tile search with the first --cap places in the tile's viewport
+(like a Maps feed) after --latency seconds, and reports how much of the area
+each planner setting recovers, how many tiles it searched and the wall time
+at each concurrency. Exits with status 1 when full refinement misses places.
+
+    python bench/bench_tiling.py --places 20000 --concurrency 1 4 8
+"""
+import argparse
+import asyncio
+import bisect
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakemaps import clustered_points
+from tiling import Tile, TilePlanner, VIEWPORT_WIDTH
+
+
+def make_search(points, cap, latency):
+    """
+    Tile search over the points: the first `cap` places (by index, like the
+    fake server) in the viewport the tile's URL would show, which is what
+    fakemaps.viewport_contains selects.
+    """
+    by_lat = sorted(range(len(points)), key=lambda i: points[i][0])
+    lats = [points[i][0] for i in by_lat]
+
+    async def search(tile):
+        await asyncio.sleep(latency)
+        lat, lng = tile.center
+        width = VIEWPORT_WIDTH / 256 * 360 / 2 ** round(tile.zoom, 2)
+        half_lat = width * math.cos(math.radians(lat)) / 2
+        low, high = bisect.bisect_left(lats, lat - half_lat), bisect.bisect_right(lats, lat + half_lat)
+        inside = sorted(i for i in by_lat[low:high] if abs(points[i][1] - lng) <= width / 2)
+        return inside[:cap]
+    return search
+
+
+async def run(points, bounds, cap, latency, concurrency, **options):
+    planner = TilePlanner(bounds, cap=cap, **options)
+    start = time.perf_counter()
+    found = [i async for i in planner.run(make_search(points, cap, latency), concurrency=concurrency)]
+    return planner, found, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiling planner benchmark against a synthetic density map.")
+    parser.add_argument("--places", type=int, default=20000)
+    parser.add_argument("--cap", type=int, default=120)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per tile search")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    points = clustered_points(args.places)
+    bounds = Tile(41.6, -87.95, 42.15, -87.3)
+    inside = {i for i, (lat, lng) in enumerate(points) if bounds.contains(lat, lng)}
+    print(f"{len(inside)} of {args.places} places inside the bounds; one search shows at most {args.cap}")
+
+    failed = False
+    settings = [
+        ("single search", dict(rows=1, cols=1, max_depth=0)),
+        ("4x4 grid", dict(rows=4, cols=4, max_depth=0)),
+        ("2x2 + quadtree depth 5", dict(rows=2, cols=2, max_depth=5)),
+        ("2x2 + quadtree", dict(rows=2, cols=2)),
+    ]
+    for name, options in settings:
+        planner, found, _ = asyncio.run(run(points, bounds, args.cap, 0, 1, **options))
+        report = planner.report()
+        recall = len(inside & set(found)) / len(inside)
+        print(f"  {name:<24} {recall:6.1%} of places, {report['tiles']} tiles "
+              f"(split {report['split']}, capped {report['capped']}, depth {report['max_depth']}), "
+              f"{report['duplicate_share']:.0%} duplicates")
+        if "max_depth" not in options and recall < 0.999:
+            failed = True
+
+    print(f"\nwall time with {args.latency}s per tile search:")
+    for concurrency in args.concurrency:
+        planner, found, seconds = asyncio.run(run(points, bounds, args.cap, args.latency, concurrency))
+        print(f"  concurrency={concurrency}: {len(found)} places from {planner.report()['tiles']} tiles in {seconds:.2f}s")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,502 @@
+"""
+Local look-alike of the Google Maps pages the scraper reads, plus a set of
+generated business websites, for offline benchmarks.
+
+The Maps page has the DOM the scraper relies on: the `searchboxinput` box,
+a results feed of `https://www.google.com/maps/place/...` links that grows on
+every wheel scroll after `feed_latency` ms and ends with the end-of-list
+marker, and a place panel (`div[role=main][aria-label]`) with the
+`address`, `authority` and `phone:tel:` items that renders `detail_latency` ms
+after a click. Place URLs can also be opened directly. The first visit shows
+the consent form. Like the real client, the feed is built from the JSON of
+`/search?tbm=map` responses, so payload interception can be benchmarked too.
+
+Places have coordinates drawn from a clustered density map around a city
+centre. A viewport search URL (`/maps/search/<term>/@lat,lng,zoomz`) only
+shows the places in that viewport, at most `cap` of them like the real feed,
+so tiled searches can be benchmarked.
+
+With `throttle_rate`, the server throttles like Maps does: place pages are
+served `throttle_capacity` at a time (more queue up, so latency grows with
+load), and a client that asks for more than `throttle_rate` place pages in a
+second is redirected to an "unusual traffic" page (HTTP 429) for
+`throttle_penalty` seconds. `site_rate` caps the business sites the same way
+with plain 429 responses, as if they shared one host, and with `walled_every`
+every n-th site sits behind a bot wall that always answers 403.
+
+Browser contexts reach it through `route_maps_to(server)`, which answers
+www.google.com/maps requests from this server, so the scraper runs unchanged.
+
+    python bench/fakemaps.py --port 8800 --places 300
+"""
+from collections import deque
+import argparse
+import asyncio
+import html
+import json
+import math
+import random
+import re
+import time
+import urllib.parse
+
+from aiohttp import web
+
+
+MAPS_PAGE = r"""<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Google Maps</title>
+<style>
+body {{ margin: 0; font-family: sans-serif; }}
+#side {{ position: fixed; left: 0; top: 0; width: 420px; height: 100vh; overflow-y: auto; }}
+#map {{ margin-left: 420px; height: 100vh; background: #e5e3df; }}
+div[role="feed"] a {{ display: block; height: 120px; border-bottom: 1px solid #ddd; }}
+</style></head>
+<body>
+<div id="side">
+  {consent}
+  <input id="searchboxinput" type="text" aria-label="Search Google Maps">
+  <div id="results"></div>
+  {panel}
+</div>
+<div id="map"></div>
+<script>
+const TOTAL = {total};
+const BATCH = {batch};
+const FEED_LATENCY = {feed_latency};
+const DETAIL_LATENCY = {detail_latency};
+const VIEWPORT = "{viewport}";
+let shown = 0;
+let loading = false;
+let query = {query};
+
+function placeUrl(i) {{
+  return "https://www.google.com/maps/place/" + encodeURIComponent("Business " + i) +
+    "/data=!4m2!3m1!1s0x1:0x" + i.toString(16) + "?query=" + encodeURIComponent(query);
+}}
+
+function decodePayload(text) {{
+  const data = JSON.parse(text.replace(/\/\*""\*\/$/, ""));
+  return JSON.parse(data.d.slice(4));
+}}
+
+async function appendBatch() {{
+  const feed = document.querySelector('div[role="feed"]');
+  const response = await fetch("/search?tbm=map&q=" + encodeURIComponent(query) + "&start=" + shown + "&num=" + BATCH +
+    (VIEWPORT ? "&vp=" + VIEWPORT : ""));
+  const entries = decodePayload(await response.text())[0][1].slice(1);
+  for (const entry of entries) {{
+    const place = entry[14];
+    const i = parseInt(place[10].split(":0x")[1], 16);
+    const a = document.createElement("a");
+    a.href = placeUrl(i);
+    a.setAttribute("aria-label", place[11]);
+    a.textContent = place[11];
+    a.addEventListener("click", (event) => {{ event.preventDefault(); openPlace(i); }});
+    feed.appendChild(a);
+  }}
+  shown += entries.length;
+  if (shown >= TOTAL) {{
+    const marker = document.createElement("span");
+    marker.className = "HlvSq";
+    marker.textContent = "You've reached the end of the list.";
+    feed.appendChild(marker);
+  }}
+}}
+
+function openPlace(i) {{
+  const old = document.querySelector('div[role="main"]');
+  if (old) old.remove();
+  setTimeout(async () => {{
+    const response = await fetch("/maps/panel/" + i);
+    const holder = document.createElement("div");
+    holder.innerHTML = await response.text();
+    document.getElementById("side").appendChild(holder.firstElementChild);
+  }}, DETAIL_LATENCY);
+}}
+
+function search() {{
+  document.getElementById("results").innerHTML = '<div role="feed" aria-label="Results"></div>';
+  shown = 0;
+  setTimeout(appendBatch, FEED_LATENCY);
+}}
+
+document.getElementById("searchboxinput").addEventListener("keydown", (event) => {{
+  if (event.key !== "Enter") return;
+  query = event.target.value;
+  search();
+}});
+
+if (VIEWPORT) search();
+
+document.addEventListener("wheel", () => {{
+  if (loading || shown === 0 || shown >= TOTAL) return;
+  loading = true;
+  setTimeout(async () => {{ await appendBatch(); loading = false; }}, FEED_LATENCY);
+}});
+
+const consent = document.getElementById("consent-accept");
+if (consent) consent.addEventListener("click", () => {{
+  document.cookie = "CONSENT=YES+; path=/";
+  document.getElementById("consent").remove();
+}});
+</script>
+</body>
+</html>
+"""
+
+CONSENT_FORM = """<form id="consent" action="https://consent.google.com/save" method="POST">
+    <button id="consent-accept" type="button">Accept all</button>
+  </form>"""
+
+PANEL = """<div role="main" aria-label="{name}">
+  <h1>{name}</h1>
+  <button data-item-id="address"><div class="fontBodyMedium">{address}</div></button>
+  {website}
+  <button data-item-id="phone:tel:{phone_digits}"><div class="fontBodyMedium">{phone}</div></button>
+</div>"""
+
+WEBSITE_ITEM = """<a data-item-id="authority" href="{url}" target="_blank"><div class="fontBodyMedium">{display}</div></a>"""
+
+SORRY_PAGE = """<!DOCTYPE html>
+<html><head><title>Sorry...</title></head>
+<body><h1>Sorry...</h1>
+<p>Our systems have detected unusual traffic from your computer network.
+Please try your request again later.</p></body></html>
+"""
+
+SITE_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{name}</title>
+<script src="https://www.googletagmanager.com/gtag/js?id=G-BENCH" async></script></head>
+<body>
+<h1>{name}</h1>
+<p>{filler}</p>
+<p>Contact us at <a href="mailto:info@business{i}.example">info@business{i}.example</a>
+or bookings [at] business{i} [dot] example.</p>
+<img src="/static/hero-{i}.jpg" alt="">
+<a href="https://www.facebook.com/business{i}">Facebook</a>
+<a href="https://www.instagram.com/business{i}">Instagram</a>
+</body></html>
+"""
+
+JS_SITE_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{name}</title>
+<script src="/static/runtime.js"></script><script src="/static/vendor.js"></script><script src="/static/main.js"></script>
+</head>
+<body><div id="root"></div>
+<script>
+document.getElementById("root").innerHTML =
+  '<h1>{name}</h1><p>Email hello@business{i}.example</p><a href="https://x.com/business{i}">X</a>';
+</script>
+</body></html>
+"""
+
+CITY_CENTER = (41.8781, -87.6298)
+
+# (lat offset, lng offset, spread in degrees, share of places) of each cluster
+CITY_CLUSTERS = [
+    (0.0, 0.0, 0.012, 0.35),
+    (0.05, -0.02, 0.02, 0.2),
+    (-0.06, -0.04, 0.025, 0.15),
+    (0.1, -0.08, 0.03, 0.1),
+    (0.0, 0.0, 0.12, 0.2),
+]
+
+FILLER_WORDS = "fresh local family owned quality service friendly open daily since best city team".split()
+
+
+def clustered_points(count, center=CITY_CENTER, clusters=CITY_CLUSTERS, seed=0):
+    """
+    Returns `count` (lat, lng) points drawn from gaussian clusters around
+    `center`: a dense downtown, a few neighbourhoods and a sparse spread.
+    """
+    rng = random.Random(seed)
+    weights = [cluster[3] for cluster in clusters]
+    points = []
+    for _ in range(count):
+        lat_offset, lng_offset, spread, _ = rng.choices(clusters, weights)[0]
+        points.append((
+            center[0] + lat_offset + rng.gauss(0, spread),
+            center[1] + lng_offset + rng.gauss(0, spread / math.cos(math.radians(center[0]))),
+        ))
+    return points
+
+
+def viewport_contains(viewport, lat, lng):
+    """
+    Whether a point is in the viewport "lat,lng,zoom" of a 1280 px wide window.
+    """
+    center_lat, center_lng, zoom = (float(part) for part in viewport.split(","))
+    width = 1280 / 256 * 360 / 2 ** zoom
+    return (abs(lat - center_lat) <= width * math.cos(math.radians(center_lat)) / 2
+            and abs(lng - center_lng) <= width / 2)
+
+
+class FakeMaps:
+    """
+    aiohttp application serving the fake Maps pages and business sites.
+    Every 10th place is a JavaScript-rendered site and every 7th has no website.
+    With `shift_every`, every n-th place in the search payloads has its
+    website and phone in a layout the decoder does not know. Viewport
+    searches show at most `cap` places. `throttle_rate` and `site_rate`
+    turn on the simulated throttling and `walled_every` the bot walls;
+    `blocked` counts the refused requests.
+    """
+
+    def __init__(self, places=300, batch=7, feed_latency=300, detail_latency=200, site_latency=50,
+                 seed=0, shift_every=0, cap=120, throttle_rate=0, throttle_capacity=8, throttle_penalty=2.0,
+                 site_rate=0, walled_every=0):
+        self.places = places
+        self.batch = batch
+        self.feed_latency = feed_latency
+        self.detail_latency = detail_latency
+        self.site_latency = site_latency
+        self.seed = seed
+        self.shift_every = shift_every
+        self.cap = cap
+        self.throttle_rate = throttle_rate
+        self.throttle_capacity = throttle_capacity
+        self.throttle_penalty = throttle_penalty
+        self.site_rate = site_rate
+        self.walled_every = walled_every
+        self.blocked = {"maps": 0, "sites": 0, "walled": 0}
+        self._recent = {"maps": deque(), "sites": deque()}
+        self._blocked_until = 0.0
+        self._capacity = None
+        self.points = clustered_points(places, seed=seed)
+        self.base_url = ""
+        self.requests = 0
+        self._runner = None
+
+    def app(self):
+        app = web.Application(middlewares=[self._count])
+        app.router.add_get("/maps", self.maps)
+        app.router.add_get(r"/maps/search/{rest:.*}", self.maps_search)
+        app.router.add_get("/search", self.search)
+        app.router.add_get(r"/maps/place/{rest:.*}", self.place)
+        app.router.add_get(r"/maps/panel/{i:\d+}", self.panel_fragment)
+        app.router.add_get(r"/site/{i:\d+}/", self.site)
+        app.router.add_get(r"/static/{name}", self.static)
+        app.router.add_get("/sorry/index", self.sorry)
+        return app
+
+    @web.middleware
+    async def _count(self, request, handler):
+        self.requests += 1
+        return await handler(request)
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def over_rate(self, kind, rate):
+        """
+        Records a request and tells whether there were more than `rate` of
+        this kind in the last second.
+        """
+        now = time.monotonic()
+        recent = self._recent[kind]
+        recent.append(now)
+        while recent and recent[0] <= now - 1.0:
+            recent.popleft()
+        return len(recent) > rate
+
+    def business(self, i):
+        rng = random.Random(self.seed * 1_000_003 + i)
+        phone_digits = f"+1555{rng.randrange(10**7):07d}"
+        return {
+            "name": f"Business {i}",
+            "address": f"{rng.randrange(1, 9999)} {rng.choice(['Main', 'Oak', 'Court', 'Pine'])} St, Springfield",
+            "phone_digits": phone_digits,
+            "phone": f"(555) {phone_digits[5:8]}-{phone_digits[8:]}",
+            "website": None if i % 7 == 3 else f"{self.base_url}/site/{i}/",
+        }
+
+    def panel(self, i):
+        business = self.business(i)
+        website = ""
+        if business["website"]:
+            website = WEBSITE_ITEM.format(url=business["website"], display=f"business{i}.example")
+        return PANEL.format(
+            name=html.escape(business["name"]),
+            address=html.escape(business["address"]),
+            website=website,
+            phone_digits=business["phone_digits"],
+            phone=business["phone"],
+        )
+
+    def place_array(self, i):
+        """
+        The place array of the Maps client payloads: name at 11, data ID at
+        10, address lines at 2 and the full address at 39, [url, domain] at 7,
+        phone at 178 and place ID at 78.
+        """
+        business = self.business(i)
+        place = [None] * 179
+        street, city = business["address"].split(", ", 1)
+        place[2] = [street, city]
+        if business["website"]:
+            place[7] = [f"/url?q={business['website']}&opi=79508299", f"business{i}.example"]
+        place[10] = f"0x1:0x{i:x}"
+        place[11] = business["name"]
+        place[39] = business["address"]
+        place[78] = f"ChIJFake{i:08d}"
+        place[178] = [[business["phone"], [None, [business["phone_digits"]]]]]
+        if self.shift_every and i % self.shift_every == self.shift_every - 1:
+            place[7] = {"url": business["website"]}
+            place[178] = business["phone"]
+        return place
+
+    def visible(self, viewport=None):
+        """
+        Indexes of the places a search shows: all of them, or the first `cap`
+        in the viewport.
+        """
+        if not viewport:
+            return list(range(self.places))
+        inside = [i for i, (lat, lng) in enumerate(self.points) if viewport_contains(viewport, lat, lng)]
+        return inside[:self.cap]
+
+    def search_payload(self, query, start, count, viewport=None):
+        indexes = self.visible(viewport)[start:start + count]
+        entries = [[None] * 14 + [self.place_array(i)] for i in indexes]
+        data = [[query, [[query, None, None, len(entries)]] + entries]]
+        return json.dumps({"c": 0, "d": ")]}'\n" + json.dumps(data)}) + '/*""*/'
+
+    async def search(self, request):
+        if request.query.get("tbm") != "map":
+            raise web.HTTPNotFound()
+        start = int(request.query.get("start", "0"))
+        count = int(request.query.get("num", str(self.batch)))
+        body = self.search_payload(request.query.get("q", ""), start, count, request.query.get("vp"))
+        return web.Response(text=body, content_type="application/json")
+
+    def maps_page(self, request, panel="", query="", viewport=""):
+        consented = "CONSENT" in request.cookies
+        body = MAPS_PAGE.format(
+            consent="" if consented else CONSENT_FORM,
+            panel=panel,
+            query=json.dumps(query),
+            viewport=viewport,
+            total=len(self.visible(viewport)),
+            batch=self.batch,
+            feed_latency=self.feed_latency,
+            detail_latency=self.detail_latency,
+        )
+        return web.Response(text=body, content_type="text/html")
+
+    async def maps(self, request):
+        return self.maps_page(request)
+
+    async def maps_search(self, request):
+        match = re.match(r"([^/]+)/@(-?[\d.]+),(-?[\d.]+),([\d.]+)z", request.match_info["rest"])
+        if not match:
+            raise web.HTTPNotFound()
+        query = urllib.parse.unquote_plus(match.group(1))
+        return self.maps_page(request, query=query, viewport=",".join(match.group(2, 3, 4)))
+
+    async def place(self, request):
+        match = re.search(r"0x1:0x([0-9a-f]+)", request.match_info["rest"])
+        if not match:
+            raise web.HTTPNotFound()
+        if self.throttle_rate:
+            if time.monotonic() < self._blocked_until or self.over_rate("maps", self.throttle_rate):
+                if time.monotonic() >= self._blocked_until:
+                    self._blocked_until = time.monotonic() + self.throttle_penalty
+                self.blocked["maps"] += 1
+                raise web.HTTPFound(f"/sorry/index?continue={urllib.parse.quote(str(request.url))}")
+            if self._capacity is None:
+                self._capacity = asyncio.Semaphore(self.throttle_capacity)
+            async with self._capacity:
+                await asyncio.sleep(self.detail_latency / 1000)
+        else:
+            await asyncio.sleep(self.detail_latency / 1000)
+        return self.maps_page(request, self.panel(int(match.group(1), 16)))
+
+    async def sorry(self, request):
+        return web.Response(text=SORRY_PAGE, status=429, content_type="text/html")
+
+    async def panel_fragment(self, request):
+        return web.Response(text=self.panel(int(request.match_info["i"])), content_type="text/html")
+
+    async def site(self, request):
+        i = int(request.match_info["i"])
+        if self.walled_every and i % self.walled_every == 1:
+            self.blocked["walled"] += 1
+            raise web.HTTPForbidden()
+        if self.site_rate and self.over_rate("sites", self.site_rate):
+            self.blocked["sites"] += 1
+            raise web.HTTPTooManyRequests()
+        await asyncio.sleep(self.site_latency / 1000)
+        rng = random.Random(i)
+        name = f"Business {i}"
+        if i % 10 == 5:
+            body = JS_SITE_PAGE.format(name=name, i=i)
+        else:
+            filler = " ".join(rng.choice(FILLER_WORDS) for _ in range(300))
+            body = SITE_PAGE.format(name=name, i=i, filler=filler)
+        return web.Response(text=body, content_type="text/html")
+
+    async def static(self, request):
+        await asyncio.sleep(self.site_latency / 1000)
+        if request.match_info["name"].endswith(".js"):
+            return web.Response(text="void 0;", content_type="application/javascript")
+        return web.Response(body=b"\0" * 50_000, content_type="image/jpeg")
+
+
+def route_maps_to(server):
+    """
+    Returns a BrowserPool context hook that answers www.google.com/maps and
+    /search requests from the fake server.
+    """
+    async def route(route):
+        url = route.request.url.replace("https://www.google.com", server.base_url, 1)
+        response = await route.fetch(url=url)
+        await route.fulfill(response=response)
+
+    async def hook(context):
+        await context.route(re.compile(r"^https://www\.google\.com/(?:maps|search)"), route)
+
+    return hook
+
+
+async def serve(args):
+    server = FakeMaps(args.places, args.batch, args.feed_latency, args.detail_latency, args.site_latency,
+                      shift_every=args.shift_every, cap=args.cap, throttle_rate=args.throttle_rate,
+                      throttle_capacity=args.throttle_capacity, throttle_penalty=args.throttle_penalty,
+                      site_rate=args.site_rate, walled_every=args.walled_every)
+    base_url = await server.start(port=args.port)
+    print(f"Fake Maps at {base_url}/maps")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the fake Maps pages and business sites.")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--places", type=int, default=300)
+    parser.add_argument("--batch", type=int, default=7)
+    parser.add_argument("--feed-latency", type=int, default=300)
+    parser.add_argument("--detail-latency", type=int, default=200)
+    parser.add_argument("--site-latency", type=int, default=50)
+    parser.add_argument("--shift-every", type=int, default=0)
+    parser.add_argument("--cap", type=int, default=120, help="places a viewport search shows at most")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="place pages per second before blocking")
+    parser.add_argument("--throttle-capacity", type=int, default=8, help="place pages served at once")
+    parser.add_argument("--throttle-penalty", type=float, default=2.0, help="seconds a blocked client stays blocked")
+    parser.add_argument("--site-rate", type=float, default=0, help="site requests per second before 429s")
+    parser.add_argument("--walled-every", type=int, default=0, help="every n-th site answers 403")
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+import logging
+import re
+import threading
+import time
+import weakref
+
+from metrics import histogram
+
+
+PAGE_LOAD_SECONDS = histogram("scraper_page_load_seconds", "Time to load a page, by block profile")
+
+# Typical transfer sizes used to estimate the bytes saved by a blocked request
+# when no request of that type was let through in this run
+TYPICAL_BYTES = {
+    "image": 40_000,
+    "media": 500_000,
+    "font": 30_000,
+    "stylesheet": 20_000,
+    "script": 60_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+    "other": 5_000,
+}
+
+TRACKER_DOMAINS = frozenset({
+    "google-analytics.com", "googletagmanager.com", "googlesyndication.com", "doubleclick.net",
+    "googleadservices.com", "facebook.net", "connect.facebook.net", "hotjar.com", "hotjar.io",
+    "segment.com", "segment.io", "mixpanel.com", "clarity.ms", "bing.com", "ads-twitter.com",
+    "linkedin.com", "licdn.com", "tiktok.com", "pinimg.com", "criteo.com", "taboola.com",
+    "outbrain.com", "newrelic.com", "nr-data.net", "fullstory.com", "intercom.io",
+    "intercomcdn.com", "crazyegg.com", "quantserve.com", "scorecardresearch.com", "yandex.ru",
+})
+
+
+@dataclass
+class BlockProfile:
+    """
+    Which requests to abort: by Playwright resource type, by URL pattern,
+    or by third-party host (a host under one of `third_party_domains` that
+    is not the page's own site).
+    """
+    name: str
+    resource_types: frozenset = frozenset()
+    url_patterns: list = field(default_factory=list)
+    third_party_domains: frozenset = frozenset()
+
+    def block_reason(self, resource_type, url, page_host=""):
+        if resource_type in self.resource_types:
+            return resource_type
+        for pattern in self.url_patterns:
+            if pattern.search(url):
+                return "url"
+        if self.third_party_domains:
+            host = (urlsplit(url).hostname or "").lower()
+            if host and not same_site(host, page_host) and domain_in(host, self.third_party_domains):
+                return "third_party"
+        return None
+
+
+def domain_in(host, domains):
+    parts = host.split(".")
+    return any(".".join(parts[i:]) in domains for i in range(len(parts) - 1))
+
+
+def same_site(host, page_host):
+    if not page_host:
+        return False
+    return host == page_host or host.endswith("." + page_host) or page_host.endswith("." + host)
+
+
+# Maps needs its scripts, styles and the search/feed XHRs, but not tiles,
+# photos, fonts, video or ad/log beacons
+MAPS_PROFILE = BlockProfile(
+    name="maps",
+    resource_types=frozenset({"image", "media", "font"}),
+    url_patterns=[
+        re.compile(r"/maps/vt[/?]"),
+        re.compile(r"//khms?\d*\.google"),
+        re.compile(r"streetviewpixels|/maps/preview/log|/gen_204|/log\?format="),
+        re.compile(r"//[^/]*googleusercontent\.com/(?:p|gps-cs-s|gps-proxy)/"),
+    ],
+    third_party_domains=TRACKER_DOMAINS,
+)
+
+# Business sites only need their HTML and the scripts that render it
+ENRICHMENT_PROFILE = BlockProfile(
+    name="enrichment",
+    resource_types=frozenset({"image", "media", "font", "stylesheet", "websocket", "eventsource", "manifest"}),
+    url_patterns=[re.compile(r"/(?:collect|beacon|pixel|track(?:ing)?)(?:[/?]|$)", re.IGNORECASE)],
+    third_party_domains=TRACKER_DOMAINS,
+)
+
+
+class TrafficStats:
+    """
+    Requests, bytes and blocked requests per block profile, aggregated over
+    all pages, plus an estimate of the bytes blocking saved.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pages = Counter()
+        self.requests = Counter()
+        self.bytes = Counter()
+        self.bytes_by_type = Counter()
+        self.requests_by_type = Counter()
+        self.blocked = Counter()
+
+    def record_page(self, profile):
+        with self._lock:
+            self.pages[profile] += 1
+
+    def record_request(self, profile, resource_type, size):
+        with self._lock:
+            self.requests[profile] += 1
+            self.bytes[profile] += size
+            self.requests_by_type[resource_type] += 1
+            self.bytes_by_type[resource_type] += size
+
+    def record_blocked(self, profile, reason, resource_type):
+        with self._lock:
+            self.blocked[(profile, reason, resource_type)] += 1
+
+    def estimated_bytes_saved(self, profile):
+        saved = 0
+        for (blocked_profile, _, resource_type), count in self.blocked.items():
+            if blocked_profile != profile:
+                continue
+            seen = self.requests_by_type[resource_type]
+            typical = self.bytes_by_type[resource_type] / seen if seen else TYPICAL_BYTES.get(resource_type, 5_000)
+            saved += count * typical
+        return int(saved)
+
+    def summary(self):
+        with self._lock:
+            return {
+                profile: {
+                    "pages": self.pages[profile],
+                    "requests": self.requests[profile],
+                    "bytes": self.bytes[profile],
+                    "blocked": sum(count for key, count in self.blocked.items() if key[0] == profile),
+                    "estimated_bytes_saved": self.estimated_bytes_saved(profile),
+                }
+                for profile in self.pages
+            }
+
+
+traffic_stats = TrafficStats()
+
+# Page -> PageTraffic of pages with blocking installed
+page_traffic = weakref.WeakKeyDictionary()
+
+
+class PageTraffic:
+    """
+    Requests, bytes and blocked requests of one page, also added to
+    `traffic_stats` as they happen.
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.requests = 0
+        self.bytes = 0
+        self.blocked = 0
+        traffic_stats.record_page(profile)
+
+    async def on_request_finished(self, request):
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            return
+        size = sizes["responseBodySize"] + sizes["responseHeadersSize"]
+        self.requests += 1
+        self.bytes += size
+        traffic_stats.record_request(self.profile, request.resource_type, size)
+
+    def on_blocked(self, reason, resource_type):
+        self.blocked += 1
+        traffic_stats.record_blocked(self.profile, reason, resource_type)
+
+    def on_close(self, page):
+        logging.debug(
+            f"{self.profile} page {page.url}: {self.requests} requests, {self.bytes} bytes, {self.blocked} blocked"
+        )
+
+
+def make_route_handler(profile, page_traffic):
+    async def handle(route):
+        request = route.request
+        page_host = ""
+        try:
+            page_host = (urlsplit(request.frame.page.url).hostname or "").lower()
+        except Exception:
+            pass
+        reason = profile.block_reason(request.resource_type, request.url, page_host)
+        if reason is None:
+            await route.fallback()
+            return
+        page_traffic.on_blocked(reason, request.resource_type)
+        await route.abort("blockedbyclient")
+
+    return handle
+
+
+def unblocked(profile):
+    """
+    A profile that blocks nothing but keeps the name, so its traffic and load
+    times can be compared with the blocking profile.
+    """
+    return BlockProfile(name=f"{profile.name}-unblocked")
+
+
+async def install_blocking(page, profile):
+    """
+    Aborts the requests `profile` blocks on this page and tracks its traffic.
+    Page routes take precedence over context routes, so each page can use
+    its own profile.
+    """
+    traffic = page_traffic[page] = PageTraffic(profile.name)
+    if profile.resource_types or profile.url_patterns or profile.third_party_domains:
+        await page.route("**/*", make_route_handler(profile, traffic))
+    page.on("requestfinished", traffic.on_request_finished)
+    page.on("close", traffic.on_close)
+    return traffic
+
+
+async def timed_goto(page, url, timeout=30000, wait_until="load"):
+    """
+    Navigates and records the load time under the page's block profile.
+    """
+    start = time.perf_counter()
+    response = await page.goto(url, timeout=timeout, wait_until=wait_until)
+    traffic = page_traffic.get(page)
+    PAGE_LOAD_SECONDS.observe(time.perf_counter() - start, profile=traffic.profile if traffic else "untracked")
+    return response
+
+
+def log_traffic_summary():
+    load_seconds = {}
+    for labels, series in PAGE_LOAD_SECONDS.series().items():
+        if series["count"]:
+            load_seconds[dict(labels)["profile"]] = series["sum"] / series["count"]
+    for profile, summary in traffic_stats.summary().items():
+        mean = load_seconds.get(profile)
+        mean_text = f", mean load {mean:.2f}s" if mean is not None else ""
+        logging.info(
+            f"{profile} traffic: {summary['pages']} pages, {summary['requests']} requests, "
+            f"{summary['bytes'] / 1e6:.1f} MB, {summary['blocked']} blocked "
+            f"(~{summary['estimated_bytes_saved'] / 1e6:.1f} MB saved){mean_text}"
+        )
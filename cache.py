@@ -0,0 +1,172 @@
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+
+# Words that do not change what Maps returns for a query
+QUERY_STOP_WORDS = {"in", "near", "at", "around", "the", "a", "an", "of", "me"}
+
+
+def normalize_query(search_term):
+    """
+    Lower-cases a search term, drops punctuation and stop words and sorts the
+    remaining words, so "Pizza in Brooklyn" and "brooklyn, pizza" share a key.
+    """
+    words = re.findall(r"\w+", search_term.lower())
+    return " ".join(sorted(word for word in words if word not in QUERY_STOP_WORDS))
+
+
+class ScrapeCache:
+    """
+    Persistent cache of scrape results in SQLite.
+
+    The query level maps a normalized search term and quantity to the ordered
+    place IDs it returned. The place level maps a place ID to its business
+    record, website enrichment included. The site level maps a website (see
+    enrich.site_key) to the contacts extracted from it, so branches sharing a
+    site reuse them, and the site_failure level remembers sites that were
+    dead or timed out. Each level has its own TTL (seconds) and maximum
+    number of rows; the least recently used rows are evicted first. `stats`
+    counts hits, misses, expirations and evictions per level.
+    """
+
+    def __init__(self, path="scrape_cache.sqlite3", query_ttl=6 * 3600, place_ttl=7 * 24 * 3600,
+                 max_queries=10_000, max_places=500_000, site_ttl=30 * 24 * 3600, site_failure_ttl=24 * 3600,
+                 max_sites=200_000):
+        self.path = path
+        self.ttl = {"query": query_ttl, "place": place_ttl, "site": site_ttl, "site_failure": site_failure_ttl}
+        self.max_rows = {"query": max_queries, "place": max_places, "site": max_sites, "site_failure": max_sites}
+        self.stats = {level: Counter() for level in self.ttl}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS query (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS query_accessed_at ON query (accessed_at);
+            CREATE TABLE IF NOT EXISTS place (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS place_accessed_at ON place (accessed_at);
+            CREATE TABLE IF NOT EXISTS site (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS site_accessed_at ON site (accessed_at);
+            CREATE TABLE IF NOT EXISTS site_failure (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS site_failure_accessed_at ON site_failure (accessed_at);
+            """
+        )
+        self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _get(self, level, key, max_age=None):
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT value, created_at FROM {level} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats[level]["misses"] += 1
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl[level]:
+                self._connection.execute(f"DELETE FROM {level} WHERE key = ?", (key,))
+                self._connection.commit()
+                self.stats[level]["expired"] += 1
+                self.stats[level]["misses"] += 1
+                return None
+            if max_age is not None and now - created_at > max_age:
+                # Still within the TTL, but older than this caller accepts
+                self.stats[level]["stale"] += 1
+                self.stats[level]["misses"] += 1
+                return None
+            self._connection.execute(f"UPDATE {level} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+            self.stats[level]["hits"] += 1
+            return json.loads(value)
+
+    def _put(self, level, key, value):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {level} (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            excess = self._connection.execute(f"SELECT COUNT(*) FROM {level}").fetchone()[0] - self.max_rows[level]
+            if excess > 0:
+                self._connection.execute(
+                    f"DELETE FROM {level} WHERE key IN "
+                    f"(SELECT key FROM {level} ORDER BY accessed_at LIMIT ?)",
+                    (excess,),
+                )
+                self.stats[level]["evictions"] += excess
+            self._connection.commit()
+
+    def query_key(self, search_term, quantity):
+        return f"{normalize_query(search_term)}|{quantity}"
+
+    def get_query(self, search_term, quantity):
+        """
+        Returns the cached place IDs for a query, in result order, or None.
+        """
+        return self._get("query", self.query_key(search_term, quantity))
+
+    def put_query(self, search_term, quantity, place_ids):
+        self._put("query", self.query_key(search_term, quantity), list(place_ids))
+
+    def get_place(self, place_id, max_age=None):
+        """
+        Returns the cached business record (a dict) for a place, or None.
+        With `max_age`, records scraped more than that many seconds ago
+        count as missing too.
+        """
+        return self._get("place", place_id, max_age)
+
+    def put_place(self, place_id, record):
+        self._put("place", place_id, record)
+
+    def get_site(self, key):
+        """
+        Returns the cached contacts record of a website, or None.
+        """
+        return self._get("site", key)
+
+    def put_site(self, key, record):
+        self._put("site", key, record)
+
+    def get_site_failure(self, key):
+        """
+        Returns why a website could not be read, when that happened within
+        the failure TTL, or None.
+        """
+        return self._get("site_failure", key)
+
+    def put_site_failure(self, key, reason):
+        self._put("site_failure", key, reason)
+
+    def log_stats(self):
+        levels = " ".join(f"{level}={dict(stats)}" for level, stats in self.stats.items())
+        logging.info(f"Scrape cache stats: {levels}")
@@ -0,0 +1,135 @@
+from dataclasses import asdict
+import json
+import logging
+import os
+import re
+import time
+
+from maps_json import MapsPlace
+
+
+JOB_ID = re.compile(r"^[\w.-]+$")
+
+
+class Checkpoint:
+    """
+    Durable progress log of one scrape job, so a rerun with the same job ID
+    only does the work that is missing. It is a JSON lines file of events:
+
+        place      a place ID was discovered (with its URL and decoded payload)
+        discovered discovery went through the whole feed
+        detail     a place's Maps fields were read, enrichment still to do
+        business   a place is finished, enrichment included
+        finished   the job completed
+
+    Events are fsynced every `fsync_every` events or `fsync_interval` seconds,
+    like the file sinks, and replayed when the same job is opened again.
+    """
+
+    def __init__(self, job_id, directory="checkpoints", fsync_every=20, fsync_interval=2.0):
+        if not JOB_ID.match(job_id):
+            raise ValueError(f"Invalid job ID: {job_id}")
+        self.job_id = job_id
+        self.path = os.path.join(directory, f"{job_id}.jsonl")
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.places = {}
+        self.decoded = {}
+        self.discovered = False
+        self.details = {}
+        self.businesses = {}
+        self.finished = False
+        os.makedirs(directory, exist_ok=True)
+        self._replay()
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def resumed(self):
+        return bool(self.places or self.businesses)
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # The last event of a crashed run may be cut off
+                    continue
+                self._apply(event)
+        logging.info(
+            f"Resuming job {self.job_id}: {len(self.places)} places seen, {len(self.businesses)} finished, "
+            f"{len(self.pending_enrichments())} waiting for enrichment"
+        )
+
+    def _apply(self, event):
+        kind = event["type"]
+        if kind == "place":
+            self.places[event["id"]] = event["url"]
+            if event.get("decoded"):
+                decoded = event["decoded"]
+                self.decoded[event["id"]] = MapsPlace(**{**decoded, "undecoded": set(decoded["undecoded"])})
+        elif kind == "discovered":
+            self.discovered = True
+        elif kind == "detail":
+            self.details[event["id"]] = (event["record"], event["website_url"])
+        elif kind == "business":
+            self.businesses[event["id"]] = event["record"]
+            self.details.pop(event["id"], None)
+        elif kind == "finished":
+            self.finished = True
+
+    def _append(self, event):
+        self._apply(event)
+        self._file.write(json.dumps(event) + "\n")
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.flush()
+
+    def add_place(self, place_id, url, decoded=None):
+        if place_id in self.places:
+            return
+        event = {"type": "place", "id": place_id, "url": url}
+        if decoded is not None:
+            event["decoded"] = {**asdict(decoded), "undecoded": sorted(decoded.undecoded)}
+        self._append(event)
+
+    def finish_discovery(self):
+        if not self.discovered:
+            self._append({"type": "discovered"})
+
+    def add_detail(self, place_id, record, website_url):
+        self._append({"type": "detail", "id": place_id, "record": record, "website_url": website_url})
+
+    def add_business(self, place_id, record):
+        self._append({"type": "business", "id": place_id, "record": record})
+
+    def finish(self):
+        self._append({"type": "finished"})
+        self.flush()
+
+    def pending_enrichments(self):
+        return [place_id for place_id in self.details if place_id not in self.businesses]
+
+    def flush(self):
+        if self._file.closed:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
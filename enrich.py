@@ -0,0 +1,340 @@
+import asyncio
+import ipaddress
+import logging
+import re
+from collections import Counter
+from contextlib import nullcontext
+from dataclasses import asdict
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from blocking import ENRICHMENT_PROFILE, install_blocking, timed_goto
+from extract import PageContacts, extract_contacts
+from metrics import counter, span
+from throttle import Blocked, Call
+
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+
+# Markers of client-side rendered apps whose static HTML is mostly an empty shell
+JS_APP_MARKERS = re.compile(
+    r'<div[^>]+id=["\'](?:root|app|__next|__nuxt|___gatsby)["\'][^>]*>\s*</div>'
+    r'|ng-app|data-reactroot|window\.__INITIAL_STATE__|You need to enable JavaScript',
+    re.IGNORECASE,
+)
+SCRIPT_TAG = re.compile(r"<script\b", re.IGNORECASE)
+TAG_OR_SCRIPT = re.compile(r"<script\b.*?</script>|<style\b.*?</style>|<[^>]+>", re.IGNORECASE | re.DOTALL)
+
+ENRICHMENT_TOTAL = counter("scraper_enrichment_total", "Business websites enriched, by the path that served them")
+
+# Paths of `served_by` that did not fetch the site
+REUSED = ("in_flight", "reused", "cache", "negative_cache")
+
+# Public suffixes with two labels, under which a business owns the third label
+MULTI_LABEL_SUFFIXES = frozenset({
+    "co.uk", "org.uk", "me.uk", "ltd.uk", "plc.uk", "com.au", "net.au", "org.au", "co.nz", "org.nz",
+    "co.za", "com.br", "com.mx", "com.ar", "co.jp", "co.in", "co.kr", "com.sg", "com.hk", "com.tr", "com.cn",
+})
+
+# Domains that host the pages of many unrelated businesses; a site there is
+# the whole host and path, not the domain
+SHARED_HOSTS = frozenset({
+    "facebook.com", "instagram.com", "linktr.ee", "business.site", "wixsite.com", "squarespace.com",
+    "godaddysites.com", "weebly.com", "wordpress.com", "blogspot.com", "square.site", "yelp.com",
+    "google.com", "sites.google.com", "tripadvisor.com", "ubereats.com", "doordash.com", "grubhub.com",
+    "booksy.com", "vagaro.com", "shopify.com", "myshopify.com", "carrd.co", "webflow.io", "github.io",
+})
+
+
+def looks_js_rendered(html):
+    """
+    Guess whether a page only shows its content after running JavaScript:
+    either a known app-shell marker, or lots of scripts and almost no text.
+    """
+    if not html:
+        return True
+    if JS_APP_MARKERS.search(html):
+        return True
+    text = TAG_OR_SCRIPT.sub(" ", html)
+    text_length = len(" ".join(text.split()))
+    return text_length < 200 and len(SCRIPT_TAG.findall(html)) >= 3
+
+
+def apply_contacts(business, contacts):
+    """
+    Copies extracted contacts onto a Business the same way for every fetch path.
+    """
+    social_media_links = contacts.social_media_links
+    business.email = contacts.emails
+    business.facebook = social_media_links.get("Facebook", "None")
+    business.instagram = social_media_links.get("Instagram", "None")
+    business.twitter = social_media_links.get("Twitter", "None")
+    business.linkedin = social_media_links.get("LinkedIn", "None")
+    business.youtube = social_media_links.get("YouTube", "None")
+    business.tiktok = social_media_links.get("TikTok", "None")
+
+
+def registrable_domain(host):
+    """
+    The domain a business registers for `host`: the last two labels, or
+    three under a two-label public suffix such as co.uk.
+    """
+    labels = host.split(".")
+    if len(labels) > 2 and ".".join(labels[-2:]) in MULTI_LABEL_SUFFIXES:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def site_key(url):
+    """
+    Identifies the website a URL belongs to, so the branches of a chain that
+    link different pages or tracking parameters of one site share it: the
+    registrable domain, or host and path for shared hosts and IP addresses.
+    """
+    parts = urlsplit(url if "//" in url else f"http://{url}")
+    host = (parts.hostname or "").lower().rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    try:
+        ipaddress.ip_address(host)
+        shared = True
+    except ValueError:
+        shared = host == "localhost" or "." not in host
+    domain = host if shared else registrable_domain(host)
+    if shared or domain in SHARED_HOSTS or host in SHARED_HOSTS:
+        path = parts.path.rstrip("/")
+        return f"{host}:{parts.port}{path}" if parts.port else f"{host}{path}"
+    return domain
+
+
+async def enrich_with_browser(context, url, timeout=30000, block_profile=ENRICHMENT_PROFILE, archive=None):
+    """
+    Opens the website in a new tab of the given browser context and extracts
+    contacts from the rendered page. Requests are filtered by `block_profile`,
+    so waiting for network idle does not wait for trackers and media.
+    The rendered HTML goes to `archive` (archive.Archive) when given.
+    """
+    page = await context.new_page()
+    try:
+        await install_blocking(page, block_profile)
+        with span("website_open", via="browser", url=url):
+            await timed_goto(page, url, timeout)
+            await page.wait_for_load_state("networkidle", timeout=timeout)
+            html = await page.content()
+        if archive is not None:
+            archive.add("site", site_key(url), url, html)
+        with span("contact_extraction"):
+            return extract_contacts(html)
+    finally:
+        await page.close()
+
+
+class WebsiteEnricher:
+    """
+    Fetches business homepages with a pooled HTTP client and only falls back
+    to a browser tab when the static HTML has no contacts and looks like it is
+    rendered by JavaScript.
+
+    Each site (see `site_key`) is read once: concurrent requests for it share
+    one fetch, later ones reuse its contacts, and with a `cache`
+    (cache.ScrapeCache) so do later runs, within the cache's site TTL. Sites
+    that were dead or timed out are not tried again within its failure TTL.
+
+    `served_by` counts which path served each site: "http", "browser",
+    "empty" (nothing found) or "failed" when it was fetched, and
+    "in_flight", "reused", "cache" or "negative_cache" when it was not.
+
+    With a `budget` (throttle.Budget), every site visit takes one of its
+    slots and 429 responses count as blocks. With an `archive`
+    (archive.Archive), the HTML of every site read is archived.
+    """
+
+    def __init__(self, limit=100, limit_per_host=4, timeout=15, max_body_size=2_000_000, browser_fallback=True,
+                 block_profile=ENRICHMENT_PROFILE, budget=None, cache=None, archive=None):
+        self.limit = limit
+        self.budget = budget
+        self.cache = cache
+        self.archive = archive
+        self.block_profile = block_profile
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.max_body_size = max_body_size
+        self.browser_fallback = browser_fallback
+        self.served_by = Counter()
+        self._session = None
+        self._in_flight = {}
+        self._sites = {}
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": USER_AGENT},
+            )
+
+    async def close(self):
+        for task in list(self._in_flight.values()):
+            task.cancel()
+        await asyncio.gather(*self._in_flight.values(), return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            logging.info(f"Website enrichment served by: {dict(self.served_by)}; {self.report()}")
+
+    def report(self):
+        """
+        Sites fetched and fetches avoided by sharing, reuse and the cache.
+        """
+        avoided = sum(self.served_by[served_by] for served_by in REUSED)
+        total = sum(self.served_by.values())
+        return {
+            "requests": total,
+            "fetched": total - avoided,
+            "avoided": avoided,
+            "avoided_share": avoided / total if total else 0.0,
+            **{served_by: self.served_by[served_by] for served_by in REUSED},
+        }
+
+    async def fetch(self, url):
+        """
+        Returns the HTML of a page, truncated at `max_body_size` bytes, or None
+        when the response is not an HTML page.
+        """
+        await self.open()
+        async with self._session.get(url, allow_redirects=True) as response:
+            # Only a rate limit means the budget is going too fast; a 403 or
+            # 503 is one site refusing us, and fails just that site
+            if response.status == 429:
+                raise Blocked("status_429")
+            response.raise_for_status()
+            if "html" not in response.headers.get("Content-Type", "text/html"):
+                return None
+            body = bytearray()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                body.extend(chunk)
+                if len(body) >= self.max_body_size:
+                    del body[self.max_body_size:]
+                    break
+            return body.decode(response.charset or "utf-8", errors="replace")
+
+    def count(self, served_by):
+        self.served_by[served_by] += 1
+        ENRICHMENT_TOTAL.inc(served_by=served_by)
+
+    async def enrich(self, business, url, context=None):
+        """
+        Fills the email and social media fields of `business` from its website.
+        `context` is the browser context used for the JS-rendered fallback.
+        """
+        apply_contacts(business, await self.site_contacts(url, context) or PageContacts())
+        return business
+
+    async def site_contacts(self, url, context=None):
+        """
+        Returns the contacts of the site `url` belongs to, or None when it
+        could not be read, fetching each site at most once.
+        """
+        key = site_key(url)
+        if key in self._sites:
+            self.count("reused")
+            return self._sites[key]
+        if key in self._in_flight:
+            self.count("in_flight")
+            return await asyncio.shield(self._in_flight[key])
+        if self.cache is not None:
+            if self.cache.get_site_failure(key) is not None:
+                self.count("negative_cache")
+                self._sites[key] = None
+                return None
+            record = self.cache.get_site(key)
+            if record is not None:
+                self.count("cache")
+                self._sites[key] = PageContacts(**record)
+                return self._sites[key]
+
+        task = asyncio.ensure_future(self._read_site(key, url, context))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _read_site(self, key, url, context):
+        try:
+            async with self.budget.slot() if self.budget is not None else nullcontext(Call()) as call:
+                contacts, failure = await self._fetch_contacts(url, context, call)
+        except Blocked as e:
+            # Throttled, not dead: another business may try the site again
+            logging.warning(f"Website blocked for {url}: {e.reason}")
+            self.count("failed")
+            return None
+
+        self._sites[key] = contacts
+        if self.cache is not None:
+            if contacts is not None:
+                self.cache.put_site(key, asdict(contacts))
+            elif failure:
+                self.cache.put_site_failure(key, failure)
+        return contacts
+
+    async def _fetch_contacts(self, url, context, call):
+        """
+        Returns the contacts of a site and, when it could not be read at all,
+        why: a timeout or the error of a dead site.
+        """
+        html = None
+        failure = None
+        try:
+            with span("website_open", via="http", url=url):
+                html = await self.fetch(url)
+        except Blocked:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError, LookupError) as e:
+            if isinstance(e, asyncio.TimeoutError):
+                call.outcome = "timeout"
+                failure = "timeout"
+            else:
+                failure = f"{type(e).__name__}: {e}"
+            logging.warning(f"HTTP fetch failed for {url}: {e}")
+
+        contacts = None
+        if html and self.archive is not None:
+            self.archive.add("site", site_key(url), url, html)
+        if html:
+            with span("contact_extraction"):
+                contacts = extract_contacts(html)
+        if contacts and contacts.has_contacts():
+            self.count("http")
+            return contacts, None
+
+        # Only a page that answered can be rendered; dead and timed-out sites
+        # would just cost the browser's own, longer timeout
+        if self.browser_fallback and context is not None and html is not None and looks_js_rendered(html):
+            try:
+                contacts = await enrich_with_browser(context, url, block_profile=self.block_profile,
+                                                     archive=self.archive)
+                self.count("browser")
+                return contacts, None
+            except Exception as e:
+                logging.error(f"Error retrieving social media links: {e}")
+
+        if contacts is not None:
+            self.count("empty")
+            return contacts, None
+        self.count("failed")
+        return None, failure
@@ -0,0 +1,186 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from urllib.parse import unquote, urlsplit
+
+import lxml.html
+from lxml import etree
+
+from metrics import log_sampled
+
+
+EMAIL_PATTERN = re.compile(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}")
+
+# "name [at] domain [dot] com", "name(at)domain(dot)com", "name {at} domain.com"
+OBFUSCATED_EMAIL_PATTERN = re.compile(
+    r"([a-zA-Z0-9._%+-]+)\s*[\[\(\{]\s*at\s*[\]\)\}]\s*"
+    r"([a-zA-Z0-9-]+(?:(?:\s*[\[\(\{]\s*dot\s*[\]\)\}]\s*|\.)[a-zA-Z0-9-]+)+)",
+    re.IGNORECASE,
+)
+OBFUSCATED_DOT_PATTERN = re.compile(r"\s*[\[\(\{]\s*dot\s*[\]\)\}]\s*", re.IGNORECASE)
+# lxml rejects decoded text that still declares an encoding, as XHTML pages do
+XML_DECLARATION_PATTERN = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+# Platform name -> pattern matched against the host of each link. The first
+# link found for a platform wins. Adding a platform here does not add a pass.
+SOCIAL_PLATFORMS = {
+    "Facebook": re.compile(r"(?:^|\.)(?:facebook\.com|fb\.com)$"),
+    "Instagram": re.compile(r"(?:^|\.)instagram\.com$"),
+    "Twitter": re.compile(r"(?:^|\.)(?:twitter\.com|x\.com)$"),
+    "LinkedIn": re.compile(r"(?:^|\.)linkedin\.com$"),
+    "YouTube": re.compile(r"(?:^|\.)(?:youtube\.com|youtu\.be)$"),
+    "TikTok": re.compile(r"(?:^|\.)tiktok\.com$"),
+}
+
+SKIPPED_TEXT_TAGS = {"script", "style", "noscript", "template"}
+
+# Elements that start a new line of text. Text in any other element (b, span,
+# a...) is separated from its neighbours by a space, except where the boundary
+# touches "@", so "<b>info</b>@shop.com" stays one email.
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "body", "br", "button", "dd", "div", "dl", "dt", "fieldset",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "head", "header", "hr", "html",
+    "li", "main", "nav", "ol", "option", "p", "pre", "section", "select", "table", "td", "textarea", "th", "title",
+    "tr", "ul",
+}
+
+# Fields of a Maps place panel; the scraper and the archive re-extraction read the same ones
+PLACE_PANEL_XPATH = '//div[@role="main" and @aria-label]'
+ADDRESS_XPATH = '//button[@data-item-id="address"]//div[contains(@class, "fontBodyMedium")]'
+WEBSITE_XPATH = '//a[@data-item-id="authority"]//div[contains(@class, "fontBodyMedium")]'
+PHONE_NUMBER_XPATH = '//button[contains(@data-item-id, "phone:tel:")]//div[contains(@class, "fontBodyMedium")]'
+WEBSITE_URL_XPATH = '//a[@data-item-id="authority"]'
+
+
+@dataclass
+class PageContacts:
+    """
+    Contacts found on one page. Platforms that were not found are "None",
+    like the social media fields of a Business.
+    """
+    emails: list[str] = field(default_factory=list)
+    social_media_links: dict[str, str] = field(
+        default_factory=lambda: {platform: "None" for platform in SOCIAL_PLATFORMS}
+    )
+
+    def has_contacts(self):
+        return bool(self.emails) or any(link != "None" for link in self.social_media_links.values())
+
+
+def social_platform(href):
+    """
+    Returns the platform a link points to, or None.
+    """
+    try:
+        host = (urlsplit(href).hostname or "").lower()
+    except ValueError:
+        return None
+    if not host:
+        return None
+    for platform, pattern in SOCIAL_PLATFORMS.items():
+        if pattern.search(host):
+            return platform
+    return None
+
+
+def deobfuscate_emails(text):
+    return [
+        f"{local}@{OBFUSCATED_DOT_PATTERN.sub('.', domain)}"
+        for local, domain in OBFUSCATED_EMAIL_PATTERN.findall(text)
+    ]
+
+
+def extract_contacts(content):
+    """
+    Parses an HTML document once and collects emails (from text, mailto: links
+    and common obfuscations) and social media links in a single tree walk.
+    """
+    contacts = PageContacts()
+    if not content:
+        return contacts
+
+    try:
+        root = lxml.html.document_fromstring(XML_DECLARATION_PATTERN.sub("", content, count=1))
+    except (etree.ParserError, ValueError) as e:
+        logging.error(f"Error while parsing page: {e}")
+        return contacts
+
+    emails = {}
+    texts = []
+
+    def add(text, joined=False):
+        if texts and not joined and not (
+            texts[-1][-1:].isspace() or text[:1].isspace() or texts[-1][-1:] == "@" or text[:1] == "@"
+        ):
+            texts.append(" ")
+        texts.append(text)
+
+    for event, element in etree.iterwalk(root, events=("start", "end", "comment", "pi")):
+        tag = element.tag
+        if event == "end":
+            if tag in BLOCK_TAGS:
+                texts.append("\n")
+            if element.tail:
+                add(element.tail)
+            continue
+        if not isinstance(tag, str):
+            # Comments and processing instructions do not render: their tail
+            # continues the text before them
+            if element.tail:
+                add(element.tail, joined=True)
+            continue
+
+        if tag == "a":
+            href = (element.get("href") or "").strip()
+            if href[:7].lower() == "mailto:":
+                address = unquote(href[7:].split("?", 1)[0]).strip()
+                for email in EMAIL_PATTERN.findall(address):
+                    emails.setdefault(email, None)
+            elif href:
+                platform = social_platform(href)
+                if platform and contacts.social_media_links[platform] == "None":
+                    contacts.social_media_links[platform] = href
+
+        if tag in BLOCK_TAGS:
+            texts.append("\n")
+        if element.text and tag not in SKIPPED_TEXT_TAGS:
+            add(element.text)
+
+    text = "".join(texts)
+    for email in EMAIL_PATTERN.findall(text):
+        emails.setdefault(email, None)
+    for email in deobfuscate_emails(text):
+        emails.setdefault(email, None)
+
+    contacts.emails = list(emails)
+    log_sampled(lambda: f"Emails found: {', '.join(contacts.emails)}; social media links found: {contacts.social_media_links}")
+    return contacts
+
+
+def parse_place_panel(content):
+    """
+    Reads the fields of a Maps place panel from its saved HTML, the way the
+    scraper reads them from the live page. Returns a dict with name, address,
+    website, phone_number and website_url ("" or None when missing).
+    """
+    fields = {"name": "", "address": "", "website": "", "phone_number": "", "website_url": None}
+    if not content:
+        return fields
+    try:
+        root = lxml.html.document_fromstring(content)
+    except (etree.ParserError, ValueError) as e:
+        logging.error(f"Error while parsing place panel: {e}")
+        return fields
+
+    def text(xpath):
+        found = root.xpath(xpath)
+        return " ".join(found[0].text_content().split()) if found else ""
+
+    panel = root.xpath(PLACE_PANEL_XPATH)
+    fields["name"] = panel[0].get("aria-label", "") if panel else ""
+    fields["address"] = text(ADDRESS_XPATH)
+    fields["website"] = text(WEBSITE_XPATH)
+    fields["phone_number"] = text(PHONE_NUMBER_XPATH)
+    links = root.xpath(WEBSITE_URL_XPATH)
+    fields["website_url"] = links[0].get("href") if links else None
+    return fields
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, field
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+
+from checkpoint import Checkpoint
+from scraper import main
+from throttle import Throttle
+
+
+@dataclass
+class Job:
+    id: str
+    search_term: str
+    quantity: int
+    bounds: object = None
+    status: str = "queued"
+    results: list = field(default_factory=list)
+    error: str = ""
+    created_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+    _condition: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def add(self, business):
+        with self._condition:
+            self.results.append(business)
+            self._condition.notify_all()
+
+    def set_status(self, status, error=""):
+        with self._condition:
+            self.status = status
+            self.error = error
+            if status == "running":
+                self.started_at = time.time()
+            elif self.finished:
+                self.finished_at = time.time()
+            self._condition.notify_all()
+
+    def to_dict(self, include_results=False):
+        data = {
+            "id": self.id,
+            "search_term": self.search_term,
+            "quantity": self.quantity,
+            "bounds": asdict(self.bounds) if self.bounds else None,
+            "status": self.status,
+            "count": len(self.results),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if include_results:
+            data["results"] = [asdict(business) for business in self.results]
+        return data
+
+    def events(self, keepalive=15):
+        """
+        Yields server-sent events: one "business" event per result (including
+        the ones already scraped), a comment every `keepalive` seconds without
+        news, and a final "status" event when the job finishes.
+        """
+        sent = 0
+        while True:
+            with self._condition:
+                if sent == len(self.results) and not self.finished:
+                    self._condition.wait(timeout=keepalive)
+                new_results = self.results[sent:]
+                finished = self.finished
+            for business in new_results:
+                yield f"event: business\ndata: {json.dumps(asdict(business))}\n\n"
+            sent += len(new_results)
+            if finished and sent == len(self.results):
+                yield f"event: status\ndata: {json.dumps(self.to_dict())}\n\n"
+                return
+            if not new_results:
+                yield ": keepalive\n\n"
+
+
+class JobManager:
+    """
+    Runs scrapes as background jobs on the browser pool's event loop.
+    `submit` returns a Job at once; at most `max_concurrent_jobs` run at the
+    same time and the others wait in order. The latest `max_finished_jobs`
+    finished jobs are kept with their results.
+
+    With `checkpoint_dir`, every job logs its progress there, and submitting
+    the ID of an unfinished job again resumes it instead of starting over.
+    All jobs share one throttle, since Maps throttles the machine, not a job.
+    With an `archive` (archive.Archive), the pages jobs read are archived.
+    """
+
+    def __init__(self, pool, cache=None, workers=1, max_rate=None, max_concurrent_jobs=2, max_finished_jobs=100,
+                 checkpoint_dir=None, freshness=None, archive=None):
+        self.pool = pool
+        self.cache = cache
+        self.workers = workers
+        self.max_rate = max_rate
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_finished_jobs = max_finished_jobs
+        self.checkpoint_dir = checkpoint_dir
+        self.freshness = freshness
+        self.archive = archive
+        self.throttle = Throttle(maps_concurrency=max(1, workers) * max_concurrent_jobs, max_rate=max_rate)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._semaphore = None
+
+    def submit(self, search_term, quantity, bounds=None, job_id=None):
+        with self._lock:
+            existing = self._jobs.get(job_id)
+            if existing is not None and not existing.finished:
+                return existing
+            job = Job(job_id or uuid.uuid4().hex, search_term, quantity, bounds)
+            self._jobs.pop(job.id, None)
+            self._jobs[job.id] = job
+            self._evict_finished()
+        self.pool.submit(self._run(job))
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    async def _run(self, job):
+        # Created here so it belongs to the pool's event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_jobs)
+        async with self._semaphore:
+            job.set_status("running")
+            checkpoint = Checkpoint(job.id, self.checkpoint_dir) if self.checkpoint_dir else None
+            try:
+                business_list = await main(
+                    job.search_term, job.quantity, self.workers, self.max_rate,
+                    self.cache, self.pool, on_business=job.add, bounds=job.bounds,
+                    checkpoint=checkpoint, freshness=self.freshness, throttle=self.throttle, archive=self.archive,
+                )
+                if business_list.error:
+                    job.set_status("failed", business_list.error)
+                else:
+                    job.set_status("done")
+            except Exception as e:
+                logging.error(f"Job {job.id} failed: {e}")
+                job.set_status("failed", str(e))
+            finally:
+                if checkpoint is not None:
+                    checkpoint.close()
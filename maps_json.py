@@ -0,0 +1,229 @@
+from dataclasses import dataclass, field
+from urllib.parse import parse_qs, urlsplit
+import asyncio
+import json
+import logging
+import re
+
+from metrics import counter
+
+
+PLACE_EXTRACTIONS = counter("scraper_place_extractions_total", "Places extracted, by where their fields came from")
+
+# Responses of the Maps web client that carry place data
+PAYLOAD_URL = re.compile(r"^https://www\.google\.[a-z.]+/(?:search\?(?:.*&)?tbm=map|maps/(?:preview/place|search)\b)")
+
+XSSI_PREFIX = ")]}'"
+DATA_ID = re.compile(r"^0x[0-9a-f]+:0x[0-9a-f]+$")
+PLACE_ID = re.compile(r"^ChIJ[\w-]+$")
+
+# Where each field sits in a place array, most likely path first. The layout
+# is not documented and shifts between client versions, so each field has
+# alternatives and every step is type-checked.
+FIELD_PATHS = {
+    "address": [(39,), (2,), (18,)],
+    "website_url": [(7, 0)],
+    "website": [(7, 1)],
+    "phone_number": [(178, 0, 0), (178, 0, 1, 1, 0)],
+    "place_id": [(78,)],
+}
+
+# Fields the DOM fallback can read; the others only help matching
+DOM_FIELDS = ("address", "website", "phone_number")
+
+# Marks a path the payload does not have the shape for (as opposed to a null value)
+UNDECODABLE = object()
+
+
+@dataclass
+class MapsPlace:
+    """
+    A place decoded from a Maps payload. `undecoded` names the fields whose
+    path had an unexpected shape; those are read from the DOM instead.
+    """
+    data_id: str
+    name: str = ""
+    address: str = None
+    website: str = None
+    website_url: str = None
+    phone_number: str = None
+    place_id: str = None
+    undecoded: set = field(default_factory=set)
+
+
+def load_payload(text):
+    """
+    Decodes a Maps response body: strips the XSSI guard, unwraps the
+    {"d": "..."} envelope of search responses and the trailing /*""*/.
+    Returns None when the body is not JSON.
+    """
+    text = text.strip()
+    if text.endswith('/*""*/'):
+        text = text[:-6]
+    if text.startswith(XSSI_PREFIX):
+        text = text[len(XSSI_PREFIX):]
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if isinstance(data, dict) and isinstance(data.get("d"), str):
+        return load_payload(data["d"])
+    return data
+
+
+def dig(data, path):
+    """
+    Follows `path` through nested lists. Returns None when a list ends early
+    or holds null on the way (the client drops empty trailing entries), and
+    UNDECODABLE when a step is not a list at all.
+    """
+    for index in path:
+        if data is None:
+            return None
+        if not isinstance(data, list):
+            return UNDECODABLE
+        if index >= len(data):
+            return None
+        data = data[index]
+    return data
+
+
+def is_place(data):
+    return (
+        isinstance(data, list) and len(data) > 11
+        and isinstance(data[10], str) and DATA_ID.match(data[10]) is not None
+        and isinstance(data[11], str) and data[11] != ""
+    )
+
+
+def find_places(data, depth=0, max_depth=12):
+    """
+    Yields every place array in a decoded payload, wherever the client nests it.
+    """
+    if not isinstance(data, list) or depth > max_depth:
+        return
+    if is_place(data):
+        yield data
+        return
+    for item in data:
+        if isinstance(item, list):
+            yield from find_places(item, depth + 1, max_depth)
+
+
+def unwrap_redirect(url):
+    parts = urlsplit(url)
+    if parts.path == "/url":
+        target = parse_qs(parts.query).get("q")
+        if target:
+            return target[0]
+    return url
+
+
+def field_value(place, name):
+    """
+    Returns the first path of `name` that holds a string, None when the place
+    has no value for it, or UNDECODABLE when no path has the expected shape.
+    """
+    result = UNDECODABLE
+    for path in FIELD_PATHS[name]:
+        value = dig(place, path)
+        if isinstance(value, str):
+            return value.strip()
+        if isinstance(value, list) and value and all(isinstance(part, str) for part in value):
+            return ", ".join(part.strip() for part in value)
+        if value is None and result is UNDECODABLE:
+            result = None
+    return result
+
+
+def decode_place(place):
+    decoded = MapsPlace(data_id=place[10], name=place[11].strip())
+    for name in ("address", "website_url", "website", "phone_number", "place_id"):
+        value = field_value(place, name)
+        if value is UNDECODABLE:
+            decoded.undecoded.add(name)
+        else:
+            setattr(decoded, name, value)
+
+    if decoded.website_url:
+        decoded.website_url = unwrap_redirect(decoded.website_url)
+        if not decoded.website:
+            decoded.website = urlsplit(decoded.website_url).hostname
+    if decoded.place_id is not None and not PLACE_ID.match(decoded.place_id):
+        decoded.place_id = None
+    if "website_url" in decoded.undecoded:
+        decoded.undecoded.add("website")
+    decoded.undecoded = {name for name in decoded.undecoded if name in DOM_FIELDS}
+    return decoded
+
+
+def parse_places(text):
+    """
+    Returns the places of a Maps response body as MapsPlace records; bodies
+    that do not decode yield no places.
+    """
+    data = load_payload(text)
+    places = []
+    for place in find_places(data):
+        try:
+            places.append(decode_place(place))
+        except Exception as e:
+            logging.debug(f"Skipping undecodable place: {e}")
+    return places
+
+
+class ResponseInterceptor:
+    """
+    Collects the places of the Maps responses a page receives, keyed by data
+    ID and place ID (the IDs place URLs carry). With an `archive`
+    (archive.Archive), the response bodies are archived as well.
+    """
+
+    def __init__(self, archive=None):
+        self.archive = archive
+        self.places = {}
+        self.responses = 0
+        self._pending = set()
+
+    def attach(self, page):
+        page.on("response", self.on_response)
+
+    def detach(self, page):
+        page.remove_listener("response", self.on_response)
+
+    def on_response(self, response):
+        if not PAYLOAD_URL.match(response.url):
+            return
+        task = asyncio.ensure_future(self._read(response))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _read(self, response):
+        try:
+            text = await response.text()
+        except Exception as e:
+            logging.debug(f"Could not read Maps response {response.url}: {e}")
+            return
+        if self.archive is not None:
+            self.archive.add("payload", response.url, response.url, text)
+        self.add(text)
+
+    def add(self, text):
+        places = parse_places(text)
+        self.responses += 1
+        for place in places:
+            self.places[place.data_id] = place
+            if place.place_id:
+                self.places[place.place_id] = place
+        return places
+
+    async def settle(self):
+        """
+        Waits until the responses received so far are decoded, so the links
+        they rendered can be matched with their places.
+        """
+        if self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    def get(self, place_key):
+        return self.places.get(place_key) if place_key else None
@@ -0,0 +1,277 @@
+from contextlib import contextmanager
+import bisect
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram of observed values (seconds by default),
+    kept separately for each combination of label values.
+    """
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def quantile(self, q, **labels):
+        """
+        Estimates the q-quantile (0..1) of the series matching `labels`
+        (all series when none are given) by linear interpolation within
+        buckets, like Prometheus' histogram_quantile.
+        """
+        wanted = set(labels.items())
+        counts = [0] * (len(self.buckets) + 1)
+        for key, series in self.series().items():
+            if wanted <= set(key):
+                counts = [a + b for a, b in zip(counts, series["counts"])]
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    return lower
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def series(self):
+        """
+        Returns {labels: {"counts", "sum", "count"}} where labels is a tuple of
+        (name, value) pairs and counts are per bucket, the last one being +Inf.
+        """
+        with self._lock:
+            return {
+                key: {"counts": list(series["counts"]), "sum": series["sum"], "count": series["count"]}
+                for key, series in self._series.items()
+            }
+
+
+class Counter:
+    """
+    Monotonic counter, kept separately for each combination of label values.
+    """
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def series(self):
+        with self._lock:
+            return dict(self._series)
+
+
+histograms = {}
+counters = {}
+collectors = []
+_registry_lock = threading.Lock()
+
+
+def histogram(name, description, buckets=DEFAULT_BUCKETS):
+    """
+    Returns the process-wide histogram with this name, creating it on first use.
+    """
+    with _registry_lock:
+        if name not in histograms:
+            histograms[name] = Histogram(name, description, buckets)
+        return histograms[name]
+
+
+def counter(name, description):
+    """
+    Returns the process-wide counter with this name, creating it on first use.
+    """
+    with _registry_lock:
+        if name not in counters:
+            counters[name] = Counter(name, description)
+        return counters[name]
+
+
+def register_collector(collect):
+    """
+    Adds a callable that returns extra samples for /metrics as a list of
+    (name, type, description, {labels tuple: value}), for state that is
+    already counted elsewhere (cache stats, parser layers, traffic).
+    """
+    with _registry_lock:
+        collectors.append(collect)
+
+
+SPAN_SECONDS = histogram("scraper_span_seconds", "Duration of instrumented scraper phases")
+SPANS_TOTAL = counter("scraper_spans_total", "Instrumented scraper phases by outcome")
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """
+    Span records of one run, written as JSON to `path` by `write()`.
+    """
+
+    def __init__(self, path, **attributes):
+        self.path = path
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, start, seconds, outcome, labels):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start": start - self.started_at,
+                "seconds": seconds,
+                "outcome": outcome,
+                **({"labels": labels} if labels else {}),
+            })
+
+    def write(self):
+        with self._lock:
+            data = {"started_at": self.started_at, **self.attributes, "spans": self.spans}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        logging.info(f"Wrote trace with {len(data['spans'])} spans to {self.path}")
+
+
+def start_trace(name, **attributes):
+    """
+    Starts a per-run trace when SCRAPER_TRACE_DIR is set and returns it (or
+    None). Spans in this task and the tasks it creates are recorded in it.
+    """
+    trace_dir = os.getenv("SCRAPER_TRACE_DIR")
+    if not trace_dir:
+        return None
+    slug = re.sub(r"[^\w-]+", "-", name).strip("-")[:60]
+    trace = Trace(os.path.join(trace_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}.json"), **attributes)
+    current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def span(name, **labels):
+    """
+    Times a block: feeds SPAN_SECONDS and SPANS_TOTAL (labelled by span name
+    only) and, when a trace is active, records the span with its labels.
+    """
+    start = time.time()
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        SPAN_SECONDS.observe(seconds, span=name)
+        SPANS_TOTAL.inc(span=name, outcome=outcome)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add(name, start, seconds, outcome, labels)
+
+
+# Share of per-record debug lines that are logged, so debug logging stays cheap at volume
+LOG_SAMPLE_RATE = float(os.getenv("SCRAPER_LOG_SAMPLE_RATE", "0.01"))
+
+
+def log_sampled(message):
+    """
+    Logs at debug level for a sample of calls. `message` is a callable so the
+    text is only built when the line is actually logged.
+    """
+    if LOG_SAMPLE_RATE > 0 and logging.getLogger().isEnabledFor(logging.DEBUG) and random.random() < LOG_SAMPLE_RATE:
+        logging.debug(message())
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def render_prometheus():
+    """
+    Renders all histograms, counters and collector samples in the Prometheus
+    text exposition format.
+    """
+    lines = []
+    with _registry_lock:
+        registered_histograms = list(histograms.values())
+        registered_counters = list(counters.values())
+        registered_collectors = list(collectors)
+
+    for metric in registered_histograms:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} histogram")
+        for labels, series in sorted(metric.series().items()):
+            cumulative = 0
+            for bound, count in zip(metric.buckets, series["counts"]):
+                cumulative += count
+                lines.append(f"{metric.name}_bucket{format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{metric.name}_bucket{format_labels(labels, [('le', '+Inf')])} {series['count']}")
+            lines.append(f"{metric.name}_sum{format_labels(labels)} {series['sum']}")
+            lines.append(f"{metric.name}_count{format_labels(labels)} {series['count']}")
+
+    for metric in registered_counters:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} counter")
+        for labels, value in sorted(metric.series().items()):
+            lines.append(f"{metric.name}{format_labels(labels)} {value}")
+
+    for collect in registered_collectors:
+        try:
+            samples = collect()
+        except Exception as e:
+            logging.error(f"Error collecting metrics: {e}")
+            continue
+        for name, metric_type, description, values in samples:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(values.items()):
+                lines.append(f"{name}{format_labels(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
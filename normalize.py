@@ -0,0 +1,419 @@
+"""
+Columnar clean-up of scraped businesses, run over BusinessList.dataframe()
+or a saved dataset instead of record by record.
+
+Every step is a pandas operation over whole columns (string methods,
+explode, groupby), so millions of rows take seconds:
+
+    phones     free-form numbers to E.164, with a default country code
+    websites   display text and URLs to canonical URLs without tracking
+               parameters, plus their domain
+    socials    profile links to canonical URLs and handles; share buttons
+               and other non-profile links are dropped
+    emails     lists, "; "-joined and stringified lists exploded to one
+               validated, lowercased address per row
+    duplicates businesses linked by place ID, name and address, phone and
+               street, or domain and street are merged into one
+
+    python normalize.py results.jsonl -o clean.parquet --emails emails.parquet
+"""
+from dataclasses import dataclass, field
+import argparse
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from scraper import PLACE_ID_PATTERN
+from sinks import BUSINESS_FIELDS
+
+
+SOCIAL_FIELDS = ["facebook", "instagram", "twitter", "linkedin", "youtube", "tiktok"]
+
+# Values the scraper writes for "nothing found"
+MISSING = ["", "None", "none", "nan", "N/A", "[]"]
+
+PHONE_EXTENSION = r"(?i)\s*(?:ext\.?|extension|x|#)\s*\d+\s*$"
+E164 = r"^\+[1-9]\d{6,14}$"
+# North American numbers: area code and exchange do not start with 0 or 1
+NANP = r"^\+1[2-9]\d{2}[2-9]\d{6}$"
+
+URL_PARTS = (
+    r"^(?:(?P<scheme>[A-Za-z][A-Za-z0-9+.-]*)://)?(?P<host>[^/?#:\s]+)(?::(?P<port>\d+))?"
+    r"(?P<path>[^?#\s]*)(?:\?(?P<query>[^#\s]*))?"
+)
+HOSTNAME = r"^(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,63}$|^\d{1,3}(?:\.\d{1,3}){3}$"
+TRACKING_PARAMETER = r"(?:^|&)(?:utm_[^&=]*|fbclid|gclid|msclkid|mc_cid|mc_eid|y_source|_ga|ref|referrer)=[^&]*"
+
+# Platform -> (host pattern, profile path pattern, canonical URL prefix, paths that are not profiles)
+SOCIAL_PROFILES = {
+    "facebook": (r"(?:[a-z0-9-]+\.)*(?:facebook\.com|fb\.com)", r"/(?:pg/)?([A-Za-z0-9.\-_]{2,})",
+                 "https://www.facebook.com/",
+                 ["sharer", "sharer.php", "share", "share.php", "dialog", "plugins", "tr", "login", "events",
+                  "watch", "groups", "hashtag", "photo.php", "profile.php", "people", "pages", "home.php"]),
+    "instagram": (r"(?:[a-z0-9-]+\.)*instagram\.com", r"/([A-Za-z0-9._]{1,30})", "https://www.instagram.com/",
+                  ["p", "reel", "reels", "explore", "stories", "accounts", "tv", "direct"]),
+    "twitter": (r"(?:[a-z0-9-]+\.)*(?:twitter\.com|x\.com)", r"/@?([A-Za-z0-9_]{1,15})", "https://x.com/",
+                ["intent", "share", "home", "search", "hashtag", "i", "login", "widgets"]),
+    "linkedin": (r"(?:[a-z0-9-]+\.)*linkedin\.com", r"/((?:company|in|school|showcase)/[A-Za-z0-9\-_%.]+)",
+                 "https://www.linkedin.com/", []),
+    "youtube": (r"(?:[a-z0-9-]+\.)*(?:youtube\.com|youtu\.be)",
+                r"/(@[A-Za-z0-9._\-]+|(?:channel|c|user)/[A-Za-z0-9_\-]+)", "https://www.youtube.com/", []),
+    "tiktok": (r"(?:[a-z0-9-]+\.)*tiktok\.com", r"/@([A-Za-z0-9._]{2,24})", "https://www.tiktok.com/@", []),
+}
+
+# Platforms whose handles are not case-sensitive
+CASELESS_HANDLES = {"facebook", "instagram", "twitter", "tiktok"}
+
+# Separators of the ways emails are stored: lists, "; "-joined, stringified lists
+EMAIL_SEPARATORS = r"(?i)mailto:|[\[\]'\";,<>()]"
+VALID_EMAIL = r"^[a-z0-9_%+-]+(?:\.[a-z0-9_%+-]+)*@(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+[a-z]{2,24}$"
+# Image and asset names that look like addresses: logo@2x.png
+ASSET_SUFFIX = r"\.(?:png|jpe?g|gif|svg|webp|bmp|ico|css|js|pdf)$"
+PLACEHOLDER_EMAIL_DOMAINS = [
+    "example.com", "example.org", "domain.com", "email.com", "yourdomain.com", "company.com", "sentry.io",
+    "sentry.wixpress.com", "sentry-next.wixpress.com", "wixpress.com", "mysite.com",
+]
+PLACEHOLDER_EMAIL_USERS = ["you", "your", "yourname", "name", "email", "user", "username", "john.doe", "example"]
+
+# Words that do not tell businesses apart
+NAME_NOISE = (
+    r"\b(?:the|and|inc|incorporated|llc|l l c|ltd|limited|co|corp|corporation|company|plc|gmbh|pllc|pc|"
+    r"llp|lp)\b"
+)
+# Street types and directions, written in full or abbreviated; the number
+# and street name tell addresses apart without them
+ADDRESS_NOISE = (
+    r"\b(?:street|st|avenue|ave|av|road|rd|boulevard|blvd|drive|dr|lane|ln|court|ct|place|pl|square|sq|"
+    r"highway|hwy|parkway|pkwy|terrace|ter|circle|cir|north|n|south|s|east|e|west|w|northeast|ne|"
+    r"northwest|nw|southeast|se|southwest|sw)\b"
+)
+# Bytes a consonant skeleton leaves out: padding, spaces and vowels
+SKIPPED_BYTES = np.zeros(256, dtype=bool)
+SKIPPED_BYTES[np.frombuffer(b"\0 aeiouy", dtype=np.uint8)] = True
+ADDRESS_UNIT = r"\b(?:suite|ste|unit|apt|fl|floor|rm|room)\s*\w+|#\s*\w+"
+ADDRESS_COUNTRY = r"\b(?:united states|usa|us|united kingdom|uk)\s*$"
+
+
+@dataclass
+class Normalized:
+    """
+    Result of `normalize`: one row per business (duplicates merged, the
+    first valid email in `email`) and one row per business email.
+    """
+    businesses: pd.DataFrame
+    emails: pd.DataFrame
+    stats: dict = field(default_factory=dict)
+
+
+def as_text(column):
+    """
+    A column as strings, with the scraper's "nothing found" values as NA.
+    """
+    text = column.astype("str").str.strip()
+    return text.mask(column.isna() | text.isin(MISSING))
+
+
+def ascii_lower(column):
+    """
+    Lowercase ASCII text of a column; only values with other characters
+    take the slower Unicode decomposition that drops their accents.
+    """
+    text = as_text(column).str.lower()
+    accented = text.str.contains(r"[^\x00-\x7f]", regex=True).fillna(False)
+    if accented.any():
+        decomposed = text[accented].str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+        text = text.mask(accented, decomposed)
+    return text
+
+
+def normalize_phones(phones, default_country_code="1"):
+    """
+    Converts free-form phone numbers to E.164. Numbers without a country
+    code get `default_country_code` (after dropping a national trunk 0);
+    numbers that are not valid after that are NA.
+    """
+    text = as_text(phones).str.replace(PHONE_EXTENSION, "", regex=True)
+    digits = text.str.replace(r"\D", "", regex=True)
+    international = text.str.startswith("+").fillna(False)
+    dialed_out = ~international & digits.str.startswith("00").fillna(False)
+    digits = digits.mask(dialed_out, digits.str.slice(2))
+    international = international | dialed_out
+
+    if default_country_code == "1":
+        national = digits.mask(digits.str.len() == 10, "1" + digits)
+        national = national.mask((digits.str.len() != 10) & (digits.str.len() != 11), pd.NA)
+        national = national.mask(~national.str.startswith("1").fillna(False), pd.NA)
+    else:
+        national = default_country_code + digits.str.replace(r"^0", "", regex=True)
+    e164 = "+" + digits.where(international, national)
+    valid = e164.str.match(E164).fillna(False)
+    valid &= ~e164.str.startswith("+1").fillna(False) | e164.str.match(NANP).fillna(False)
+    return e164.where(valid)
+
+
+def canonical_urls(urls, default_scheme="https"):
+    """
+    Canonical form of website URLs and of the bare domains Maps shows as a
+    business's website: lowercased scheme and host, no default port, no
+    trailing slash, no tracking parameters or fragment. Text that is not a
+    URL is NA. Returns the URLs and their domains (host without www.).
+    """
+    parts = as_text(urls).str.extract(URL_PARTS)
+    host = parts["host"].str.lower().str.rstrip(".")
+    valid = host.str.match(HOSTNAME).fillna(False)
+    scheme = parts["scheme"].str.lower().fillna(default_scheme)
+    valid &= scheme.isin(["http", "https"])
+    port = parts["port"].where(~parts["port"].isin(["80", "443"]))
+    query = (
+        parts["query"].str.replace(TRACKING_PARAMETER, "", regex=True).str.replace(r"^&", "", regex=True)
+    )
+    url = (
+        scheme + "://" + host
+        + (":" + port).fillna("")
+        + parts["path"].fillna("").str.replace(r"/+$", "", regex=True)
+        + ("?" + query.where(query != "")).fillna("")
+    )
+    domain = host.str.replace(r"^www\.", "", regex=True)
+    return url.where(valid), domain.where(valid)
+
+
+def social_profiles(links, platform):
+    """
+    Canonical profile URLs and handles of one platform's links. Links to
+    other hosts, share buttons and posts are NA.
+    """
+    host_pattern, path_pattern, prefix, reserved = SOCIAL_PROFILES[platform]
+    handle = as_text(links).str.extract(
+        rf"^(?:[A-Za-z]+://)?(?i:{host_pattern})(?::\d+)?{path_pattern}", expand=False
+    )
+    handle = handle.str.rstrip("/.")
+    if platform in CASELESS_HANDLES:
+        handle = handle.str.lower()
+    handle = handle.mask(handle.str.lower().isin(reserved))
+    return prefix + handle, handle
+
+
+def explode_emails(emails, index=None):
+    """
+    One row per address found in an email column (lists, "; "-joined
+    strings or stringified lists), lowercased and validated. Returns the
+    addresses with the position of their business, in a `business` column.
+    """
+    cells = emails.set_axis(index if index is not None else range(len(emails))).explode()
+    tokens = as_text(cells).str.replace(EMAIL_SEPARATORS, " ", regex=True).str.split().explode()
+    found = tokens[tokens.str.contains("@", regex=False).fillna(False)]
+    email = found.str.lower().str.strip(".")
+    frame = pd.DataFrame({"business": found.index, "email": email.to_numpy()})
+    frame = frame.drop_duplicates(["business", "email"])
+    local = frame["email"].str.replace(r"@.*$", "", regex=True)
+    frame["domain"] = frame["email"].str.replace(r"^[^@]*@", "", regex=True)
+    frame["valid"] = (
+        frame["email"].str.match(VALID_EMAIL).fillna(False)
+        & ~frame["email"].str.contains(ASSET_SUFFIX, regex=True).fillna(False)
+        & ~frame["domain"].isin(PLACEHOLDER_EMAIL_DOMAINS)
+        & ~local.isin(PLACEHOLDER_EMAIL_USERS)
+    )
+    return frame.reset_index(drop=True)
+
+
+def name_keys(names, min_skeleton=4):
+    """
+    Names reduced to what tells businesses apart: ASCII, lowercase, no
+    punctuation, legal forms or articles. Also returns their consonant
+    skeleton (no vowels, spaces or doubled letters), which absorbs typos and
+    spelling variants, where it has at least `min_skeleton` letters.
+    """
+    text = (
+        ascii_lower(names).str.replace("&", " and ", regex=False).str.replace(r"['’`]", "", regex=True)
+        .str.replace(r"[^a-z0-9]+", " ", regex=True).str.replace(NAME_NOISE, " ", regex=True)
+        .str.replace(r"\s+", " ", regex=True).str.strip()
+    )
+    text = text.where(text != "")
+    skeleton = consonant_skeletons(text)
+    return text, skeleton.where(skeleton.str.len() >= min_skeleton)
+
+
+def consonant_skeletons(text, width=32):
+    """
+    The consonants of each (ASCII) value without repeats, "joes pizza" ->
+    "jspz", computed on a matrix of bytes: the regex engine behind string
+    columns has no backreferences to collapse repeats with.
+    """
+    matrix = np.asarray(text.fillna(""), dtype=f"S{width}").view(np.uint8).reshape(len(text), width)
+    rows = np.arange(len(text))[:, None]
+
+    def compact(matrix, keep):
+        # Moves the kept bytes of every row to its front, in order
+        positions = np.cumsum(keep, axis=1, dtype=np.int16) - 1
+        compacted = np.zeros_like(matrix)
+        compacted[np.broadcast_to(rows, matrix.shape)[keep], positions[keep]] = matrix[keep]
+        return compacted
+
+    matrix = compact(matrix, ~SKIPPED_BYTES[matrix])
+    repeated = np.zeros_like(matrix, dtype=bool)
+    repeated[:, 1:] = matrix[:, 1:] == matrix[:, :-1]
+    matrix = compact(matrix, (matrix != 0) & ~repeated)
+    skeletons = pd.Series(matrix.view(f"S{width}").ravel().astype(f"U{width}"), index=text.index, dtype="str")
+    return skeletons.where(text.notna())
+
+
+def address_keys(addresses):
+    """
+    Addresses reduced for matching: no street types, directions, units,
+    punctuation or trailing country. Also returns the house number and
+    street name, which several businesses at one address share.
+    """
+    text = (
+        ascii_lower(addresses).str.replace(r"[^a-z0-9#]+", " ", regex=True)
+        .str.replace(ADDRESS_UNIT, " ", regex=True).str.replace(ADDRESS_NOISE, " ", regex=True)
+        .str.replace(ADDRESS_COUNTRY, "", regex=True).str.replace(r"\s+", " ", regex=True).str.strip()
+    )
+    text = text.where(text != "")
+    return text, text.str.extract(r"^(\d+[a-z]? \w+)", expand=False)
+
+
+def joined(*columns):
+    key = columns[0]
+    for column in columns[1:]:
+        key = key + "|" + column
+    return key
+
+
+def link_duplicates(keys, max_rounds=20):
+    """
+    Connected components of rows that share any of `keys` (Series with NA
+    where a row has no key): every row gets the smallest position of its
+    component, by propagating minimum labels through each key until stable.
+    """
+    labels = pd.Series(np.arange(len(keys[0])), index=keys[0].index)
+    for _ in range(max_rounds):
+        before = labels
+        for key in keys:
+            present = key.notna()
+            smallest = labels[present].groupby(key[present], sort=False).transform("min")
+            labels = labels.mask(present, np.minimum(labels[present], smallest))
+            labels = labels.astype(np.int64)
+        # A label can point at a row that itself moved to a smaller one
+        labels = pd.Series(labels.to_numpy()[labels.to_numpy()], index=labels.index)
+        if labels.equals(before):
+            break
+    return labels
+
+
+def normalize(frame, default_country_code="1", dedupe=True):
+    """
+    Normalizes a frame of business records (BusinessList.dataframe() or a
+    loaded dataset) and returns a Normalized result.
+    """
+    started = time.perf_counter()
+    frame = frame.reset_index(drop=True).reindex(columns=BUSINESS_FIELDS)
+    timings = {}
+
+    def timed(stage, started_stage):
+        timings[stage] = round(time.perf_counter() - started_stage, 3)
+
+    stage = time.perf_counter()
+    out = pd.DataFrame(index=frame.index)
+    out["name"] = as_text(frame["name"]).str.replace(r"\s+", " ", regex=True)
+    out["address"] = as_text(frame["address"]).str.replace(r"\s+", " ", regex=True)
+    out["phone_number"] = normalize_phones(frame["phone_number"], default_country_code)
+    timed("phones", stage)
+
+    stage = time.perf_counter()
+    out["website"], out["domain"] = canonical_urls(frame["website"])
+    timed("websites", stage)
+
+    stage = time.perf_counter()
+    for platform in SOCIAL_FIELDS:
+        out[platform], out[f"{platform}_handle"] = social_profiles(frame[platform], platform)
+    timed("socials", stage)
+
+    out["place_url"] = as_text(frame["place_url"])
+    out["place_id"] = out["place_url"].str.extract(PLACE_ID_PATTERN.pattern, expand=False)
+
+    stage = time.perf_counter()
+    emails = explode_emails(frame["email"])
+    timed("emails", stage)
+
+    stage = time.perf_counter()
+    if dedupe:
+        name, skeleton = name_keys(out["name"])
+        address, street = address_keys(out["address"])
+        labels = link_duplicates([
+            out["place_id"],
+            joined(name, address),
+            joined(skeleton, address),
+            joined(out["phone_number"], street),
+            joined(out["domain"], street),
+        ])
+    else:
+        labels = pd.Series(np.arange(len(out)), index=out.index)
+    out["duplicates"] = labels.map(labels.value_counts()) - 1
+    # The most complete record of a group first, so its fields win
+    completeness = out.notna().sum(axis=1)
+    order = np.lexsort((out.index.to_numpy(), -completeness.to_numpy()))
+    businesses = out.iloc[order].groupby(labels.iloc[order].to_numpy(), sort=True).first()
+    timed("duplicates", stage)
+
+    emails["business"] = labels.to_numpy()[emails["business"].to_numpy()]
+    emails = emails.drop_duplicates(["business", "email"]).reset_index(drop=True)
+    valid = emails[emails["valid"]]
+    businesses["email"] = valid.groupby("business")["email"].first()
+    businesses["email_count"] = valid.groupby("business").size().reindex(businesses.index, fill_value=0)
+    businesses.index.name = "business"
+
+    seconds = time.perf_counter() - started
+    stats = {
+        "rows": len(frame),
+        "businesses": len(businesses),
+        "duplicates": len(frame) - len(businesses),
+        "phones": int(out["phone_number"].notna().sum()),
+        "phones_invalid": int((as_text(frame["phone_number"]).notna() & out["phone_number"].isna()).sum()),
+        "websites": int(out["website"].notna().sum()),
+        "emails": int(emails["valid"].sum()),
+        "emails_invalid": int((~emails["valid"]).sum()),
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(len(frame) / seconds) if seconds else None,
+        "stages": timings,
+    }
+    logging.info(f"Normalized {stats['rows']} records into {stats['businesses']} businesses: {stats}")
+    return Normalized(businesses, emails, stats)
+
+
+def read_frame(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    if path.endswith(".csv"):
+        return pd.read_csv(path, dtype=str, keep_default_na=False)
+    return pd.read_json(path, lines=True, dtype=False)
+
+
+def write_frame(frame, path):
+    if path.endswith(".parquet"):
+        frame.to_parquet(path)
+    elif path.endswith(".csv"):
+        frame.to_csv(path)
+    else:
+        frame.reset_index().to_json(path, orient="records", lines=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalize and de-duplicate a dataset of scraped businesses.")
+    parser.add_argument("input", help="dataset written by a sink (.jsonl, .csv or .parquet)")
+    parser.add_argument("-o", "--output", required=True, help="normalized businesses (.jsonl, .csv or .parquet)")
+    parser.add_argument("--emails", default=None, help="also write one row per email to this path")
+    parser.add_argument("--country-code", default="1", help="country code of numbers written without one")
+    parser.add_argument("--no-dedupe", action="store_true", help="keep duplicate businesses")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s", force=True)
+    result = normalize(read_frame(args.input), args.country_code, dedupe=not args.no_dedupe)
+    write_frame(result.businesses, args.output)
+    if args.emails:
+        write_frame(result.emails, args.emails)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
 import google.generativeai as genai
 import os
 from dotenv import load_dotenv
+import logging
 import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from metrics import span
 
 load_dotenv()
 
@@ -18,16 +24,173 @@ template = (
     "6. Return the results as a tuple: (search_term, quantity)."
 )
 
-def parse_with_gemini(user_input, parse_description):
-    prompt = template.format(user_input=user_input, parse_description=parse_description)
-    try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(prompt)
+MODEL_NAME = "gemini-1.5-flash"
+
+# Leading words that do not belong in the Maps search term
+LEADING_FILLER = re.compile(
+    r"^(?:(?:please|can you|could you)\s+)?"
+    r"(?:(?:find|get|show|list|search for|search|look for|give)\s+(?:me\s+)?)?"
+    r"(?:(?:the\s+)?(?:top|best|some|all)\s+)?",
+    re.IGNORECASE,
+)
+# A quantity is a standalone number leading the query, before <what>
+LEADING_QUANTITY = re.compile(r"^(?P<quantity>\d+)\s+(?=[^\W\d_])")
+# A count is followed by the plural it counts: "10 cafes", not "2 bedroom apartments"
+PLURAL_WORD = re.compile(r"^(?:[^\W\d_]+[^\W\d_s]s|people|children|men|women)\b", re.IGNORECASE)
+# Numbers that describe the place rather than count results: "24 hour pharmacies"
+NUMBER_UNIT = re.compile(
+    r"^(?:hours?|hr|hrs|minutes?|mins?|days?|nights?|stars?|seats?|floors?|years?|months?|weeks?|miles?|km)\b",
+    re.IGNORECASE,
+)
+# "<what> in|near|around <where>"
+QUERY_SHAPE = re.compile(r"^(?P<what>[\w' &-]+?)\s+(?P<preposition>in|near|around)\s+(?P<where>[\w' ,.-]+?)[.?!]*$", re.IGNORECASE)
+# Words that usually mean the query carries details the model should strip
+DETAIL_WORDS = re.compile(r"\b(?:that|which|with|who|open|cheap|rated|reviews?|under|between|and|or)\b", re.IGNORECASE)
+
+
+def normalize_input(user_input):
+    return " ".join(user_input.lower().split()).strip(" .?!")
+
+
+def parse_locally(user_input):
+    """
+    Deterministic parse of the common "N things in place" shapes.
+    Returns (search_term, quantity, confidence); confidence is 0 when the
+    input does not have a recognised shape, or has a number that is not a
+    leading quantity of at least 1 followed by a plural (a zip code, street
+    number, "24 hour" or "2 bedroom"), since only the model can tell what
+    such numbers belong to.
+    """
+    search_term = LEADING_FILLER.sub("", " ".join(user_input.split()).strip(" .?!"))
+    quantity = 999
+    match = LEADING_QUANTITY.match(search_term)
+    if match and not NUMBER_UNIT.match(search_term[match.end():]):
+        quantity = int(match.group("quantity"))
+        search_term = search_term[match.end():]
+        if quantity < 1 or not PLURAL_WORD.match(search_term):
+            return search_term, 999, 0.0
+    if re.search(r"\d", search_term):
+        return search_term, 999, 0.0
+    match = QUERY_SHAPE.match(search_term)
+    if not match:
+        return search_term, quantity, 0.0
+
+    what, where = match.group("what").strip(), match.group("where").strip(" ,")
+    confidence = 0.95
+    # Details trail the place as often as they lead it: "pizza in Brooklyn that deliver"
+    if DETAIL_WORDS.search(what) or DETAIL_WORDS.search(where) or len(what.split()) > 4 or len(where.split()) > 5:
+        confidence -= 0.3
+    return f"{what} {match.group('preposition').lower()} {where}", quantity, confidence
+
+
+class QueryParser:
+    """
+    Layered query understanding: a local parser for confident matches, then a
+    memo of earlier model parses, and the model only for what remains. The
+    model client is created once and reused; pass `model` to use a stub.
+    The memo and counters are shared by the threads of the Flask views.
+
+    `resolved_by` counts which layer answered each query.
+    """
+
+    def __init__(self, model=None, min_confidence=0.8, memo_size=1024, memo_ttl=24 * 3600):
+        self._model = model
+        self.min_confidence = min_confidence
+        self.memo_size = memo_size
+        self.memo_ttl = memo_ttl
+        self._memo = OrderedDict()
+        self.resolved_by = Counter()
+        self.model_seconds = 0.0
+        self.fast_path_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = genai.GenerativeModel(MODEL_NAME)
+        return self._model
+
+    def _memo_get(self, key):
+        with self._lock:
+            entry = self._memo.get(key)
+            if entry is None:
+                return None
+            result, stored_at = entry
+            if time.monotonic() - stored_at > self.memo_ttl:
+                del self._memo[key]
+                return None
+            self._memo.move_to_end(key)
+            return result
+
+    def _memo_put(self, key, result):
+        with self._lock:
+            self._memo[key] = (result, time.monotonic())
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+    def parse_with_model(self, user_input, parse_description):
+        prompt = template.format(user_input=user_input, parse_description=parse_description)
+        with span("llm_call", purpose="parse"):
+            response = self.model.generate_content(prompt)
         if response.candidates and len(response.candidates) > 0:
             extracted_data = ''.join(part.text for part in response.candidates[0].content.parts).strip()
         else:
             extracted_data = ""
-        search_term, quantity = extract_search_and_quantity(extracted_data)
+        return extract_search_and_quantity(extracted_data)
+
+    def parse(self, user_input, parse_description=""):
+        start = time.perf_counter()
+        search_term, quantity, confidence = parse_locally(user_input)
+        if confidence >= self.min_confidence:
+            with self._lock:
+                self.resolved_by["local"] += 1
+                self.fast_path_seconds += time.perf_counter() - start
+            return search_term, quantity
+
+        key = normalize_input(user_input)
+        result = self._memo_get(key)
+        if result is not None:
+            with self._lock:
+                self.resolved_by["memo"] += 1
+                self.fast_path_seconds += time.perf_counter() - start
+            return result
+
+        result = self.parse_with_model(user_input, parse_description)
+        with self._lock:
+            self.resolved_by["model"] += 1
+            self.model_seconds += time.perf_counter() - start
+        self._memo_put(key, result)
+        return result
+
+    def report(self):
+        """
+        Share of queries resolved by each layer, and the model latency saved
+        by the local parser and memo (estimated from the mean model call).
+        """
+        with self._lock:
+            resolved_by = dict(self.resolved_by)
+            model_seconds = self.model_seconds
+            fast_path_seconds = self.fast_path_seconds
+        total = sum(resolved_by.values())
+        model_calls = resolved_by.get("model", 0)
+        fast_calls = total - model_calls
+        mean_model_seconds = model_seconds / model_calls if model_calls else 0.0
+        return {
+            "queries": total,
+            "share": {layer: count / total for layer, count in resolved_by.items()} if total else {},
+            "mean_model_seconds": mean_model_seconds,
+            "seconds_saved": max(0.0, fast_calls * mean_model_seconds - fast_path_seconds),
+        }
+
+
+query_parser = QueryParser()
+
+
+def parse_with_gemini(user_input, parse_description):
+    try:
+        search_term, quantity = query_parser.parse(user_input, parse_description)
+        logging.debug(f"Query parser report: {query_parser.report()}")
         return search_term, quantity
     except Exception as e:
         return f"Error: {e}"
@@ -0,0 +1,253 @@
+from playwright.async_api import async_playwright, TimeoutError, BrowserContext, Page
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+import asyncio
+import logging
+import os
+import threading
+
+from blocking import ENRICHMENT_PROFILE, MAPS_PROFILE, install_blocking, unblocked
+from metrics import span
+
+
+MAPS_URL = "https://www.google.com/maps"
+CONSENT_BUTTON = "form[action='https://consent.google.com/save'] button"
+
+
+async def accept_cookies(page):
+    with span("consent"):
+        await _accept_cookies(page)
+
+
+async def _accept_cookies(page):
+    try:
+        await page.goto(MAPS_URL, timeout=30000)
+        await page.wait_for_selector(CONSENT_BUTTON, timeout=5000)
+
+        cookies_button = page.locator(CONSENT_BUTTON)
+        if await cookies_button.count() > 0:
+            await cookies_button.first.click()
+            logging.info("Accepted cookies")
+    except TimeoutError:
+        logging.warning("Timeout while trying to accept cookies")
+
+
+@dataclass
+class PooledContext:
+    context: BrowserContext
+    page: Page
+    uses: int = 0
+
+
+class BrowserPool:
+    """
+    Keeps one Chromium instance and `size` pre-warmed contexts, each with a
+    page already on Google Maps. Consent is accepted once and its storage
+    state is saved to `storage_state_path` and reused by every context.
+
+    Contexts are handed out with `acquire`/`release` (or the `page()` context
+    manager) and recycled after `max_uses` uses or when the page's JS heap
+    grows past `max_heap_mb`.
+
+    With `block_resources`, Maps pages abort the requests of `maps_profile`
+    and business pages opened for enrichment those of `enrichment_profile`.
+    Without it both profiles only track traffic.
+
+    `context_hook`, when given, is awaited with every new context before it
+    is used (for example to add routes).
+
+    A pool belongs to the event loop it was started on. `run()` and `submit()`
+    execute coroutines on the pool's own background loop, so a pool can live
+    as long as the process and serve synchronous callers such as Flask views.
+    """
+
+    def __init__(self, size=4, headless=True, max_uses=50, max_heap_mb=512,
+                 storage_state_path="maps_storage_state.json", block_resources=True, context_hook=None):
+        self.size = size
+        self.context_hook = context_hook
+        self.maps_profile = MAPS_PROFILE if block_resources else unblocked(MAPS_PROFILE)
+        self.enrichment_profile = ENRICHMENT_PROFILE if block_resources else unblocked(ENRICHMENT_PROFILE)
+        self.headless = headless
+        self.max_uses = max_uses
+        self.max_heap_mb = max_heap_mb
+        self.storage_state_path = storage_state_path
+        self.browser = None
+        self._playwright = None
+        self._storage_state = None
+        self._idle = None
+        self._start_lock = None
+        self._acquire_many_lock = None
+        self._replacements = set()
+        self._loop = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start(self):
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            # The idle queue is only published once every context is warm
+            if self._idle is not None:
+                return
+            try:
+                self._playwright = await async_playwright().start()
+                self.browser = await self._playwright.chromium.launch(headless=self.headless)
+                self._storage_state = await self._consent_storage_state()
+                # Let every warm-up finish before tearing the browser down
+                contexts = await asyncio.gather(*(self._new_context() for _ in range(self.size)),
+                                                return_exceptions=True)
+                for result in contexts:
+                    if isinstance(result, BaseException):
+                        raise result
+            except BaseException as e:
+                logging.error(f"Browser pool failed to start: {e!r}")
+                # Leave nothing half started, so the next start() tries again
+                try:
+                    await self._stop_browser()
+                except Exception as close_error:
+                    logging.warning(f"Error closing the half-started browser: {close_error}")
+                raise
+            idle = asyncio.Queue()
+            for pooled in contexts:
+                idle.put_nowait(pooled)
+            self._idle = idle
+            logging.info(f"Browser pool started with {self.size} contexts")
+
+    async def close(self):
+        for task in list(self._replacements):
+            task.cancel()
+        await asyncio.gather(*self._replacements, return_exceptions=True)
+        await self._stop_browser()
+
+    async def _stop_browser(self):
+        self._idle = None
+        browser, self.browser = self.browser, None
+        playwright, self._playwright = self._playwright, None
+        try:
+            if browser is not None:
+                await browser.close()
+        finally:
+            if playwright is not None:
+                await playwright.stop()
+
+    async def _consent_storage_state(self):
+        """
+        Returns the saved storage state, accepting consent in a throwaway
+        context and saving the result when there is none yet.
+        """
+        if self.storage_state_path and os.path.exists(self.storage_state_path):
+            return self.storage_state_path
+        context = await self.browser.new_context()
+        try:
+            if self.context_hook is not None:
+                await self.context_hook(context)
+            page = await context.new_page()
+            await accept_cookies(page)
+            return await context.storage_state(path=self.storage_state_path or None)
+        finally:
+            await context.close()
+
+    async def _new_context(self):
+        context = await self.browser.new_context(storage_state=self._storage_state)
+        if self.context_hook is not None:
+            await self.context_hook(context)
+        page = await context.new_page()
+        await install_blocking(page, self.maps_profile)
+        await page.goto(MAPS_URL, timeout=30000)
+        consent_button = page.locator(CONSENT_BUTTON)
+        if await consent_button.count() > 0:
+            # The saved consent expired: accept it again and refresh the saved state
+            await consent_button.first.click()
+            self._storage_state = await context.storage_state(path=self.storage_state_path or None)
+            logging.info("Accepted cookies")
+        return PooledContext(context, page)
+
+    async def _heap_mb(self, pooled):
+        try:
+            used = await pooled.page.evaluate(
+                "() => performance.memory ? performance.memory.usedJSHeapSize : 0"
+            )
+            return used / (1024 * 1024)
+        except Exception:
+            return 0
+
+    async def _replace(self, pooled):
+        try:
+            await pooled.context.close()
+        except Exception as e:
+            logging.warning(f"Error closing recycled context: {e}")
+        while True:
+            try:
+                self._idle.put_nowait(await self._new_context())
+                return
+            except Exception as e:
+                logging.error(f"Error creating browser context: {e}")
+                await asyncio.sleep(1)
+
+    async def acquire(self):
+        await self.start()
+        pooled = await self._idle.get()
+        if pooled.page.is_closed():
+            await pooled.context.close()
+            pooled = await self._new_context()
+        return pooled
+
+    async def acquire_many(self, count):
+        """
+        Acquires `count` contexts as one step, so callers that each need
+        several at the same time (a search page and a detail page) cannot
+        deadlock by each holding part of what they need.
+        """
+        await self.start()
+        if self._acquire_many_lock is None:
+            self._acquire_many_lock = asyncio.Lock()
+        async with self._acquire_many_lock:
+            return [await self.acquire() for _ in range(count)]
+
+    async def release(self, pooled):
+        pooled.uses += 1
+        recycle = pooled.page.is_closed() or pooled.uses >= self.max_uses
+        if not recycle and self.max_heap_mb:
+            recycle = await self._heap_mb(pooled) > self.max_heap_mb
+        if recycle:
+            task = asyncio.create_task(self._replace(pooled))
+            self._replacements.add(task)
+            task.add_done_callback(self._replacements.discard)
+        else:
+            self._idle.put_nowait(pooled)
+
+    @asynccontextmanager
+    async def page(self):
+        """
+        Acquires a pooled context for the duration of the block and yields its page.
+        """
+        pooled = await self.acquire()
+        try:
+            yield pooled.page
+        finally:
+            await self.release(pooled)
+
+    def submit(self, coroutine):
+        """
+        Schedules a coroutine on the pool's background event loop and returns
+        a concurrent.futures.Future for its result.
+        """
+        with self._thread_lock:
+            if self._thread is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="browser-pool", daemon=True)
+                self._thread.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def run(self, coroutine):
+        """
+        Runs a coroutine on the pool's background event loop and waits for its result.
+        """
+        return self.submit(coroutine).result()
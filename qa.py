@@ -0,0 +1,400 @@
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from metrics import span
+from parse import MODEL_NAME, normalize_input
+from scraper import format_businesses, split_scraped_data
+
+
+# Fields searched by the index; each one's weight repeats its tokens
+INDEX_FIELDS = {
+    "name": 3,
+    "address": 2,
+    "website": 1,
+    "phone_number": 1,
+    "email": 1,
+    "facebook": 1,
+    "instagram": 1,
+    "twitter": 1,
+    "linkedin": 1,
+    "youtube": 1,
+    "tiktok": 1,
+}
+
+# Words too common in questions to tell records apart
+QUESTION_STOP_WORDS = {
+    "a", "an", "and", "are", "any", "at", "be", "by", "can", "do", "does", "for", "from", "give", "has",
+    "have", "how", "i", "in", "is", "it", "list", "me", "many", "of", "on", "or", "show", "that", "the",
+    "their", "them", "there", "these", "they", "this", "to", "was", "what", "which", "who", "with", "www",
+    "com", "https", "http", "business", "businesses", "place", "places", "one", "ones",
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+ANSWER_TEMPLATE = (
+    "The following is some business data, one JSON record per line "
+    "({shown} of {total} businesses, selected as the most relevant to the question):\n"
+    "{records}\n\n"
+    "Answer the following question: {question}"
+)
+
+MAP_TEMPLATE = (
+    "The following is part {part} of {parts} of some business data, one JSON record per line:\n"
+    "{records}\n\n"
+    "Answer the following question using only these records. Give counts and lists for these records only, "
+    "and say so briefly if they do not contain the answer. Question: {question}"
+)
+
+REDUCE_TEMPLATE = (
+    "These are partial answers to the question \"{question}\", each computed from a different part of "
+    "the same {total} business records:\n\n"
+    "{partials}\n\n"
+    "Combine them into one answer to the question: add up counts, merge lists without duplicates "
+    "and ignore parts that found nothing."
+)
+
+# Questions about the whole result set rather than a few matching records
+WHOLE_DATASET_QUESTION = re.compile(
+    r"\b(?:how many|count|total|all|every|average|percent(?:age)?|proportion|"
+    r"most|least|summar(?:y|ize|ise)|overall|compare)\b",
+    re.IGNORECASE,
+)
+
+# Model errors worth retrying after a pause
+RATE_LIMIT_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+)
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in QUESTION_STOP_WORDS]
+
+
+def estimate_tokens(text):
+    """
+    Rough LLM token count (about four characters per token), enough to
+    compare prompt sizes.
+    """
+    return len(text) // 4 + 1
+
+
+def present(value):
+    return value not in (None, "", "None", [])
+
+
+def record_text(business):
+    """
+    Compact JSON of a business for prompts, without empty fields.
+    """
+    record = {key: value for key, value in asdict(business).items() if present(value)}
+    return json.dumps(record, separators=(",", ":"))
+
+
+def is_rate_limited(error):
+    return isinstance(error, RATE_LIMIT_ERRORS) or "429" in str(error)
+
+
+def pack_chunks(texts, max_tokens):
+    """
+    Packs whole texts (records or partial answers) into chunks of at most
+    `max_tokens` estimated tokens; a text larger than that gets a chunk of
+    its own.
+    """
+    chunks = []
+    chunk = []
+    size = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if chunk and size + tokens > max_tokens:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+        chunk.append(text)
+        size += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def clip(text, max_tokens):
+    """
+    Cuts `text` down to at most `max_tokens` estimated tokens.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max(0, (max_tokens - 1) * 4 - 1)] + "…"
+
+
+def business_terms(business):
+    terms = []
+    for name, weight in INDEX_FIELDS.items():
+        value = getattr(business, name, None)
+        if not present(value):
+            continue
+        text = " ".join(value) if isinstance(value, list) else str(value)
+        # The field name itself is a term, so "which ones have instagram" finds the records that do
+        terms.extend((tokenize(text) + tokenize(name.replace("_", " "))) * weight)
+    return terms
+
+
+class BusinessIndex:
+    """
+    In-memory BM25 inverted index over the businesses of one result set.
+    """
+
+    def __init__(self, businesses, k1=1.2, b=0.75):
+        self.businesses = list(businesses)
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.lengths = []
+        for position, business in enumerate(self.businesses):
+            terms = Counter(business_terms(business))
+            self.lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, []).append((position, frequency))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        self.records = [record_text(business) for business in self.businesses]
+        self.digest = hashlib.sha1("\n".join(self.records).encode("utf-8")).hexdigest()
+        # The character slices the Q&A form used to send, for the savings report
+        self.sliced_chunks = split_scraped_data(format_businesses(self.businesses))
+
+    def __len__(self):
+        return len(self.businesses)
+
+    def idf(self, term):
+        matches = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.businesses) - matches + 0.5) / (matches + 0.5))
+
+    def search(self, question, k=20):
+        """
+        Returns up to `k` (score, business) pairs for the businesses matching
+        the question, best first.
+        """
+        scores = Counter()
+        for term in set(tokenize(question)):
+            idf = self.idf(term)
+            for position, frequency in self.postings.get(term, ()):
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / (self.average_length or 1))
+                scores[position] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return [(score, self.businesses[position]) for position, score in scores.most_common(k)]
+
+
+def response_text(response):
+    if response.candidates and len(response.candidates) > 0:
+        return "".join(part.text for part in response.candidates[0].content.parts).strip()
+    return ""
+
+
+class QuestionAnswerer:
+    """
+    Answers questions about a result set. Questions about a few records get
+    one prompt holding the `top_k` records most relevant to the question (at
+    most `max_prompt_tokens`). Questions about the whole set are map-reduced:
+    whole records are packed into chunks of `max_prompt_tokens`, the chunks
+    are asked concurrently (at most `concurrency` model calls at a time, with
+    backoff on rate limits) and the partial answers are merged in at most
+    `max_reduce_rounds` rounds of calls. Indexes and answers are cached per
+    result set; pass `model` to use a stub.
+
+    `stats` counts questions, index and answer cache use, model calls and
+    retries, and the prompt tokens sent against the tokens the sliced
+    prompts would have used.
+    """
+
+    def __init__(self, model=None, top_k=20, max_prompt_tokens=6000, concurrency=4, max_retries=5, backoff=1.0,
+                 max_indexes=32, max_answers=256, answer_ttl=3600, max_reduce_rounds=6):
+        self._model = model
+        self.top_k = top_k
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_reduce_rounds = max_reduce_rounds
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_indexes = max_indexes
+        self.max_answers = max_answers
+        self.answer_ttl = answer_ttl
+        self._indexes = OrderedDict()
+        self._answers = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self.stats = Counter()
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = genai.GenerativeModel(MODEL_NAME)
+        return self._model
+
+    @property
+    def executor(self):
+        # Shared by all questions, so `concurrency` caps model calls process-wide
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="qa")
+            return self._executor
+
+    def index(self, key, businesses):
+        """
+        Returns the index of a result set. `key` identifies the set (a job ID
+        and its result count), so a set that is still growing is re-indexed.
+        """
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                self.stats["index_hits"] += 1
+                return index
+        index = BusinessIndex(businesses)
+        with self._lock:
+            self._indexes[key] = index
+            self.stats["index_builds"] += 1
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _answer_get(self, key):
+        with self._lock:
+            entry = self._answers.get(key)
+            if entry is None:
+                return None
+            answer, stored_at = entry
+            if time.monotonic() - stored_at > self.answer_ttl:
+                del self._answers[key]
+                return None
+            self._answers.move_to_end(key)
+            return answer
+
+    def _answer_put(self, key, answer):
+        with self._lock:
+            self._answers[key] = (answer, time.monotonic())
+            self._answers.move_to_end(key)
+            while len(self._answers) > self.max_answers:
+                self._answers.popitem(last=False)
+
+    def generate(self, prompt, purpose):
+        """
+        One model call, retried with exponential backoff and jitter when the
+        model is rate limited.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                with span("llm_call", purpose=purpose):
+                    response = self.model.generate_content(prompt)
+                with self._lock:
+                    self.stats[f"{purpose}_calls"] += 1
+                    self.stats["prompt_tokens"] += estimate_tokens(prompt)
+                return response_text(response)
+            except Exception as e:
+                if attempt == self.max_retries or not is_rate_limited(e):
+                    raise
+                delay = self.backoff * 2 ** attempt * (0.5 + random.random())
+                with self._lock:
+                    self.stats["retries"] += 1
+                logging.warning(f"Model rate limited ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def fan_out(self, prompts, purpose):
+        if len(prompts) == 1:
+            return [self.generate(prompts[0], purpose)]
+        return list(self.executor.map(lambda prompt: self.generate(prompt, purpose), prompts))
+
+    def build_prompt(self, question, index):
+        matches = [business for _, business in index.search(question, self.top_k)]
+        if not matches:
+            # Nothing to rank by: send the first records
+            matches = index.businesses[:self.top_k]
+        lines = []
+        budget = self.max_prompt_tokens - estimate_tokens(ANSWER_TEMPLATE + question)
+        for business in matches:
+            line = record_text(business)
+            budget -= estimate_tokens(line)
+            if budget < 0 and lines:
+                break
+            lines.append(line)
+        return ANSWER_TEMPLATE.format(shown=len(lines), total=len(index), records="\n".join(lines), question=question)
+
+    def map_reduce(self, question, index):
+        budget = self.max_prompt_tokens - estimate_tokens(MAP_TEMPLATE + question)
+        chunks = pack_chunks(index.records, budget)
+        partials = self.fan_out([
+            MAP_TEMPLATE.format(part=part, parts=len(chunks), records="\n".join(chunk), question=question)
+            for part, chunk in enumerate(chunks, 1)
+        ], "map")
+        if len(partials) == 1:
+            return partials[0]
+
+        # Merge in rounds until one answer is left. Partial answers are clipped
+        # to half a prompt, so every group merges at least two of them and
+        # each round at least halves their number; the last allowed round
+        # clips them further to merge all that are left at once.
+        budget = self.max_prompt_tokens - estimate_tokens(REDUCE_TEMPLATE + question)
+        for reduce_round in range(1, self.max_reduce_rounds + 1):
+            last = reduce_round == self.max_reduce_rounds
+            share = budget // len(partials) if last else budget // 2
+            texts = [clip(f"Part {i}: {partial}", share) for i, partial in enumerate(partials, 1)]
+            groups = [texts] if last else pack_chunks(texts, budget)
+            prompts = [
+                REDUCE_TEMPLATE.format(question=question, total=len(index), partials="\n\n".join(group))
+                for group in groups
+            ]
+            partials = self.fan_out(prompts, "reduce")
+            if len(partials) == 1:
+                return partials[0]
+
+    def answer(self, question, businesses, key=None):
+        index = self.index(key if key is not None else id(businesses), businesses)
+        answer_key = (index.digest, normalize_input(question))
+        answer = self._answer_get(answer_key)
+        with self._lock:
+            self.stats["questions"] += 1
+            self.stats["baseline_prompt_tokens"] += sum(
+                estimate_tokens(f"The following is some business data:\n{chunk}\n\nAnswer the following question: {question}")
+                for chunk in index.sliced_chunks
+            )
+            if answer is not None:
+                self.stats["answer_cache_hits"] += 1
+        if answer is not None:
+            return answer
+
+        if WHOLE_DATASET_QUESTION.search(question) and len(index) > self.top_k:
+            answer = self.map_reduce(question, index)
+        else:
+            answer = self.generate(self.build_prompt(question, index), "answer")
+        self._answer_put(answer_key, answer)
+        return answer
+
+    def report(self):
+        """
+        Prompt tokens sent, what the sliced prompts would have sent, the share
+        saved and how the questions were answered.
+        """
+        sent = self.stats["prompt_tokens"]
+        baseline = self.stats["baseline_prompt_tokens"]
+        return {
+            "questions": self.stats["questions"],
+            "answer_cache_hits": self.stats["answer_cache_hits"],
+            "index_builds": self.stats["index_builds"],
+            "index_hits": self.stats["index_hits"],
+            "model_calls": {purpose: self.stats[f"{purpose}_calls"] for purpose in ("answer", "map", "reduce")},
+            "retries": self.stats["retries"],
+            "prompt_tokens": sent,
+            "baseline_prompt_tokens": baseline,
+            "prompt_tokens_saved": baseline - sent,
+            "share_saved": (baseline - sent) / baseline if baseline else 0.0,
+        }
+
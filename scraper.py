@@ -1,14 +1,31 @@
-from playwright.async_api import async_playwright, TimeoutError, Page, Locator
-from dataclasses import dataclass, asdict, field
+from playwright.async_api import Page, Locator
+from dataclasses import dataclass, asdict, field, fields
+from contextlib import aclosing, nullcontext
 import logging
-import pandas as pd
+import json
 import re
 import asyncio
-from bs4 import BeautifulSoup
+from enrich import WebsiteEnricher, apply_contacts, enrich_with_browser
+from extract import (ADDRESS_XPATH, PHONE_NUMBER_XPATH, PLACE_PANEL_XPATH, WEBSITE_URL_XPATH, WEBSITE_XPATH,
+                     PageContacts, extract_contacts)
+from pool import BrowserPool
+from blocking import log_traffic_summary, timed_goto
+from waits import log_wait_summary, wait_for_detail_panel, wait_for_feed_growth
+from metrics import counter, log_sampled, span, start_trace
+from maps_json import PLACE_EXTRACTIONS, ResponseInterceptor
+from tiling import MAPS_RESULT_CAP, TilePlanner
+from throttle import Blocked, Call, Throttle, block_reason
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+PLACE_LINK_SELECTOR = 'a[href*="https://www.google.com/maps/place"]'
+PLACE_ID_PATTERN = re.compile(r"!(?:19s|1s)(ChIJ[\w-]+|0x[0-9a-f]+:0x[0-9a-f]+)")
+# Attempts at a place page Maps blocked; the budget pauses before each retry
+MAX_BLOCKED_ATTEMPTS = 3
+PLACES_BLOCKED = counter("scraper_places_blocked_total", "Places dropped after Maps blocked every attempt")
+
 @dataclass
 class Business:
     name: str = ""
@@ -20,33 +37,93 @@ class Business:
     instagram: str = ""
     twitter: str = ""
     linkedin: str = ""
+    youtube: str = ""
+    tiktok: str = ""
+    place_url: str = ""
+
+
+class ResultList(list):
+    """
+    A list of businesses that reports every appended Business to a callback.
+    With keep=False businesses are only passed on, so memory stays bounded.
+    """
+
+    def __init__(self, on_append=None, keep=True):
+        super().__init__()
+        self.on_append = on_append
+        self.keep = keep
+
+    def append(self, business):
+        if self.keep:
+            super().append(business)
+        if self.on_append is not None:
+            self.on_append(business)
 
 
 @dataclass
 class BusinessList:
     business_list: list[Business] = field(default_factory=list)
+    # Why the scrape stopped early, when it did
+    error: str = ""
 
     def dataframe(self):
+        # pandas is only needed for post-hoc analysis
+        import pandas as pd
+
         return pd.json_normalize(
             (asdict(business) for business in self.business_list), sep="_"
         )
 
+    def normalized(self, **options):
+        """
+        The businesses as normalize.Normalized frames: E.164 phones, canonical
+        URLs and social handles, validated emails and duplicates merged.
+        """
+        from normalize import normalize
+
+        return normalize(self.dataframe(), **options)
+
+
+def business_from_record(record):
+    """
+    Rebuilds a Business from a stored record, ignoring unknown keys.
+    """
+    names = {f.name for f in fields(Business)}
+    return Business(**{key: value for key, value in record.items() if key in names})
+
+
+def place_id_from_url(url):
+    """
+    Returns a stable ID for a Maps place URL: the place ID or feature ID
+    embedded in its data parameter, or the URL without query string.
+    """
+    match = PLACE_ID_PATTERN.search(url)
+    if match:
+        return match.group(1)
+    return url.split("?", 1)[0]
+
+
+def cached_results(cache, search_term, quantity, freshness=None):
+    """
+    Returns the cached BusinessList for a query when the query and all of its
+    places are still cached (and scraped within `freshness` seconds), otherwise None.
+    """
+    place_ids = cache.get_query(search_term, quantity)
+    if place_ids is None:
+        return None
+    business_list = BusinessList()
+    for place_id in place_ids:
+        record = cache.get_place(place_id, freshness)
+        if record is None:
+            return None
+        business_list.business_list.append(business_from_record(record))
+    return business_list
+
 
 async def get_emails(page):
     try:
         content = await page.content()
-        soup = BeautifulSoup(content, "html.parser")
-        
-        # Find email pattern
-        email_pattern = r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}"
-        email_matches = re.findall(email_pattern, soup.get_text())
-        
-        # Remove duplicates by converting the list to a set and back to a list
-        email_matches = list(set(email_matches))
-        
-        if email_matches:
-            logging.info(f"Emails found: {', '.join(email_matches)}")
-        return email_matches  # Return all found email addresses without duplicates
+        return extract_contacts(content).emails  # Return all found email addresses without duplicates
     except Exception as e:
         logging.error(f"Error while extracting emails: {e}")
         return []
@@ -54,96 +131,231 @@ async def get_emails(page):
 
 async def extract_social_media_links(page: Page):
     """
-    Extracts social media links from a webpage using BeautifulSoup.
+    Extracts social media links from a webpage.
     """
-    social_media_links = {
-        "Facebook": None,
-        "Instagram": None,
-        "Twitter": None,
-        "LinkedIn": None
-    }
-    
     content = await page.content()
-    soup = BeautifulSoup(content, "html.parser")
-
-    # Look for all <a> tags with href attributes
-    for link in soup.find_all("a", href=True):
-        href = link["href"]
-        if "facebook.com" in href and social_media_links["Facebook"] is None:
-            social_media_links["Facebook"] = href
-        elif "instagram.com" in href and social_media_links["Instagram"] is None:
-            social_media_links["Instagram"] = href
-        elif "twitter.com" in href and social_media_links["Twitter"] is None:
-            social_media_links["Twitter"] = href
-        elif "linkedin.com" in href and social_media_links["LinkedIn"] is None:
-            social_media_links["LinkedIn"] = href
-
-    # If a social media platform wasn't found, set it to "None"
-    for platform in social_media_links:
-        if social_media_links[platform] is None:
-            social_media_links[platform] = "None"
-
-    logging.info(f"Social media links found: {social_media_links}")
-    return social_media_links
-
-
-async def main(search_term, quantity):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)
-        page = await browser.new_page()
+    return extract_contacts(content).social_media_links
 
-        try:
-            await accept_cookies(page)
-            business_list = BusinessList()
-
-            logging.info(f"Searching for {search_term} with quantity: {quantity}")
-            listings = await scrape_listings(page, search_term, quantity)
-                
-            if not listings:
-                logging.warning(f"No listings found for {search_term}")
-            else:
-                async for business in scrape_business_details(page, listings):
-                    business_list.business_list.append(business)
 
+async def main(search_term, quantity, workers=1, max_rate=None, cache=None, pool=None, on_business=None,
+               keep_results=True, use_payloads=True, bounds=None, checkpoint=None, freshness=None, throttle=None,
+               archive=None):
+    """
+    Scrapes a query and returns a BusinessList. `on_business` is called with
+    each Business as soon as it is available; with keep_results=False the
+    returned list stays empty and businesses only go to `on_business`.
+    With `use_payloads`, places are read from the Maps responses behind the
+    results feed and only opened when a field does not decode.
+    With `bounds` (a tiling.Tile), the area is searched tile by tile so
+    queries are not limited to what a single results feed shows.
+    With a `checkpoint` (checkpoint.Checkpoint), progress is logged as it is
+    made and a rerun of the same job skips the places it already finished.
+    Cached places are reused only when scraped within `freshness` seconds.
+    `throttle` (throttle.Throttle) adapts concurrency and pacing to latency
+    and blocks; pass one shared by the runs of a process, or each run starts
+    its own with up to `workers` Maps pages at a time and at most `max_rate`
+    per second.
+    With an `archive` (archive.Archive), the place panels, Maps responses and
+    websites the run reads are archived for re-extraction.
+    A scrape that fails returns what it found before failing, with the
+    reason in the list's `error`.
+    """
+    if checkpoint is not None and checkpoint.finished:
+        logging.info(f"Job {checkpoint.job_id} already finished, serving {len(checkpoint.businesses)} businesses")
+        business_list = BusinessList(ResultList(on_business, keep_results))
+        for record in checkpoint.businesses.values():
+            business_list.business_list.append(business_from_record(record))
+        return business_list
+
+    if cache is not None:
+        business_list = cached_results(cache, search_term, quantity, freshness)
+        if business_list is not None:
+            logging.info(f"Served {search_term} with quantity {quantity} from cache")
+            cache.log_stats()
+            if on_business is not None:
+                for business in business_list.business_list:
+                    on_business(business)
             return business_list
-        except Exception as e:
-            logging.error(f"An error occurred in the main process: {e}")
-            return BusinessList()  
-        finally:
-            await browser.close()
 
-async def accept_cookies(page):
+    if pool is None:
+        # Without a long-lived pool, start one just for this run, with a
+        # context for the search page on top of the detail workers
+        async with BrowserPool(size=workers + 1, headless=False, storage_state_path=None) as run_pool:
+            return await main(search_term, quantity, workers, max_rate, cache, run_pool, on_business, keep_results,
+                              use_payloads, bounds, checkpoint, freshness, throttle, archive)
+
+    trace = start_trace(search_term, search_term=search_term, quantity=quantity, workers=workers)
+    if throttle is None:
+        throttle = Throttle(maps_concurrency=max(1, workers), max_rate=max_rate)
+    enricher = WebsiteEnricher(block_profile=pool.enrichment_profile, budget=throttle.websites, cache=cache,
+                               archive=archive)
+    business_list = BusinessList(ResultList(on_business, keep_results))
     try:
-        await page.goto("https://www.google.com/maps", timeout=30000)
-        await page.wait_for_selector("form[action='https://consent.google.com/save'] button", timeout=5000)
+        return await scrape(pool, search_term, quantity, workers, throttle, cache, enricher, business_list,
+                            use_payloads, bounds, checkpoint, freshness, archive)
+    except Exception as e:
+        logging.error(f"An error occurred in the main process: {e}")
+        # Keep whatever was scraped before the error, and say why it stopped
+        business_list.error = describe_error(e)
+        return business_list
+    finally:
+        await enricher.close()
+        if checkpoint is not None:
+            checkpoint.flush()
+        log_wait_summary()
+        log_traffic_summary()
+        throttle.log_summary()
+        if trace is not None:
+            trace.write()
+
+
+def describe_error(error):
+    """
+    Why a scrape stopped, for BusinessList.error; blocks name their reason.
+    """
+    if isinstance(error, Blocked):
+        return f"blocked by Maps ({error.reason})"
+    return str(error) or type(error).__name__
+
+
+async def scrape(pool, search_term, quantity, workers, throttle, cache, enricher, business_list, use_payloads=True,
+                 bounds=None, checkpoint=None, freshness=None, archive=None):
+
+    logging.info(f"Searching for {search_term} with quantity: {quantity}")
+    if (workers > 1 or cache is not None or pool.size > 1 or bounds is not None or checkpoint is not None
+            or archive is not None):
+        # Place URL mode: discover place URLs on the search page and open them
+        # directly across a pool of browser contexts.
+        interceptor = ResponseInterceptor(archive) if use_payloads else None
+        first_worker = None
+        if checkpoint is not None and checkpoint.discovered:
+            # An earlier run of the job went through the whole feed: reuse its
+            # places and their decoded payloads instead of searching again
+            urls = list(checkpoint.places.values())
+            if interceptor is not None:
+                interceptor.places.update(checkpoint.decoded)
+        elif bounds is not None:
+            # Tiled: several search pages cover the area, details run alongside.
+            # The search pages are acquired up front with the first detail
+            # worker, so jobs sharing the pool cannot each hold detail workers
+            # that wait for URLs from searches that wait for a context.
+            if pool.size > 1:
+                searches = max(1, min(workers, pool.size - 1))
+                first_worker, *searches = await pool.acquire_many(searches + 1)
+                urls = stream_tiled_place_urls(pool, searches, search_term, quantity, bounds, interceptor,
+                                               throttle.maps)
+            else:
+                # One context: cover the area first, then reuse it for details
+                urls = [url async for url in stream_tiled_place_urls(
+                    pool, await pool.acquire_many(1), search_term, quantity, bounds, interceptor, throttle.maps
+                )]
+        elif pool.size > 1:
+            # Pipelined: details are scraped while the feed is still scrolling
+            search, first_worker = await pool.acquire_many(2)
+            urls = stream_place_urls(pool, search, search_term, quantity, interceptor, throttle.maps)
+        else:
+            # One context: discover everything first, then reuse it for details
+            async with pool.page() as page:
+                urls = await collect_place_urls(page, search_term, quantity, interceptor, budget=throttle.maps)
 
-        cookies_button = page.locator("form[action='https://consent.google.com/save'] button")
-        if await cookies_button.count() > 0:
-            await cookies_button.first.click()
-            logging.info("Accepted cookies")
-    except TimeoutError:
-        logging.warning("Timeout while trying to accept cookies")
+        place_ids = []
+        cached_places = []
+        resumed_places = []
+        # The error that cut discovery short, if one did
+        discovery_errors = []
+
+        async def uncached(urls):
+            try:
+                async with aclosing(as_async_iter(urls)) as items:
+                    async for url in items:
+                        place_id = place_id_from_url(url)
+                        place_ids.append(place_id)
+                        if checkpoint is not None:
+                            checkpoint.add_place(place_id, url, interceptor.get(place_id) if interceptor else None)
+                            record = checkpoint.businesses.get(place_id)
+                            if record is not None:
+                                resumed_places.append(place_id)
+                                business_list.business_list.append(business_from_record(record))
+                                continue
+                        record = cache.get_place(place_id, freshness) if cache is not None else None
+                        if record is not None:
+                            cached_places.append(place_id)
+                            business_list.business_list.append(business_from_record(record))
+                            if checkpoint is not None:
+                                checkpoint.add_business(place_id, record)
+                        else:
+                            yield url
+            except Exception as e:
+                # Scrape the places found so far, but leave the job unfinished
+                discovery_errors.append(e)
+                return
+            # An empty feed may be a silent block: let a rerun search again
+            if checkpoint is not None and place_ids:
+                checkpoint.finish_discovery()
+
+        async for business in scrape_place_urls(pool, uncached(urls), workers, enricher=enricher,
+                                                first_worker=first_worker, interceptor=interceptor,
+                                                checkpoint=checkpoint, throttle=throttle, archive=archive):
+            business_list.business_list.append(business)
+            place_id = place_id_from_url(business.place_url)
+            if cache is not None:
+                cache.put_place(place_id, asdict(business))
+            if checkpoint is not None:
+                checkpoint.add_business(place_id, asdict(business))
+
+        if discovery_errors:
+            error = discovery_errors[0]
+            business_list.error = f"Place discovery failed: {describe_error(error)}"
+        elif checkpoint is not None and checkpoint.discovered and place_ids and all(
+            place_id in checkpoint.businesses for place_id in place_ids
+        ):
+            checkpoint.finish()
+        if not place_ids:
+            logging.warning(f"No listings found for {search_term}")
+            return business_list
+        if resumed_places:
+            logging.info(f"{len(resumed_places)} of {len(place_ids)} places already finished by job {checkpoint.job_id}")
+        if cached_places:
+            logging.info(f"{len(cached_places)} of {len(place_ids)} places served from cache")
+        if cache is not None:
+            # A place list cut short by an error would be served until it expired
+            if not discovery_errors:
+                cache.put_query(search_term, quantity, place_ids)
+            cache.log_stats()
+        return business_list
+
+    async with pool.page() as page:
+        listings = await scrape_listings(page, search_term, quantity)
+
+        if not listings:
+            logging.warning(f"No listings found for {search_term}")
+        else:
+            async for business in scrape_business_details(page, listings, enricher):
+                business_list.business_list.append(business)
+
+    return business_list
 
 async def scrape_listings(page, search_for, total):
     try:
-        await page.locator('//input[@id="searchboxinput"]').fill(search_for)
-        await page.keyboard.press("Enter")
-        await page.wait_for_selector('a[href*="https://www.google.com/maps/place"]', timeout=10000)
+        with span("search_submit"):
+            await page.locator('//input[@id="searchboxinput"]').fill(search_for)
+            await page.keyboard.press("Enter")
+            await page.wait_for_selector(PLACE_LINK_SELECTOR, timeout=10000)
         await page.hover('//a[contains(@href, "https://www.google.com/maps/place")]')
 
         previously_counted = 0
         while True:
-            await page.mouse.wheel(0, 10000)
-            await page.wait_for_timeout(2000)
-
-            current_count = await page.locator('a[href*="https://www.google.com/maps/place"]').count()
+            with span("scroll", count=previously_counted):
+                await page.mouse.wheel(0, 10000)
+                await wait_for_feed_growth(page, PLACE_LINK_SELECTOR, previously_counted)
+                current_count = await page.locator(PLACE_LINK_SELECTOR).count()
             if current_count >= total:
-                listings = await page.locator('a[href*="https://www.google.com/maps/place"]').all()
+                listings = await page.locator(PLACE_LINK_SELECTOR).all()
                 listings = listings[:total]  
                 logging.info(f"Total Scraped: {len(listings)}")
                 return listings
             elif current_count == previously_counted:
-                listings = await page.locator('a[href*="https://www.google.com/maps/place"]').all()
+                listings = await page.locator(PLACE_LINK_SELECTOR).all()
                 logging.info(f"Arrived at all available\nTotal Scraped: {len(listings)}")
                 return listings
             else:
@@ -153,76 +365,408 @@ async def scrape_listings(page, search_for, total):
         logging.error(f"Error scraping listings: {e}")
         return []
 
-async def scrape_business_details(page, listings):
+async def scrape_business_details(page, listings, enricher=None):
     for listing in listings:
         try:
             if listing is None:
                 logging.warning("Encountered a NoneType listing. Skipping.")
                 continue
 
-            await listing.click()
-            await page.wait_for_timeout(2000)  
-            business = await extract_business_info(page, listing)
+            name = await listing.get_attribute("aria-label")
+            with span("listing_click", name=name):
+                await listing.click()
+                await wait_for_detail_panel(page, name)
+            business = await extract_business_info(page, listing, enricher)
             if business:
-                logging.info(f"Extracted business data: {asdict(business)}")
+                log_sampled(lambda: f"Extracted business data: {asdict(business)}")
                 yield business  
         except Exception as e:
             logging.error(f"Error occurred while scraping business details: {e}")
 
-async def extract_business_info(page: Page, listing: Locator):
+async def discover_place_urls(page, search_for, total, interceptor=None, url=None, budget=None):
     """
-    Extract business information from a listing and detailed page.
+    Searches and scrolls the results feed, yielding each new, de-duplicated
+    place URL as soon as a scroll reveals it, until `total` are found or the
+    feed stops growing. Only the URLs are kept, never the listing locators.
+    With an `interceptor`, the Maps responses behind the feed are decoded
+    before their links are yielded. With `url` (a Maps search URL), the search
+    is opened from it instead of typed into the search box. The search is
+    made in a slot of the Maps `budget`, which learns of blocks and empty feeds.
+    Errors, Blocked included, are logged and raised to the caller.
     """
-    name_attribute = 'aria-label'
-    address_xpath = '//button[@data-item-id="address"]//div[contains(@class, "fontBodyMedium")]'
-    website_xpath = '//a[@data-item-id="authority"]//div[contains(@class, "fontBodyMedium")]'
-    phone_number_xpath = '//button[contains(@data-item-id, "phone:tel:")]//div[contains(@class, "fontBodyMedium")]'
-    website_url_xpath = '//a[@data-item-id="authority"]'
+    seen = set()
+    if interceptor is not None:
+        interceptor.attach(page)
+    try:
+        async with budget.slot() if budget is not None else nullcontext(Call()) as call:
+            with span("search_submit"):
+                if url is not None:
+                    response = await timed_goto(page, url)
+                    reason = block_reason(page.url, response.status if response else None)
+                else:
+                    reason = block_reason(page.url)
+                    if reason is None:
+                        await page.locator('//input[@id="searchboxinput"]').fill(search_for)
+                        await page.keyboard.press("Enter")
+                if reason is not None:
+                    raise Blocked(reason)
+                try:
+                    await page.wait_for_selector(PLACE_LINK_SELECTOR, timeout=10000)
+                except PlaywrightTimeoutError:
+                    reason = block_reason(page.url, text=await page.content())
+                    if reason is not None:
+                        raise Blocked(reason)
+                    if url is None:
+                        # Typed queries rarely have no results at all when
+                        # Maps is not throttling; map tiles often do
+                        call.outcome = "empty"
+                    logging.warning(f"No results for {search_for}")
+                    return
+        await page.hover('//a[contains(@href, "https://www.google.com/maps/place")]')
 
+        counted = 0
+        scrolled = False
+        while True:
+            if interceptor is not None:
+                await interceptor.settle()
+            # Only read the links added since the last scroll
+            hrefs = await page.eval_on_selector_all(
+                PLACE_LINK_SELECTOR, "(links, start) => links.slice(start).map(link => link.href)", counted
+            )
+            counted += len(hrefs)
+            for href in hrefs:
+                if href and href not in seen:
+                    seen.add(href)
+                    yield href
+                    if len(seen) >= total:
+                        logging.info(f"Total Scraped: {len(seen)}")
+                        return
+            if scrolled and not hrefs:
+                logging.info(f"Arrived at all available\nTotal Scraped: {len(seen)}")
+                return
+            logging.info(f"Currently Scraped: {len(seen)}")
+
+            with span("scroll", count=counted):
+                await page.mouse.wheel(0, 10000)
+                await wait_for_feed_growth(page, PLACE_LINK_SELECTOR, counted)
+            scrolled = True
+    except Blocked as e:
+        logging.error(f"Maps blocked the search for {search_for}: {e.reason}")
+        raise
+    except Exception as e:
+        logging.error(f"Error scraping listings: {e}")
+        raise
+    finally:
+        if interceptor is not None:
+            interceptor.detach(page)
+
+
+async def collect_place_urls(page, search_for, total, interceptor=None, url=None, budget=None):
+    """
+    Returns all the place URLs `discover_place_urls` finds.
+    """
+    urls = [found async for found in discover_place_urls(page, search_for, total, interceptor, url, budget)]
+    logging.info(f"Collected {len(urls)} place URLs")
+    return urls
 
-    business = Business()
 
+async def stream_place_urls(pool, pooled, search_for, total, interceptor=None, budget=None):
+    """
+    Yields place URLs discovered on the page of the pooled context `pooled`
+    and returns the context to the pool when discovery ends.
+    """
     try:
-        business.name = await listing.get_attribute(name_attribute) or ""
-        if not business.name:
-            logging.warning("Name not found for the business.")
+        async with aclosing(discover_place_urls(pooled.page, search_for, total, interceptor, budget=budget)) as urls:
+            async for url in urls:
+                yield url
+    finally:
+        await pool.release(pooled)
 
-        address_locator = page.locator(address_xpath)
-        website_locator = page.locator(website_xpath)
-        phone_number_locator = page.locator(phone_number_xpath)
-        website_url_locator = page.locator(website_url_xpath)
 
-        business.address = (
-            await address_locator.inner_text() if await address_locator.count() > 0 else ""
-        )
-        business.website = (
-            await website_locator.inner_text() if await website_locator.count() > 0 else ""
-        )
-        business.phone_number = (
-            await phone_number_locator.inner_text() if await phone_number_locator.count() > 0 else ""
+async def stream_tiled_place_urls(pool, searches, search_for, total, bounds, interceptor=None, budget=None,
+                                  cap=MAPS_RESULT_CAP):
+    """
+    Yields de-duplicated place URLs found by searching `bounds` tile by tile,
+    refining the tiles whose feed reached the result cap. Tiles are searched
+    on the already acquired pooled contexts `searches`, one at a time on
+    each, so tiling never waits on the pool for a search page; they are
+    returned to the pool when tiling ends. When tiles failed and fewer than
+    `total` places were found, the first tile error is raised at the end.
+    """
+    planner = TilePlanner(bounds, cap=cap, limit=total)
+    idle = asyncio.Queue()
+    for pooled in searches:
+        idle.put_nowait(pooled)
+
+    async def search_tile(tile):
+        pooled = await idle.get()
+        try:
+            return await collect_place_urls(pooled.page, search_for, cap, interceptor, tile.maps_url(search_for),
+                                            budget)
+        finally:
+            idle.put_nowait(pooled)
+
+    try:
+        async with aclosing(planner.run(search_tile, key=place_id_from_url, concurrency=len(searches))) as urls:
+            async for url in urls:
+                yield url
+        logging.info(f"Tiling report for {search_for}: {planner.report()}")
+        if planner.errors and planner.stats["unique"] < total:
+            # Part of the area went unsearched before enough places were found
+            raise planner.errors[0]
+    finally:
+        for pooled in searches:
+            await pool.release(pooled)
+
+
+async def as_async_iter(items):
+    """
+    Iterates a list or an async generator; the generator is closed when this
+    one is, so stages holding browser contexts release them on cancellation.
+    """
+    if hasattr(items, "__aiter__"):
+        async with aclosing(items):
+            async for item in items:
+                yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def scrape_place_url(page: Page, url, enricher=None, decoded=None, on_detail=None, budget=None, archive=None):
+    """
+    Extract the details of a place. A place fully decoded from a Maps payload
+    (`decoded`) only needs its website enriched; otherwise the place URL is
+    opened and the fields `decoded` lacks are read from the place panel.
+    `on_detail(business, website_url)` is called before the website is enriched.
+    The page is opened in a slot of the Maps `budget`; Blocked is raised when
+    Maps answers with a consent or "unusual traffic" page instead. The HTML
+    of an opened panel goes to `archive` (archive.Archive) when given.
+    """
+    if decoded is not None and not decoded.undecoded:
+        business = Business(
+            name=decoded.name,
+            address=decoded.address or "",
+            website=decoded.website or "",
+            phone_number=decoded.phone_number or "",
+            place_url=url,
         )
+        if decoded.website_url:
+            if on_detail is not None:
+                on_detail(business, decoded.website_url)
+            await enrich_business(business, decoded.website_url, page.context, enricher)
+        else:
+            business.website = None
+        PLACE_EXTRACTIONS.inc(source="payload")
+        return business
+
+    async with budget.slot() if budget is not None else nullcontext():
+        with span("place_open", url=url):
+            response = await timed_goto(page, url)
+            reason = block_reason(page.url, response.status if response else None)
+            if reason is not None:
+                raise Blocked(reason)
+            await page.wait_for_selector(PLACE_PANEL_XPATH, timeout=10000)
+            await wait_for_detail_panel(page)
+    if archive is not None:
+        panel = await page.locator(PLACE_PANEL_XPATH).first.evaluate("element => element.outerHTML")
+        archive.add("panel", place_id_from_url(url), url, panel)
+
+    def detailed(business, website_url):
+        business.place_url = url
+        on_detail(business, website_url)
+
+    business = await extract_business_info(page, enricher=enricher, decoded=decoded,
+                                           on_detail=detailed if on_detail is not None else None)
+    if business:
+        business.place_url = url
+        PLACE_EXTRACTIONS.inc(source="dom" if decoded is None else "payload_and_dom")
+    return business
 
-        if await website_url_locator.count() > 0:
+
+async def scrape_place_urls(pool, urls, workers=4, max_rate=None, enricher=None, first_worker=None, queue_size=None,
+                            interceptor=None, checkpoint=None, throttle=None, archive=None):
+    """
+    Detail stage of the place URL mode: spread place URLs over `workers`
+    contexts of the browser pool and yield businesses as they finish.
+    `urls` is a list or an async iterable, consumed through a queue of
+    `queue_size` (default twice the workers) so discovery cannot run far
+    ahead. Place pages open in slots of the Maps budget of `throttle`
+    (by default one capped at `max_rate` pages per second); a blocked place
+    is retried after the budget's pause and dropped after
+    MAX_BLOCKED_ATTEMPTS. `first_worker` is an already acquired pooled
+    context for the first worker. Places the `interceptor` decoded are not
+    opened, places the `checkpoint` has details for are only enriched, and
+    every place is recorded in the `archive`.
+    """
+    if isinstance(urls, list):
+        if not urls:
+            return
+        workers = min(workers, len(urls))
+    workers = max(1, workers)
+
+    queue = asyncio.Queue(maxsize=queue_size or 2 * workers)
+    results = asyncio.Queue()
+    if throttle is None:
+        throttle = Throttle(maps_concurrency=workers, max_rate=max_rate)
+    done = object()
+
+    async def produce():
+        try:
+            async with aclosing(as_async_iter(urls)) as items:
+                async for url in items:
+                    await queue.put(url)
+        except Exception as e:
+            logging.error(f"Error discovering place URLs: {e}")
+        await queue.put(done)
+
+    async def worker(pooled):
+        try:
+            pooled = pooled or await pool.acquire()
             try:
-                async with page.context.expect_page() as new_page_info:
-                    await website_url_locator.first.click()
-                new_page = await new_page_info.value
-                await new_page.wait_for_load_state("networkidle")
-
-                business.email = await get_emails(new_page)
-
-                social_media_links = await extract_social_media_links(new_page)
-                business.facebook = social_media_links.get("Facebook", "None")
-                business.instagram = social_media_links.get("Instagram", "None")
-                business.twitter = social_media_links.get("Twitter", "None")
-                business.linkedin = social_media_links.get("LinkedIn", "None")
-            except Exception as e:
-                logging.error(f"Error retrieving social media links: {e}")
-                business.facebook = business.instagram = business.twitter = business.linkedin = "None"
+                while True:
+                    url = await queue.get()
+                    if url is done:
+                        # Leave the marker for the other workers
+                        queue.put_nowait(done)
+                        break
+                    place_id = place_id_from_url(url)
+                    if archive is not None:
+                        archive.add_place(place_id, url)
+                    if checkpoint is not None and place_id in checkpoint.details:
+                        record, website_url = checkpoint.details[place_id]
+                        business = business_from_record(record)
+                        try:
+                            await enrich_business(business, website_url, pooled.page.context, enricher)
+                            await results.put(business)
+                        except Exception as e:
+                            logging.error(f"Error occurred while enriching {url}: {e}")
+                        continue
+                    decoded = interceptor.get(place_id) if interceptor is not None else None
+                    on_detail = None
+                    if checkpoint is not None:
+                        def on_detail(business, website_url, place_id=place_id):
+                            checkpoint.add_detail(place_id, asdict(business), website_url)
+                    for attempt in range(1, MAX_BLOCKED_ATTEMPTS + 1):
+                        try:
+                            business = await scrape_place_url(pooled.page, url, enricher, decoded, on_detail,
+                                                              throttle.maps, archive)
+                            if business:
+                                await results.put(business)
+                            break
+                        except Blocked as e:
+                            logging.warning(f"Maps blocked {url} ({e.reason}), attempt {attempt} of {MAX_BLOCKED_ATTEMPTS}")
+                        except Exception as e:
+                            logging.error(f"Error occurred while scraping {url}: {e}")
+                            break
+                    else:
+                        PLACES_BLOCKED.inc()
+                        logging.error(f"Dropped {url}: Maps blocked all {MAX_BLOCKED_ATTEMPTS} attempts")
             finally:
-                if new_page:
-                    await new_page.close()
+                await pool.release(pooled)
+        finally:
+            await results.put(done)
+
+    producer = asyncio.create_task(produce())
+    tasks = [asyncio.create_task(worker(first_worker if i == 0 else None)) for i in range(workers)]
+    try:
+        finished = 0
+        while finished < workers:
+            business = await results.get()
+            if business is done:
+                finished += 1
+                continue
+            log_sampled(lambda: f"Extracted business data: {asdict(business)}")
+            yield business
+    finally:
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(producer, *tasks, return_exceptions=True)
+
+
+async def enrich_business(business, website_url, context, enricher=None):
+    """
+    Fills the contact fields of `business` from its website, through
+    `enricher` or in a browser tab of `context` without one.
+    """
+    if enricher is not None:
+        await enricher.enrich(business, website_url, context)
+        return
+    try:
+        contacts = await enrich_with_browser(context, website_url)
+        apply_contacts(business, contacts)
+    except Exception as e:
+        logging.error(f"Error retrieving social media links: {e}")
+        apply_contacts(business, PageContacts())
+
+
+async def extract_business_info(page: Page, listing: Locator = None, enricher: WebsiteEnricher = None,
+                                decoded=None, on_detail=None):
+    """
+    Extract business information from a listing and detailed page.
+    Without a listing, the name is read from the open place panel.
+    Fields already decoded from a Maps payload (`decoded`) are not looked up.
+    The website is enriched through `enricher`, or in a browser tab without one;
+    `on_detail(business, website_url)` is called before it is.
+    """
+    name_attribute = 'aria-label'
+
+    def known(field):
+        return decoded is not None and field not in decoded.undecoded
+
+    business = Business()
+
+    try:
+        with span("field_lookup", field="name"):
+            if listing is not None:
+                business.name = await listing.get_attribute(name_attribute) or ""
+                business.place_url = await listing.get_attribute("href") or ""
+            elif decoded is not None:
+                business.name = decoded.name
+            else:
+                place_panel = page.locator(PLACE_PANEL_XPATH)
+                business.name = (
+                    await place_panel.first.get_attribute(name_attribute) if await place_panel.count() > 0 else ""
+                ) or ""
+        if not business.name:
+            logging.warning("Name not found for the business.")
 
+        address_locator = page.locator(ADDRESS_XPATH)
+        website_locator = page.locator(WEBSITE_XPATH)
+        phone_number_locator = page.locator(PHONE_NUMBER_XPATH)
+        website_url_locator = page.locator(WEBSITE_URL_XPATH)
+
+        if known("address"):
+            business.address = decoded.address or ""
+        else:
+            with span("field_lookup", field="address"):
+                business.address = (
+                    await address_locator.inner_text() if await address_locator.count() > 0 else ""
+                )
+        if known("website"):
+            business.website = decoded.website or ""
+            website_url = decoded.website_url
+        else:
+            with span("field_lookup", field="website"):
+                business.website = (
+                    await website_locator.inner_text() if await website_locator.count() > 0 else ""
+                )
+                website_url = (
+                    await website_url_locator.first.get_attribute("href") if await website_url_locator.count() > 0 else None
+                )
+        if known("phone_number"):
+            business.phone_number = decoded.phone_number or ""
+        else:
+            with span("field_lookup", field="phone_number"):
+                business.phone_number = (
+                    await phone_number_locator.inner_text() if await phone_number_locator.count() > 0 else ""
+                )
+
+        if website_url:
+            if on_detail is not None:
+                on_detail(business, website_url)
+            await enrich_business(business, website_url, page.context, enricher)
         else:
             business.website = None
 
@@ -233,6 +777,13 @@ async def extract_business_info(page: Page, listing: Locator):
     return business
 
 
+def format_businesses(businesses):
+    """
+    Renders businesses as one JSON record per line, the text the Q&A form reads.
+    """
+    return "\n".join(json.dumps(asdict(business)) for business in businesses)
+
+
 def split_scraped_data(scraped_data, max_length=6000):
 
     return [
@@ -240,7 +791,27 @@ def split_scraped_data(scraped_data, max_length=6000):
         for i in range(0, len(scraped_data), max_length)
     ]
 
-def get_google_maps_results(search_term, quantity):
-    # Use asyncio.run to create a new event loop for the async function
-    asyncio.run(main(search_term, quantity))
+def get_google_maps_results(search_term, quantity, workers=1, max_rate=None, cache=None, pool=None, output=None):
+    """
+    Runs a scrape to completion. With `output` (a .jsonl, .csv or .parquet
+    path) each business is written as it is scraped instead of kept in memory.
+    Returns a message saying whether the scrape completed or why it failed.
+    """
+    from sinks import open_sink
+
+    sink = open_sink(output) if output else None
+    on_business = sink.write if sink else None
+    run = main(search_term, quantity, workers, max_rate, cache, pool, on_business, keep_results=sink is None)
+    try:
+        if pool is not None:
+            # A long-lived pool runs on its own event loop
+            business_list = pool.run(run)
+        else:
+            # Use asyncio.run to create a new event loop for the async function
+            business_list = asyncio.run(run)
+    finally:
+        if sink:
+            sink.close()
+    if business_list.error:
+        return f"Search for '{search_term}' with quantity {quantity} failed: {business_list.error}"
     return f"Search for '{search_term}' with quantity {quantity} has been completed successfully."
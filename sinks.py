@@ -0,0 +1,177 @@
+from dataclasses import asdict, fields
+import csv
+import json
+import logging
+import os
+import time
+
+from scraper import Business
+
+
+BUSINESS_FIELDS = [f.name for f in fields(Business)]
+
+
+def flat_record(business):
+    """
+    Returns a Business as a dict of strings, with lists of emails joined by "; ".
+    """
+    record = asdict(business)
+    for key, value in record.items():
+        if isinstance(value, (list, tuple)):
+            record[key] = "; ".join(value)
+        elif value is None:
+            record[key] = ""
+    return record
+
+
+class Sink:
+    """
+    Writes businesses one at a time as they are scraped. Subclasses implement
+    `_write` and may override `flush` and `close`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, business):
+        self._write(business)
+        self.count += 1
+
+    def _write(self, business):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+        logging.info(f"Wrote {self.count} businesses to {self.path}")
+
+
+class AppendingFileSink(Sink):
+    """
+    Appends to a text file (or, with append=False, replaces it) and fsyncs
+    it every `fsync_every` records or `fsync_interval` seconds, so a crash
+    loses at most that much.
+    """
+
+    def __init__(self, path, fsync_every=100, fsync_interval=5.0, append=True):
+        super().__init__(path)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._file = open(path, "a" if append else "w", encoding="utf-8", newline="")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def write(self, business):
+        super().write(business)
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.flush()
+
+    def flush(self):
+        if self._file.closed:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        super().close()
+        self._file.close()
+
+
+class JsonlSink(AppendingFileSink):
+    def _write(self, business):
+        self._file.write(json.dumps(asdict(business)) + "\n")
+
+
+class CsvSink(AppendingFileSink):
+    def __init__(self, path, fsync_every=100, fsync_interval=5.0, append=True):
+        super().__init__(path, fsync_every, fsync_interval, append)
+        self._writer = csv.DictWriter(self._file, fieldnames=BUSINESS_FIELDS)
+        if self._file.tell() == 0:
+            self._writer.writeheader()
+
+    def _write(self, business):
+        self._writer.writerow(flat_record(business))
+
+
+class ParquetSink(Sink):
+    """
+    Buffers up to `row_group_size` businesses and writes each batch as one
+    Parquet row group. Requires pyarrow.
+    """
+
+    def __init__(self, path, row_group_size=10_000):
+        super().__init__(path)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self.row_group_size = row_group_size
+        self.schema = pa.schema(
+            [(name, pa.list_(pa.string()) if name == "email" else pa.string()) for name in BUSINESS_FIELDS]
+        )
+        self._writer = pq.ParquetWriter(path, self.schema)
+        self._columns = {name: [] for name in BUSINESS_FIELDS}
+        self._buffered = 0
+
+    def _write(self, business):
+        for name in BUSINESS_FIELDS:
+            value = getattr(business, name)
+            if name == "email":
+                value = [value] if isinstance(value, str) and value else list(value or [])
+            elif value is None:
+                value = ""
+            self._columns[name].append(value)
+        self._buffered += 1
+        if self._buffered >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffered or self._writer is None:
+            return
+        table = self._pa.Table.from_pydict(self._columns, schema=self.schema)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self._columns = {name: [] for name in BUSINESS_FIELDS}
+        self._buffered = 0
+
+    def close(self):
+        if self._writer is None:
+            return
+        super().close()
+        self._writer.close()
+        self._writer = None
+
+
+SINKS_BY_EXTENSION = {
+    ".jsonl": JsonlSink,
+    ".csv": CsvSink,
+    ".parquet": ParquetSink,
+}
+
+
+def open_sink(path, append=True, **options):
+    """
+    Opens the sink matching the file extension of `path` (.jsonl, .csv or .parquet).
+    JSONL and CSV sinks add to an existing file unless `append` is False;
+    Parquet files are always written anew.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINKS_BY_EXTENSION:
+        raise ValueError(f"Unsupported output format: {path}")
+    sink = SINKS_BY_EXTENSION[extension]
+    if issubclass(sink, AppendingFileSink):
+        options["append"] = append
+    return sink(path, **options)
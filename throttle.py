@@ -0,0 +1,260 @@
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import re
+import time
+
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from metrics import counter
+
+
+THROTTLE_OUTCOMES = counter("scraper_throttle_outcomes_total", "Throttled requests by budget and outcome")
+
+# Where Google sends clients it wants to slow down or re-consent
+BLOCK_URL = re.compile(r"^https://(?:consent\.google\.[a-z.]+/|(?:www\.)?google\.[a-z.]+/sorry/)")
+UNUSUAL_TRAFFIC = re.compile(r"unusual traffic|not a robot|captcha", re.IGNORECASE)
+BLOCK_STATUSES = {403, 429, 503}
+
+# Outcomes that mean the budget is spending faster than the other side allows
+CONGESTION = ("timeout", "blocked", "empty")
+
+
+class Blocked(Exception):
+    """
+    The other side refused a request: a consent redirect, an "unusual
+    traffic" page or a rate-limit status.
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def block_reason(url="", status=None, text=None):
+    """
+    Returns why a response looks like a block, or None when it does not.
+    """
+    if url.startswith("https://consent.google."):
+        return "consent"
+    if BLOCK_URL.match(url) or (text and UNUSUAL_TRAFFIC.search(text)):
+        return "unusual_traffic"
+    if status in BLOCK_STATUSES:
+        return f"status_{status}"
+    return None
+
+
+class Call:
+    """
+    Outcome of one request made in a Budget slot. Exceptions set it; callers
+    can also set "blocked" or "empty" for responses that only look wrong.
+    """
+
+    def __init__(self):
+        self.outcome = "ok"
+
+
+class Budget:
+    """
+    AIMD concurrency and pacing for one kind of traffic.
+
+    Up to `limit` requests run at a time and their starts are spaced by the
+    smoothed latency divided by `limit`, so a full window is spread over one
+    round trip instead of sent as a burst. Every successful request raises
+    the limit: by one below `threshold` and by 1/limit above it, so it probes
+    quickly up to the last level that caused trouble and slowly beyond it.
+    Timeouts, blocks, empty results and latency above `latency_factor` times
+    the fastest seen (unless `latency_factor` is None) multiply the limit by
+    `decrease` (once per round trip, since one overload fails a whole window
+    of requests) and lower the threshold to it.
+
+    Blocks usually come from a rate limit rather than from load, so a block
+    also caps the request rate at `rate_decrease` times the rate of the last
+    `rate_window` seconds. The cap then rises by `rate_step` requests per
+    second every second without trouble, and each block halves that step, so
+    the budget settles just under the rate that triggered blocking instead
+    of hitting it every few round trips (a `rate_decrease` of None turns
+    the cap off). After `rate_recovery` seconds without a block the step is
+    restored, so a long-lived budget cannot be ratcheted down for good. A block pauses the budget for `block_pause` seconds as well,
+    doubling up to `max_block_pause` while blocks continue.
+    """
+
+    def __init__(self, name, concurrency=2, min_concurrency=1, max_concurrency=16, min_interval=0.0, decrease=0.5,
+                 latency_factor=3.0, rate_decrease=0.8, rate_step=0.25, rate_window=1.0, rate_recovery=60.0,
+                 block_pause=5.0, max_block_pause=300.0):
+        self.name = name
+        self.limit = float(concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.threshold = float(max_concurrency)
+        self.min_interval = min_interval
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.rate_decrease = rate_decrease
+        self.rate_step = rate_step
+        self.initial_rate_step = rate_step
+        self.rate_window = rate_window
+        self.rate_recovery = rate_recovery
+        self.rate_cap = None
+        self.block_pause = block_pause
+        self.max_block_pause = max_block_pause
+        self.in_flight = 0
+        self.latency = None
+        self.min_latency = None
+        self.pause = block_pause
+        self.paused_until = 0.0
+        self.stats = Counter()
+        self._next_start = 0.0
+        self._starts = deque()
+        self._last_decrease = 0.0
+        self._last_block = 0.0
+        self._waiters = []
+
+    @property
+    def interval(self):
+        paced = self.latency / self.limit if self.latency else 0.0
+        capped = 1 / self.rate_cap if self.rate_cap else 0.0
+        return max(self.min_interval, paced, capped)
+
+    def recent_rate(self, now):
+        while self._starts and self._starts[0] < now - self.rate_window:
+            self._starts.popleft()
+        return len(self._starts) / self.rate_window
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+        try:
+            while True:
+                now = time.monotonic()
+                start = max(now, self._next_start, self.paused_until)
+                if start <= now:
+                    self._next_start = now + self.interval
+                    self._starts.append(now)
+                    return
+                await asyncio.sleep(start - now)
+        except BaseException:
+            self.in_flight -= 1
+            self._wake()
+            raise
+
+    def release(self, outcome, seconds):
+        self.in_flight -= 1
+        self.stats[outcome] += 1
+        THROTTLE_OUTCOMES.inc(budget=self.name, outcome=outcome)
+        now = time.monotonic()
+        if outcome == "ok":
+            self.latency = seconds if self.latency is None else 0.8 * self.latency + 0.2 * seconds
+            self.min_latency = seconds if self.min_latency is None else min(self.min_latency, seconds)
+            if self.latency_factor and self.latency > self.latency_factor * self.min_latency:
+                self._decrease(now, "latency")
+            else:
+                step = 1.0 if self.limit < self.threshold else 1.0 / self.limit
+                self.limit = min(float(self.max_concurrency), self.limit + step)
+                if self.rate_cap:
+                    if now - self._last_block >= self.rate_recovery:
+                        self.rate_step = self.initial_rate_step
+                    # rate_step per second: one step spread over a second of requests
+                    self.rate_cap += self.rate_step / self.rate_cap
+                self.pause = self.block_pause
+        elif outcome in CONGESTION:
+            self._decrease(now, outcome)
+            if outcome == "blocked":
+                self._last_block = now
+            if outcome == "blocked" and now >= self.paused_until:
+                rate = self.recent_rate(now)
+                if rate and self.rate_decrease:
+                    self.rate_cap = min(self.rate_cap or rate, rate) * self.rate_decrease
+                    self.rate_step /= 2
+                self.paused_until = now + self.pause
+                logging.warning(
+                    f"{self.name} budget blocked: pausing {self.pause:.0f}s, "
+                    f"concurrency {self.limit:.1f}, rate capped at {self.rate_cap or 0:.1f}/s"
+                )
+                self.pause = min(self.max_block_pause, self.pause * 2)
+        self._wake()
+
+    def _decrease(self, now, reason):
+        # One overload fails every request in flight; count it once per round trip
+        if now - self._last_decrease < (self.latency or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_concurrency), self.limit * self.decrease)
+        self.threshold = self.limit
+        self.stats[f"decrease_{reason}"] += 1
+        logging.info(f"{self.name} budget: {reason}, concurrency down to {self.limit:.1f}")
+
+    def _wake(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Waits for a request slot and records how the request in it went.
+        """
+        await self.acquire()
+        call = Call()
+        started = time.monotonic()
+        try:
+            yield call
+        except Blocked:
+            call.outcome = "blocked"
+            raise
+        except (asyncio.TimeoutError, PlaywrightTimeoutError):
+            call.outcome = "timeout"
+            raise
+        except asyncio.CancelledError:
+            call.outcome = "cancelled"
+            raise
+        except Exception:
+            if call.outcome == "ok":
+                call.outcome = "error"
+            raise
+        finally:
+            self.release(call.outcome, time.monotonic() - started)
+
+    def report(self):
+        return {
+            "concurrency": round(self.limit, 2),
+            "threshold": round(self.threshold, 2),
+            "interval": round(self.interval, 3),
+            "rate_cap": round(self.rate_cap, 2) if self.rate_cap else None,
+            "latency": round(self.latency, 3) if self.latency else None,
+            "outcomes": dict(self.stats),
+        }
+
+
+class Throttle:
+    """
+    Separate budgets for Google Maps and for the third-party business
+    websites, so blocks on one side do not slow the other down. `max_rate`
+    caps Maps requests per second whatever the controller decides. Website
+    latency depends on the site more than on load, so only errors and
+    blocks slow that budget down; the enricher only reports rate limits as
+    blocks, since one site refusing us says nothing about the others.
+    """
+
+    def __init__(self, maps_concurrency=4, website_concurrency=16, max_rate=None, block_pause=5.0):
+        self.maps = Budget("maps", concurrency=min(2, maps_concurrency), max_concurrency=maps_concurrency,
+                           min_interval=1 / max_rate if max_rate else 0.0, block_pause=block_pause)
+        self.websites = Budget("websites", concurrency=min(4, website_concurrency),
+                               max_concurrency=website_concurrency, block_pause=2.0, max_block_pause=60.0,
+                               latency_factor=None)
+
+    def report(self):
+        return {"maps": self.maps.report(), "websites": self.websites.report()}
+
+    def log_summary(self):
+        for name, report in self.report().items():
+            logging.info(f"Throttle {name}: {report}")
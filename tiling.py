@@ -0,0 +1,203 @@
+from collections import Counter, deque
+from dataclasses import dataclass
+from urllib.parse import quote_plus
+import asyncio
+import logging
+import math
+import time
+
+
+# Places a single Maps search shows before the feed ends
+MAPS_RESULT_CAP = 120
+
+# Width in pixels of the browser viewport the tile's zoom level is chosen for
+VIEWPORT_WIDTH = 1280
+
+
+@dataclass(frozen=True)
+class Tile:
+    """
+    A rectangle of the map in degrees, `depth` levels below the initial grid.
+    """
+    south: float
+    west: float
+    north: float
+    east: float
+    depth: int = 0
+
+    @property
+    def center(self):
+        return (self.south + self.north) / 2, (self.west + self.east) / 2
+
+    @property
+    def span(self):
+        return max(self.north - self.south, self.east - self.west)
+
+    @property
+    def zoom(self):
+        """
+        Maps zoom level at which the tile fills the viewport width.
+        """
+        width_degrees = max(self.east - self.west, (self.north - self.south) / math.cos(math.radians(self.center[0])))
+        zoom = math.log2(VIEWPORT_WIDTH / 256 * 360 / max(width_degrees, 1e-6))
+        return min(21.0, max(3.0, zoom))
+
+    def contains(self, lat, lng):
+        return self.south <= lat < self.north and self.west <= lng < self.east
+
+    def split(self):
+        """
+        The four quadrants of the tile, one level deeper.
+        """
+        lat, lng = self.center
+        depth = self.depth + 1
+        return [
+            Tile(self.south, self.west, lat, lng, depth),
+            Tile(self.south, lng, lat, self.east, depth),
+            Tile(lat, self.west, self.north, lng, depth),
+            Tile(lat, lng, self.north, self.east, depth),
+        ]
+
+    def maps_url(self, search_term):
+        lat, lng = self.center
+        return f"https://www.google.com/maps/search/{quote_plus(search_term)}/@{lat:.6f},{lng:.6f},{self.zoom:.2f}z"
+
+
+def parse_bounds(text):
+    """
+    Parses "south,west,north,east" in degrees into a Tile.
+    """
+    south, west, north, east = (float(part) for part in text.split(","))
+    if not all(math.isfinite(value) for value in (south, west, north, east)):
+        raise ValueError(f"Invalid bounds: {text}")
+    if not (-90 <= south < north <= 90 and -180 <= west < east <= 180):
+        raise ValueError(f"Invalid bounds: {text}")
+    return Tile(south, west, north, east)
+
+
+def grid(bounds, rows, cols):
+    """
+    Splits `bounds` into rows x cols tiles.
+    """
+    height = (bounds.north - bounds.south) / rows
+    width = (bounds.east - bounds.west) / cols
+    return [
+        Tile(bounds.south + row * height, bounds.west + col * width,
+             bounds.south + (row + 1) * height, bounds.west + (col + 1) * width)
+        for row in range(rows) for col in range(cols)
+    ]
+
+
+class TilePlanner:
+    """
+    Covers an area with Maps searches small enough to stay under the result
+    cap. Starts from a rows x cols grid; a tile whose search returns at least
+    `saturation` of `cap` results was probably cut off, so it is split into
+    quadrants and those are searched too, down to `max_depth` levels or tiles
+    of `min_span` degrees. Tiles are searched `concurrency` at a time and the
+    results are de-duplicated by `key`.
+
+    `search(tile)` is any coroutine returning the results of one tile, so
+    the planner runs as well against a synthetic density map as against Maps.
+    """
+
+    def __init__(self, bounds, rows=2, cols=2, cap=MAPS_RESULT_CAP, saturation=0.9, max_depth=8, min_span=0.002,
+                 limit=None):
+        self.bounds = bounds
+        self.rows = rows
+        self.cols = cols
+        self.cap = cap
+        self.saturation = saturation
+        self.max_depth = max_depth
+        self.min_span = min_span
+        self.limit = limit
+        self.tiles = []
+        self.stats = Counter()
+        # Errors of the tiles whose search failed
+        self.errors = []
+
+    def saturated(self, results):
+        return len(results) >= self.cap * self.saturation
+
+    def refinable(self, tile):
+        return tile.depth < self.max_depth and tile.span / 2 >= self.min_span
+
+    async def run(self, search, key=lambda result: result, concurrency=2):
+        """
+        Searches the tiles and yields each new result as its tile finishes,
+        until the area is covered or `limit` results were found.
+        """
+        pending = deque(grid(self.bounds, self.rows, self.cols))
+        running = {}
+        seen = set()
+        started = time.perf_counter()
+        try:
+            while pending or running:
+                while pending and len(running) < concurrency:
+                    tile = pending.popleft()
+                    running[asyncio.ensure_future(search(tile))] = tile
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    tile = running.pop(task)
+                    try:
+                        results = task.result()
+                    except Exception as e:
+                        logging.error(f"Error searching tile {tile}: {e}")
+                        results = []
+                        self.stats["failed"] += 1
+                        self.errors.append(e)
+
+                    new = 0
+                    for result in results:
+                        result_key = key(result)
+                        if result_key in seen:
+                            continue
+                        seen.add(result_key)
+                        new += 1
+                        yield result
+                        if self.limit is not None and len(seen) >= self.limit:
+                            self.record(tile, len(results), new, "limit")
+                            return
+
+                    if self.saturated(results) and self.refinable(tile):
+                        pending.extend(tile.split())
+                        outcome = "split"
+                    elif self.saturated(results):
+                        outcome = "capped"
+                    else:
+                        outcome = "complete"
+                    self.record(tile, len(results), new, outcome)
+                    logging.info(
+                        f"Tile {len(self.tiles)} at depth {tile.depth}: {len(results)} results, {new} new, {outcome}; "
+                        f"{len(seen)} unique in {time.perf_counter() - started:.1f}s, "
+                        f"{len(pending) + len(running)} tiles left"
+                    )
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    def record(self, tile, results, new, outcome):
+        self.tiles.append({"tile": tile, "results": results, "new": new, "outcome": outcome})
+        self.stats["tiles"] += 1
+        self.stats[outcome] += 1
+        self.stats["results"] += results
+        self.stats["unique"] += new
+
+    def report(self):
+        """
+        Tiles searched by outcome, the deepest level reached and the share of
+        results that were duplicates of neighbouring tiles.
+        """
+        results = self.stats["results"]
+        return {
+            "tiles": self.stats["tiles"],
+            "split": self.stats["split"],
+            "capped": self.stats["capped"],
+            "failed": self.stats["failed"],
+            "max_depth": max((entry["tile"].depth for entry in self.tiles), default=0),
+            "results": results,
+            "unique": self.stats["unique"],
+            "duplicate_share": (results - self.stats["unique"]) / results if results else 0.0,
+        }
@@ -0,0 +1,86 @@
+from playwright.async_api import TimeoutError
+import logging
+import time
+
+from metrics import histogram
+
+
+WAIT_SECONDS = histogram("scraper_wait_seconds", "Time spent waiting for the page to be ready")
+
+# The fixed sleeps the adaptive waits replace, to report the time saved
+FIXED_WAIT_SECONDS = {"scroll": 2.0, "detail": 2.0}
+
+END_OF_LIST_TEXT = "You've reached the end of the list"
+
+FEED_GROWTH_SCRIPT = """
+([selector, previousCount, endText]) => {
+    const count = document.querySelectorAll(selector).length;
+    if (count > previousCount) return true;
+    const feed = document.querySelector('div[role="feed"]');
+    return Boolean(document.querySelector('span.HlvSq') || (feed && feed.innerText.includes(endText)));
+}
+"""
+
+DETAIL_READY_SCRIPT = """
+(name) => {
+    const panels = document.querySelectorAll('div[role="main"][aria-label]');
+    for (const panel of panels) {
+        if (name && panel.getAttribute('aria-label') !== name) continue;
+        if (panel.querySelector('[data-item-id="address"], [data-item-id^="phone:tel:"], [data-item-id="authority"]')) {
+            return true;
+        }
+    }
+    return false;
+}
+"""
+
+
+async def timed_wait(wait, page, script, arg, timeout):
+    """
+    Waits until `script` returns true in the page, at most `timeout` ms.
+    Returns (ready, seconds waited) and records the wait in WAIT_SECONDS.
+    """
+    start = time.perf_counter()
+    try:
+        await page.wait_for_function(script, arg=arg, timeout=timeout, polling="raf")
+        ready = True
+    except TimeoutError:
+        ready = False
+    elapsed = time.perf_counter() - start
+    WAIT_SECONDS.observe(elapsed, wait=wait, outcome="ready" if ready else "timeout")
+    return ready, elapsed
+
+
+async def wait_for_feed_growth(page, selector, previous_count, timeout=5000):
+    """
+    After a scroll, returns as soon as the results feed has more than
+    `previous_count` place links or the end-of-list marker is shown.
+    Returns (ready, seconds waited).
+    """
+    return await timed_wait("scroll", page, FEED_GROWTH_SCRIPT, [selector, previous_count, END_OF_LIST_TEXT], timeout)
+
+
+async def wait_for_detail_panel(page, name=None, timeout=5000):
+    """
+    After clicking a listing, returns as soon as the place panel for `name`
+    (any place when None) has rendered its address/phone/website buttons.
+    Returns (ready, seconds waited).
+    """
+    return await timed_wait("detail", page, DETAIL_READY_SCRIPT, name, timeout)
+
+
+def log_wait_summary():
+    """
+    Logs the mean time per wait and the time saved against the fixed sleeps.
+    """
+    totals = {}
+    for labels, series in WAIT_SECONDS.series().items():
+        wait = dict(labels)["wait"]
+        count, seconds = totals.get(wait, (0, 0.0))
+        totals[wait] = (count + series["count"], seconds + series["sum"])
+    for wait, (count, seconds) in totals.items():
+        if not count:
+            continue
+        mean = seconds / count
+        saved = FIXED_WAIT_SECONDS.get(wait, 0) - mean
+        logging.info(f"{wait} wait: {count} waits, mean {mean:.3f}s, saved {saved:.3f}s per wait")